@@ -1,36 +1,47 @@
 import asyncio
 import binascii
-import itertools
 import sys
 import os
 from argparse import ArgumentParser
 from asyncio import Queue
 from pathlib import Path
-from typing import Optional, Dict, List, Callable, FrozenSet, Iterable
+from typing import Optional, Dict, List, Callable, FrozenSet, Iterable, cast
 import datetime
 import time
 import tempfile
 import base64
 
 
-import yaml
 from kubernetes.config import (
     load_kube_config,
     list_kube_config_contexts,
     load_incluster_config,
 )
 
-from appgate.client import K8SConfigMapClient
+from appgate.client import K8SConfigMapClient, K8SWatchClient
 from appgate.logger import set_level, is_debug
-from appgate.appgate import main_loop, get_current_appgate_state, start_entity_loop, log
+from appgate.appgate import (
+    main_loop,
+    get_current_appgate_state,
+    new_appgate_client,
+    start_entity_loop,
+    log,
+)
 from appgate.openapi.openapi import entity_names, generate_crd, SPEC_DIR
 from appgate.openapi.utils import join
 from appgate.state import entities_conflict_summary, resolve_appgate_state, AppgateState
-from appgate.types import AppgateEvent, OperatorArguments, Context, BUILTIN_TAGS
-from appgate.attrs import K8S_LOADER
+from appgate.types import (
+    AppgateEvent,
+    OperatorArguments,
+    Context,
+    BUILTIN_TAGS,
+    DIFF_MODES,
+    DiffMode,
+)
 from appgate.openapi.openapi import generate_api_spec
 from appgate.openapi.types import AppgateException
 from appgate.secrets import k8s_get_secret
+from appgate.validate import json_summary, junit_summary, validate_files
 
 
 APPGATE_LOG_LEVEL = "APPGATE_OPERATOR_LOG_LEVEL"
@@ -39,12 +50,19 @@ PASSWORD_ENV = "APPGATE_OPERATOR_PASSWORD"
 PROVIDER_ENV = "APPGATE_OPERATOR_PROVIDER"
 DEVICE_ID_ENV = "APPGATE_OPERATOR_DEVICE_ID"
 TIMEOUT_ENV = "APPGATE_OPERATOR_TIMEOUT"
+PARALLELISM_ENV = "APPGATE_OPERATOR_PARALLELISM"
+MAX_LATENCY_ENV = "APPGATE_OPERATOR_MAX_LATENCY"
+PAGE_SIZE_ENV = "APPGATE_OPERATOR_PAGE_SIZE"
+DIFF_MODE_ENV = "APPGATE_OPERATOR_DIFF_MODE"
+STATE_CACHE_ENV = "APPGATE_OPERATOR_STATE_CACHE"
 HOST_ENV = "APPGATE_OPERATOR_HOST"
 DRY_RUN_ENV = "APPGATE_OPERATOR_DRY_RUN"
 CLEANUP_ENV = "APPGATE_OPERATOR_CLEANUP"
 NAMESPACE_ENV = "APPGATE_OPERATOR_NAMESPACE"
 TWO_WAY_SYNC_ENV = "APPGATE_OPERATOR_TWO_WAY_SYNC"
 SPEC_DIR_ENV = "APPGATE_OPERATOR_SPEC_DIRECTORY"
+SPEC_CACHE_ENV = "APPGATE_OPERATOR_SPEC_CACHE"
+SPEC_CACHE_FILE = ".spec-cache.pickle"
 APPGATE_SECRETS_KEY = "APPGATE_OPERATOR_FERNET_KEY"
 APPGATE_MT_CONFIGMAP_ENV = "APPGATE_OPERATOR_CONFIG_MAP"
 APPGATE_SSL_NO_VERIFY = "APPGATE_OPERATOR_SSL_NO_VERIFY"
@@ -54,6 +72,21 @@ APPGATE_TARGET_TAGS_ENV = "APPGATE_OPERATOR_TARGET_TAGS"
 APPGATE_BUILTIN_TAGS_ENV = "APPGATE_OPERATOR_BUILTIN_TAGS"
 
 
+def get_spec_cache(
+    spec_directory: Optional[str], default: bool = False
+) -> Optional[Path]:
+    """
+    Path of the parsed spec cache set in APPGATE_OPERATOR_SPEC_CACHE, an empty
+    value disables it. When it is not set the cache is inside the spec
+    directory if default is True (the operator run), the other commands do
+    not write into the spec directory unless asked to.
+    """
+    spec_cache = os.getenv(SPEC_CACHE_ENV)
+    if spec_cache is None:
+        return Path(spec_directory or SPEC_DIR) / SPEC_CACHE_FILE if default else None
+    return Path(spec_cache) if spec_cache else None
+
+
 def save_cert(cert: str) -> Path:
     cert_path = Path(tempfile.mktemp())
     with cert_path.open("w") as f:
@@ -84,7 +117,9 @@ def get_tags(args: OperatorArguments) -> Iterable[Optional[FrozenSet[str]]]:
 
 
 def get_context(
-    args: OperatorArguments, k8s_get_secret: Optional[Callable[[str, str], str]] = None
+    args: OperatorArguments,
+    k8s_get_secret: Optional[Callable[[str, str], str]] = None,
+    default_spec_cache: bool = False,
 ) -> Context:
     namespace = args.namespace or os.getenv(NAMESPACE_ENV)
     if not namespace:
@@ -97,6 +132,11 @@ def get_context(
     device_id = os.getenv(DEVICE_ID_ENV) or args.device_id
     controller = os.getenv(HOST_ENV) or args.host
     timeout = os.getenv(TIMEOUT_ENV) or args.timeout
+    parallelism = os.getenv(PARALLELISM_ENV) or args.parallelism
+    max_latency = os.getenv(MAX_LATENCY_ENV) or args.max_latency
+    page_size = os.getenv(PAGE_SIZE_ENV) or args.page_size
+    diff_mode = os.getenv(DIFF_MODE_ENV) or args.diff_mode
+    state_cache = os.getenv(STATE_CACHE_ENV) or args.state_cache
 
     def to_bool(value: Optional[str]) -> bool:
         if value:
@@ -132,6 +172,23 @@ def get_context(
         or f"{namespace}-configmap"
     )
 
+    if int(parallelism) < 1:
+        raise AppgateException(
+            f"Parallelism must be a positive number, got: {parallelism}"
+        )
+    if int(max_latency) < 1:
+        raise AppgateException(
+            f"Max latency must be a positive number, got: {max_latency}"
+        )
+    if int(page_size) < 0:
+        raise AppgateException(
+            f"Page size must be zero or a positive number, got: {page_size}"
+        )
+    if diff_mode not in DIFF_MODES:
+        raise AppgateException(
+            f"Diff mode must be one of {', '.join(DIFF_MODES)}, got: {diff_mode}"
+        )
+
     if not user or not password or not controller:
         missing_envs = ",".join(
             [
@@ -151,6 +208,7 @@ def get_context(
         spec_directory=Path(spec_directory) if spec_directory else None,
         secrets_key=secrets_key,
         k8s_get_secret=k8s_get_secret,
+        spec_cache=get_spec_cache(spec_directory, default=default_spec_cache),
     )
 
     return Context(
@@ -161,6 +219,11 @@ def get_context(
         device_id=device_id,
         controller=controller,
         timeout=int(timeout),
+        parallelism=int(parallelism),
+        max_latency=int(max_latency),
+        page_size=int(page_size),
+        diff_mode=cast(DiffMode, diff_mode),
+        state_cache=Path(state_cache) if state_cache else None,
         dry_run_mode=dry_run_mode,
         cleanup_mode=cleanup_mode,
         two_way_sync=two_way_sync,
@@ -196,6 +259,7 @@ def init_kubernetes(args: OperatorArguments) -> Context:
         k8s_get_secret=lambda secret, key: k8s_get_secret(
             namespace=ns, key=key, secret=secret
         ),
+        default_spec_cache=True,
     )
 
 
@@ -215,24 +279,31 @@ async def run_k8s(args: OperatorArguments) -> None:
             ctx.device_id,
         )
 
-    tasks = [
-        start_entity_loop(
-            ctx=ctx,
-            queue=events_queue,
-            crd=entity_names(e.cls, {}, f"v{ctx.api_spec.api_version}")[2],
-            singleton=e.singleton,
-            entity_type=e.cls,
-            k8s_configmap_client=k8s_configmap_client,
-        )
-        for e in ctx.api_spec.entities.values()
-        if e.api_path
-    ] + [
-        main_loop(
-            queue=events_queue, ctx=ctx, k8s_configmap_client=k8s_configmap_client
-        )
-    ]
+    async with K8SWatchClient() as k8s_watch_client, new_appgate_client(
+        ctx
+    ) as appgate_client:
+        tasks = [
+            start_entity_loop(
+                ctx=ctx,
+                queue=events_queue,
+                crd=entity_names(e.cls, {}, f"v{ctx.api_spec.api_version}")[2],
+                singleton=e.singleton,
+                entity_type=e.cls,
+                k8s_configmap_client=k8s_configmap_client,
+                k8s_watch_client=k8s_watch_client,
+            )
+            for e in ctx.api_spec.entities.values()
+            if e.api_path
+        ] + [
+            main_loop(
+                queue=events_queue,
+                ctx=ctx,
+                k8s_configmap_client=k8s_configmap_client,
+                appgate_client=appgate_client,
+            )
+        ]
 
-    await asyncio.gather(*tasks)
+        await asyncio.gather(*tasks)
 
 
 def main_run(args: OperatorArguments) -> None:
@@ -291,9 +362,10 @@ def main_dump_entities(
     )
 
 
-def main_api_info(spec_directory: Optional[str] = None) -> None:
+def main_api_info(spec_directory: Optional[str] = None, profile: bool = False) -> None:
     api_spec = generate_api_spec(
-        spec_directory=Path(spec_directory) if spec_directory else None
+        spec_directory=Path(spec_directory) if spec_directory else None,
+        spec_cache=get_spec_cache(spec_directory),
     )
     print(f"API Version: {api_spec.api_version}")
     print("Entities supported:")
@@ -302,6 +374,15 @@ def main_api_info(spec_directory: Optional[str] = None) -> None:
         print(f'   - {entity.api_path} :: {name} :: {{{join(" | ", deps)}}}')
     print("Entities topological sort:")
     print(f'    - {", ".join(api_spec.entities_sorted)}')
+    if profile:
+        print("Parse time per entity:")
+        for name, p in sorted(
+            api_spec.parse_profile.items(), key=lambda x: x[1].seconds, reverse=True
+        ):
+            print(
+                f"   - {name} :: {p.seconds * 1000:.1f} ms :: "
+                f"{p.references} references ({p.cached_references} cached)"
+            )
 
 
 def main_dump_crd(
@@ -311,7 +392,8 @@ def main_dump_crd(
 ) -> None:
     # We need the context here or just parse it
     api_spec = generate_api_spec(
-        spec_directory=Path(spec_directory) if spec_directory else None
+        spec_directory=Path(spec_directory) if spec_directory else None,
+        spec_cache=get_spec_cache(spec_directory),
     )
     output_path = None
     if not stdout:
@@ -334,39 +416,28 @@ def main_dump_crd(
 
 
 def main_validate_entities(
-    files: List[str], spec_directory: Optional[str] = None
+    files: List[str],
+    spec_directory: Optional[str] = None,
+    jobs: int = 1,
+    json_summary_file: Optional[str] = None,
+    junit_summary_file: Optional[str] = None,
 ) -> int:
-
+    start = time.perf_counter()
     api_spec = generate_api_spec(
-        spec_directory=Path(spec_directory) if spec_directory else None
-    )
-    candidates = [Path(f) for f in files]
-    errors = 0
-    while candidates:
-        file = candidates.pop()
-        if not file.exists():
-            errors = errors + 1
-            print(f" - {file}: ERROR: file does not exist.")
-            continue
-        if file.is_dir():
-            candidates.extend(itertools.chain(file.glob("*.yaml"), file.glob("*.yml")))
-            continue
-        with file.open() as f:
-            try:
-                data = yaml.safe_load_all(f.read())
-                for d in data:
-                    try:
-                        kind = d.get("kind")
-                        name = d["metadata"]["name"]
-                        api_spec.validate(d, kind, K8S_LOADER)
-                        print(f" - {kind}::{name}: OK.")
-                    except AppgateException as e:
-                        errors = errors + 1
-                        print(f" - {kind}::{name}: ERROR: loading entity: {e}.")
-            except yaml.YAMLError as e:
-                errors = errors + 1
-                print(f" - {file}: ERROR: parsing entity: {e}.")
-    return errors
+        spec_directory=Path(spec_directory) if spec_directory else None,
+        spec_cache=get_spec_cache(spec_directory),
+    )
+    results = []
+    for result in validate_files(api_spec, files, jobs=jobs):
+        for line in result.lines():
+            print(line)
+        results.append(result)
+    seconds = time.perf_counter() - start
+    if json_summary_file:
+        Path(json_summary_file).write_text(json_summary(results, seconds))
+    if junit_summary_file:
+        Path(junit_summary_file).write_text(junit_summary(results, seconds))
+    return sum(r.errors for r in results)
 
 
 def main() -> None:
@@ -422,6 +493,35 @@ def main() -> None:
         help="Event loop timeout to determine when there are not more events",
         default=30,
     )
+    run.add_argument(
+        "--parallelism",
+        help="Maximum number of concurrent requests against the controller",
+        default=8,
+    )
+    run.add_argument(
+        "--max-latency",
+        help="Maximum time to wait for more events since the first one received",
+        default=300,
+    )
+    run.add_argument(
+        "--page-size",
+        help="Number of entities read per request from the controller, 0 to read"
+        " all of them at once",
+        default=0,
+    )
+    run.add_argument(
+        "--diff-mode",
+        help="How to log the changes of the entities to modify: full diff, "
+        "summary of the changed fields or off",
+        choices=DIFF_MODES,
+        default="full",
+    )
+    run.add_argument(
+        "--state-cache",
+        help="File where to store the state of the controller, used to start"
+        " faster next time",
+        default=None,
+    )
     run.add_argument(
         "--no-verify",
         action="store_true",
@@ -482,9 +582,32 @@ def main() -> None:
         nargs="+",
         help="Directory from where to get the entities to validate",
     )
+    validate_entities.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes used to validate the files",
+        type=int,
+        default=1,
+    )
+    validate_entities.add_argument(
+        "--json-summary",
+        help="Write a JSON summary of the validation to this file",
+        default=None,
+    )
+    validate_entities.add_argument(
+        "--junit-summary",
+        help="Write a JUnit report of the validation to this file",
+        default=None,
+    )
     # api info
     api_info = subparsers.add_parser("api-info")
     api_info.set_defaults(cmd="api-info")
+    api_info.add_argument(
+        "--profile",
+        help="Show the time spent parsing each entity",
+        default=False,
+        action="store_true",
+    )
 
     args = parser.parse_args()
     set_level(log_level=os.getenv(APPGATE_LOG_LEVEL) or args.log_level.lower())
@@ -505,6 +628,11 @@ def main() -> None:
                     target_tags=args.tags,
                     no_cleanup=args.no_cleanup,
                     timeout=args.timeout,
+                    parallelism=args.parallelism,
+                    max_latency=args.max_latency,
+                    page_size=args.page_size,
+                    diff_mode=args.diff_mode,
+                    state_cache=Path(args.state_cache) if args.state_cache else None,
                     metadata_configmap=args.mt_config_map,
                     no_verify=args.no_verify,
                     cafile=Path(args.cafile) if args.cafile else None,
@@ -533,10 +661,17 @@ def main() -> None:
                 spec_directory=args.spec_directory,
             )
         elif args.cmd == "api-info":
-            main_api_info(spec_directory=args.spec_directory)
+            main_api_info(spec_directory=args.spec_directory, profile=args.profile)
         elif args.cmd == "validate-entities":
+            if args.jobs < 1:
+                print(f"jobs must be a positive number, got: {args.jobs}")
+                sys.exit(1)
             res = main_validate_entities(
-                spec_directory=args.spec_directory, files=args.files
+                spec_directory=args.spec_directory,
+                files=args.files,
+                jobs=args.jobs,
+                json_summary_file=args.json_summary,
+                junit_summary_file=args.junit_summary,
             )
             sys.exit(res)
         else:
@@ -1,19 +1,23 @@
 import asyncio
 import sys
+import time
 from asyncio import Queue
 from contextlib import AsyncExitStack
-from copy import deepcopy
-from typing import Optional, Type, Dict, Callable, Any
-import threading
+from typing import Optional, Type, Dict, Callable, Any, List, Set, Tuple
 
+from attr import attrib, attrs
 from kubernetes.client.rest import ApiException
-from kubernetes.client import CustomObjectsApi
-from kubernetes.watch import Watch
 
 from appgate.types import Context, AppgateEventSuccess, AppgateEventError
 from appgate.logger import log
 from appgate.attrs import K8S_LOADER, dump_datetime
-from appgate.client import AppgateClient, K8SConfigMapClient, entity_unique_id
+from appgate.client import (
+    AppgateClient,
+    EntityClient,
+    K8SConfigMapClient,
+    K8SWatchClient,
+    entity_unique_id,
+)
 from appgate.openapi.types import AppgateException, AppgateTypedloadException
 from appgate.openapi.openapi import generate_api_spec_clients
 from appgate.openapi.types import (
@@ -25,6 +29,7 @@ from appgate.openapi.types import (
 )
 from appgate.state import (
     AppgateState,
+    AppgatePlan,
     create_appgate_plan,
     appgate_plan_apply,
     EntitiesSet,
@@ -32,49 +37,76 @@ from appgate.state import (
     resolve_appgate_state,
     exclude_appgate_entity,
 )
-from appgate.types import K8SEvent, AppgateEvent, EntityWrapper, EventObject
+from appgate.state_cache import (
+    cached_entities_current,
+    load_state_cache,
+    save_state_cache,
+    stale_entity_types,
+)
+from appgate.types import (
+    K8SEvent,
+    AppgateEvent,
+    EntityWrapper,
+    EntitiesVersion,
+    EventObject,
+)
 
 
 __all__ = [
     "main_loop",
     "get_current_appgate_state",
+    "new_appgate_client",
     "start_entity_loop",
 ]
 
 
-crds: Optional[CustomObjectsApi] = None
-
-
-def get_crds() -> CustomObjectsApi:
-    global crds
-    if not crds:
-        crds = CustomObjectsApi()
-    return crds
-
-
-async def get_current_appgate_state(ctx: Context) -> AppgateState:
+def new_appgate_client(ctx: Context) -> AppgateClient:
     """
-    Gets the current AppgateState for controller
+    AppgateClient for the controller in ctx, it needs to be entered to log in
     """
-    api_spec = ctx.api_spec
-    log.info(
-        "[appgate-operator/%s] Updating current state from controller", ctx.namespace
-    )
-    if ctx.no_verify:
-        log.warning("[appgate-operator/%s] Ignoring SSL certificates!", ctx.namespace)
     if ctx.device_id is None:
         raise AppgateException("No device id specified")
-    async with AppgateClient(
+    return AppgateClient(
         controller=ctx.controller,
         user=ctx.user,
         password=ctx.password,
         provider=ctx.provider,
         device_id=ctx.device_id,
-        version=api_spec.api_version,
+        version=ctx.api_spec.api_version,
         no_verify=ctx.no_verify,
         cafile=ctx.cafile,
-    ) as appgate_client:
-        if not appgate_client.authenticated:
+        page_size=ctx.page_size,
+        parallelism=ctx.parallelism,
+    )
+
+
+async def get_current_appgate_state(
+    ctx: Context,
+    previous_state: Optional[AppgateState] = None,
+    appgate_client: Optional[AppgateClient] = None,
+    entity_types: Optional[Set[str]] = None,
+) -> AppgateState:
+    """
+    Gets the current AppgateState for controller. The entity types that did
+    not change since they were read for previous_state are taken from it.
+    When entity_types is given only those types are read, the rest are taken
+    from previous_state. A new client is used unless appgate_client is given.
+    """
+    previous_versions = previous_state.versions if previous_state else {}
+    api_spec = ctx.api_spec
+    log.info(
+        "[appgate-operator/%s] Updating current state from controller", ctx.namespace
+    )
+    if ctx.no_verify:
+        log.warning("[appgate-operator/%s] Ignoring SSL certificates!", ctx.namespace)
+    async with AsyncExitStack() as exit_stack:
+        if appgate_client is None:
+            controller_client = await exit_stack.enter_async_context(
+                new_appgate_client(ctx)
+            )
+        else:
+            controller_client = appgate_client
+        if not controller_client.authenticated:
             log.error(
                 "[appgate-operator/%s] Unable to authenticate with controller",
                 ctx.namespace,
@@ -82,38 +114,142 @@ async def get_current_appgate_state(ctx: Context) -> AppgateState:
             raise AppgateException("Error authenticating")
 
         entity_clients = generate_api_spec_clients(
-            api_spec=api_spec, appgate_client=appgate_client
+            api_spec=api_spec, appgate_client=controller_client
         )
+        if entity_types is not None and previous_state is not None:
+            entity_clients = {
+                k: v for k, v in entity_clients.items() if k in entity_types
+            }
+        # Bound the number of requests in flight against the controller,
+        # all of them share the same client session.
+        semaphore = asyncio.Semaphore(ctx.parallelism)
+
+        async def get_entities(
+            entity: str, client: EntityClient
+        ) -> Tuple[Optional[EntitiesSet], Optional[EntitiesVersion]]:
+            async with semaphore:
+                start = time.monotonic()
+                entities, version = await client.get_if_changed(
+                    previous_versions.get(entity)
+                )
+                if entities is None and version is not None and previous_state:
+                    log.info(
+                        "[appgate-operator/%s] Entities of type %s not changed",
+                        ctx.namespace,
+                        entity,
+                    )
+                    return previous_state.entities_set[entity].snapshot(), version
+                log.info(
+                    "[appgate-operator/%s] Read %s entities of type %s in %.2fs",
+                    ctx.namespace,
+                    len(entities) if entities is not None else 0,
+                    entity,
+                    time.monotonic() - start,
+                )
+                if entities is None:
+                    return None, None
+                return EntitiesSet({EntityWrapper(e) for e in entities}), version
+
+        tasks = {
+            entity: asyncio.create_task(get_entities(entity, client))
+            for entity, client in entity_clients.items()
+        }
+        try:
+            await asyncio.gather(*tasks.values())
+        except Exception as e:
+            # The state must be read completely or not at all
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            log.error(
+                "[appgate-operator/%s] Unable to get entities from controller: %s",
+                ctx.namespace,
+                e,
+            )
+            raise AppgateException("Error reading current state")
         entities_set = {}
-        for entity, client in entity_clients.items():
-            entities = await client.get()
+        versions = {}
+        for entity, task in tasks.items():
+            entities, version = task.result()
             if entities is not None:
-                entities_set[entity] = EntitiesSet({EntityWrapper(e) for e in entities})
+                entities_set[entity] = entities
+            if version is not None:
+                versions[entity] = version
         if len(entities_set) < len(entity_clients):
             log.error(
                 "[appgate-operator/%s] Unable to get entities from controller",
                 ctx.namespace,
             )
             raise AppgateException("Error reading current state")
-        appgate_state = AppgateState(entities_set=entities_set)
+        if entity_types is not None and previous_state is not None:
+            for k, v in previous_state.entities_set.items():
+                if k not in entities_set:
+                    entities_set[k] = v.snapshot()
+                    if k in previous_state.versions:
+                        versions[k] = previous_state.versions[k]
+        appgate_state = AppgateState(entities_set=entities_set, versions=versions)
 
     return appgate_state
 
 
-def run_entity_loop(
+async def stale_cached_entity_types(
+    ctx: Context, cached_state: AppgateState, appgate_client: AppgateClient
+) -> Set[str]:
+    """
+    Entity types of cached_state that may be outdated. Only the number of
+    entities of each type and the last one updated are read from the
+    controller, the types that can not be validated that way are stale.
+    """
+    entity_clients = generate_api_spec_clients(
+        api_spec=ctx.api_spec, appgate_client=appgate_client
+    )
+    semaphore = asyncio.Semaphore(ctx.parallelism)
+
+    async def is_stale(entity: str, client: EntityClient) -> bool:
+        try:
+            async with semaphore:
+                latest = await client.get_latest()
+        except AppgateException as e:
+            log.warning(
+                "[appgate-operator/%s] Unable to validate cached entities of type %s: %s",
+                ctx.namespace,
+                entity,
+                e,
+            )
+            return True
+        if latest is None:
+            return True
+        total, latest_entity = latest
+        magic_ids = {e.id for e in client.magic_entities or []}
+        return not cached_entities_current(
+            (
+                e
+                for e in cached_state.entities_set[entity].entities
+                if e.id not in magic_ids
+            ),
+            total,
+            EntityWrapper(latest_entity) if latest_entity is not None else None,
+        )
+
+    stale = await asyncio.gather(
+        *(is_stale(entity, client) for entity, client in entity_clients.items())
+    )
+    return {entity for entity, s in zip(entity_clients, stale) if s}
+
+
+async def run_entity_loop(
     ctx: Context,
     crd: str,
-    loop: asyncio.AbstractEventLoop,
     queue: Queue[AppgateEvent],
     load: Callable[[Dict[str, Any], Optional[Dict[str, Any]], type], Entity_T],
     entity_type: type,
     singleton: bool,
     k8s_configmap_client: K8SConfigMapClient,
-):
+    k8s_watch_client: K8SWatchClient,
+) -> None:
     namespace = ctx.namespace
     log.info(f"[{crd}/{namespace}] Loop for {crd}/{namespace} started")
-    watcher = Watch().stream(
-        get_crds().list_namespaced_custom_object,
+    watcher = k8s_watch_client.watch(
         K8S_APPGATE_DOMAIN,
         K8S_APPGATE_VERSION,
         namespace,
@@ -121,7 +257,7 @@ def run_entity_loop(
     )
     while True:
         try:
-            data = next(watcher)
+            data = await watcher.__anext__()
             data_obj = data["object"]
             data_mt = data_obj["metadata"]
             kind = data_obj["kind"]
@@ -196,7 +332,7 @@ def run_entity_loop(
                         name=event.spec["name"], kind=event.kind, error=str(e)
                     )
 
-                asyncio.run_coroutine_threadsafe(queue.put(appgate_event), loop)
+                await queue.put(appgate_event)
         except ApiException:
             log.exception(
                 "[appgate-operator/%s] Error when subscribing events in k8s for %s",
@@ -204,13 +340,12 @@ def run_entity_loop(
                 crd,
             )
             sys.exit(1)
-        except StopIteration:
+        except StopAsyncIteration:
             log.debug(
                 "[appgate-operator/%s] Event loop stopped, re-initializing watchers",
                 namespace,
             )
-            watcher = Watch().stream(
-                get_crds().list_namespaced_custom_object,
+            watcher = k8s_watch_client.watch(
                 K8S_APPGATE_DOMAIN,
                 K8S_APPGATE_VERSION,
                 namespace,
@@ -230,40 +365,129 @@ async def start_entity_loop(
     singleton: bool,
     queue: Queue[AppgateEvent],
     k8s_configmap_client: K8SConfigMapClient,
+    k8s_watch_client: K8SWatchClient,
 ) -> None:
     log.debug(
         "[%s/%s] Starting loop event for entities on path: %s", crd, ctx.namespace, crd
     )
+    await run_entity_loop(
+        ctx=ctx,
+        crd=crd,
+        queue=queue,
+        load=K8S_LOADER.load,
+        entity_type=entity_type,
+        singleton=singleton,
+        k8s_configmap_client=k8s_configmap_client,
+        k8s_watch_client=k8s_watch_client,
+    )
 
-    def run(loop: asyncio.AbstractEventLoop) -> None:
-        t = threading.Thread(
-            target=run_entity_loop,
-            args=(
-                ctx,
-                crd,
-                loop,
-                queue,
-                K8S_LOADER.load,
-                entity_type,
-                singleton,
-                k8s_configmap_client,
-            ),
-            daemon=True,
-        )
-        t.start()
 
-    await asyncio.to_thread(run, asyncio.get_event_loop())
+@attrs()
+class EventsBatch:
+    """
+    Events received in a batch. Events for the same entity are coalesced, only
+    the last one is kept.
+    """
+
+    events: Dict[Tuple[str, str], AppgateEventSuccess] = attrib(factory=dict)
+    errors: List[AppgateEventError] = attrib(factory=list)
+    # number of events received
+    received: int = attrib(default=0)
+    # seconds since the first event was received until the batch was closed
+    latency: float = attrib(default=0.0)
+
+    @property
+    def coalesced(self) -> int:
+        return self.received - len(self.events) - len(self.errors)
+
+    def add(self, event: AppgateEvent) -> None:
+        self.received += 1
+        if isinstance(event, AppgateEventError):
+            self.errors.append(event)
+            return
+        key = (event.entity.__class__.__qualname__, event.entity.name)
+        # Keep the events in the order they were last received
+        self.events.pop(key, None)
+        self.events[key] = event
+
+
+async def get_events_batch(
+    queue: Queue, quiet_period: float, max_latency: float
+) -> EventsBatch:
+    """
+    Gets events from the queue until no new event is received in quiet_period
+    seconds or max_latency seconds have passed since the first event was
+    received, whichever comes first.
+    """
+    loop = asyncio.get_running_loop()
+    events_batch = EventsBatch()
+    first_event: Optional[float] = None
+    while True:
+        timeout = quiet_period
+        if first_event is not None:
+            timeout = min(timeout, first_event + max_latency - loop.time())
+            if timeout <= 0:
+                break
+        try:
+            event = await asyncio.wait_for(queue.get(), timeout=timeout)
+        except asyncio.exceptions.TimeoutError:
+            break
+        if first_event is None:
+            first_event = loop.time()
+        events_batch.add(event)
+        # Drain all the events already in the queue
+        while not queue.empty():
+            events_batch.add(queue.get_nowait())
+    if first_event is not None:
+        events_batch.latency = loop.time() - first_event
+    return events_batch
+
+
+def initial_expected_state(
+    ctx: Context, current_appgate_state: AppgateState
+) -> AppgateState:
+    """
+    Expected state before getting any event, taken from the current state
+    depending on the cleanup mode and the target tags.
+    """
+    if ctx.cleanup_mode:
+        tags_in_cleanup = ctx.builtin_tags.union(ctx.exclude_tags or frozenset())
+        return AppgateState(
+            {
+                k: v.entities_with_tags(tags_in_cleanup)
+                for k, v in current_appgate_state.entities_set.items()
+            }
+        )
+    elif ctx.target_tags:
+        return AppgateState(
+            {
+                k: v.entities_with_tags(ctx.target_tags)
+                for k, v in current_appgate_state.entities_set.items()
+            }
+        )
+    return current_appgate_state.snapshot()
 
 
 async def main_loop(
-    queue: Queue, ctx: Context, k8s_configmap_client: K8SConfigMapClient
+    queue: Queue,
+    ctx: Context,
+    k8s_configmap_client: K8SConfigMapClient,
+    appgate_client: AppgateClient,
 ) -> None:
+    """
+    Reconciles the controller with the events in queue. appgate_client is
+    used for all the requests to the controller, its connections are reused
+    between reconcile cycles.
+    """
     namespace = ctx.namespace
     log.info("[appgate-operator/%s] Main loop started:", namespace)
     log.info("[appgate-operator/%s]   + namespace: %s", namespace, namespace)
     log.info("[appgate-operator/%s]   + host: %s", namespace, ctx.controller)
     log.info("[appgate-operator/%s]   + log-level: %s", namespace, log.level)
     log.info("[appgate-operator/%s]   + timeout: %s", namespace, ctx.timeout)
+    log.info("[appgate-operator/%s]   + max-latency: %s", namespace, ctx.max_latency)
+    log.info("[appgate-operator/%s]   + page-size: %s", namespace, ctx.page_size)
+    log.info("[appgate-operator/%s]   + diff-mode: %s", namespace, ctx.diff_mode)
     log.info("[appgate-operator/%s]   + dry-run: %s", namespace, ctx.dry_run_mode)
     log.info("[appgate-operator/%s]   + cleanup: %s", namespace, ctx.cleanup_mode)
     log.info("[appgate-operator/%s]   + two-way-sync: %s", namespace, ctx.two_way_sync)
@@ -282,180 +506,264 @@ async def main_loop(
         namespace,
         ",".join(ctx.exclude_tags) if ctx.exclude_tags else "None",
     )
-    log.info("[appgate-operator/%s] Getting current state from controller", namespace)
-    current_appgate_state = await get_current_appgate_state(ctx=ctx)
-    total_appgate_state = deepcopy(current_appgate_state)
-    if ctx.cleanup_mode:
-        tags_in_cleanup = ctx.builtin_tags.union(ctx.exclude_tags or frozenset())
-        expected_appgate_state = AppgateState(
-            {
-                k: v.entities_with_tags(tags_in_cleanup)
-                for k, v in current_appgate_state.entities_set.items()
-            }
+    log.info(
+        "[appgate-operator/%s]   + state-cache: %s",
+        namespace,
+        ctx.state_cache or "None",
+    )
+    current_appgate_state: Optional[AppgateState] = None
+    # Entity types that may be outdated in the state loaded from the cache,
+    # validated with the controller while the first events arrive
+    validation_task: Optional["asyncio.Task[Set[str]]"] = None
+    if ctx.state_cache:
+        current_appgate_state = load_state_cache(
+            ctx.state_cache, ctx.api_spec, ctx.controller
         )
-    elif ctx.target_tags:
-        expected_appgate_state = AppgateState(
-            {
-                k: v.entities_with_tags(ctx.target_tags)
-                for k, v in current_appgate_state.entities_set.items()
-            }
+        if current_appgate_state is not None:
+            log.info(
+                "[appgate-operator/%s] Loaded current state from %s, validating it"
+                " with the controller",
+                namespace,
+                ctx.state_cache,
+            )
+            validation_task = asyncio.create_task(
+                stale_cached_entity_types(
+                    ctx=ctx,
+                    cached_state=current_appgate_state,
+                    appgate_client=appgate_client,
+                )
+            )
+    if current_appgate_state is None:
+        log.info(
+            "[appgate-operator/%s] Getting current state from controller", namespace
+        )
+        current_appgate_state = await get_current_appgate_state(
+            ctx=ctx, appgate_client=appgate_client
         )
-    else:
-        expected_appgate_state = deepcopy(current_appgate_state)
+        if ctx.state_cache:
+            save_state_cache(
+                ctx.state_cache, current_appgate_state, ctx.api_spec, ctx.controller
+            )
+    total_appgate_state = current_appgate_state.snapshot()
+    expected_appgate_state = initial_expected_state(ctx, current_appgate_state)
     log.info(
         "[appgate-operator/%s] Ready to get new events and compute a new plan",
         namespace,
     )
     event_errors = []
+    # Last plan computed, used to reuse the plans of the entity types not changed
+    previous_plan: Optional[AppgatePlan] = None
     while True:
-        try:
-            log.info("[appgate-operator/%s] Waiting for event", namespace)
-            event: AppgateEvent = await asyncio.wait_for(
-                queue.get(), timeout=ctx.timeout
-            )
-            if isinstance(event, AppgateEventError):
-                event_errors.append(event)
-            else:
+        log.info("[appgate-operator/%s] Waiting for event", namespace)
+        events_batch = await get_events_batch(
+            queue, quiet_period=ctx.timeout, max_latency=ctx.max_latency
+        )
+        event_errors.extend(events_batch.errors)
+        if validation_task is not None:
+            # No plan is computed from the cached state until it is validated,
+            # only the entity types that may be outdated are read again
+            maybe_stale = await validation_task
+            validation_task = None
+            stale = set()
+            if maybe_stale:
+                fresh_appgate_state = await get_current_appgate_state(
+                    ctx=ctx,
+                    previous_state=current_appgate_state,
+                    appgate_client=appgate_client,
+                    entity_types=maybe_stale,
+                )
+                stale = stale_entity_types(current_appgate_state, fresh_appgate_state)
+            if stale:
                 log.info(
-                    "[appgate-operator/%s}] Event: %s %s with name %s",
+                    "[appgate-operator/%s] State cache is outdated for: %s",
                     namespace,
-                    event.op,
-                    event.entity.__class__.__qualname__,
-                    event.entity.name,
+                    ", ".join(sorted(stale)),
                 )
-                expected_appgate_state.with_entity(
-                    EntityWrapper(event.entity), event.op, current_appgate_state
+                current_appgate_state = fresh_appgate_state
+                total_appgate_state = current_appgate_state.snapshot()
+                expected_appgate_state = initial_expected_state(
+                    ctx, current_appgate_state
                 )
-        except asyncio.exceptions.TimeoutError:
-            if event_errors:
-                log.error(
-                    "[appgate-operator/%s}] Found events with errors, dying now!",
-                    namespace,
-                )
-                for event_error in event_errors:
-                    log.error(
-                        "[appgate-operator/%s}] - Entity of type %s with name %s : %s",
-                        namespace,
-                        event_error.name,
-                        event_error.kind,
-                        event_error.error,
-                    )
-                sys.exit(1)
-            # Log all expected entities
-            any_expected = False
-            for entity_type, xs in expected_appgate_state.entities_set.items():
-                expected_entities = {
-                    n: e
-                    for n, e in xs.entities_by_name.items()
-                    if exclude_appgate_entity(e, ctx.target_tags, ctx.exclude_tags)
-                }
-                for entity_name, e in expected_entities.items():
-                    if not any_expected:
-                        log.info("[appgate-operator/%s] Expected entities:", namespace)
-                        any_expected = True
-                    log.info(
-                        "[appgate-operator/%s] %s: %s: %s",
-                        namespace,
-                        entity_type,
-                        entity_name,
-                        e.id,
+                if ctx.state_cache:
+                    save_state_cache(
+                        ctx.state_cache,
+                        current_appgate_state,
+                        ctx.api_spec,
+                        ctx.controller,
                     )
-            if not any_expected:
-                log.warning("[appgate-operator/%s] Not expected any entity", namespace)
-
-            # Resolve entities now, in order
-            # this will be the Topological sort
-            total_conflicts = resolve_appgate_state(
-                expected_state=expected_appgate_state,
-                total_appgate_state=total_appgate_state,
-                reverse=False,
-                api_spec=ctx.api_spec,
+            else:
+                log.info("[appgate-operator/%s] State cache is up to date", namespace)
+        for event in events_batch.events.values():
+            log.info(
+                "[appgate-operator/%s}] Event: %s %s with name %s",
+                namespace,
+                event.op,
+                event.entity.__class__.__qualname__,
+                event.entity.name,
+            )
+            expected_appgate_state.with_entity(
+                EntityWrapper(event.entity), event.op, current_appgate_state
+            )
+        if events_batch.received > 0:
+            log.info(
+                "[appgate-operator/%s] Received %s events (%s coalesced) in %.2fs",
+                namespace,
+                events_batch.received,
+                events_batch.coalesced,
+                events_batch.latency,
             )
-            if total_conflicts:
+        if event_errors:
+            log.error(
+                "[appgate-operator/%s}] Found events with errors, dying now!",
+                namespace,
+            )
+            for event_error in event_errors:
                 log.error(
-                    "[appgate-operator/%s] Found errors in expected state and plan can"
-                    " not be applied.",
+                    "[appgate-operator/%s}] - Entity of type %s with name %s : %s",
                     namespace,
+                    event_error.name,
+                    event_error.kind,
+                    event_error.error,
                 )
-                entities_conflict_summary(
-                    conflicts=total_conflicts, namespace=namespace
-                )
+            sys.exit(1)
+        # Log all expected entities
+        any_expected = False
+        for entity_type, xs in expected_appgate_state.entities_set.items():
+            expected_entities = {
+                n: e
+                for n, e in xs.entities_by_name.items()
+                if exclude_appgate_entity(e, ctx.target_tags, ctx.exclude_tags)
+            }
+            for entity_name, e in expected_entities.items():
+                if not any_expected:
+                    log.info("[appgate-operator/%s] Expected entities:", namespace)
+                    any_expected = True
                 log.info(
-                    "[appgate-operator/%s] Waiting for more events that can fix the state.",
+                    "[appgate-operator/%s] %s: %s: %s",
                     namespace,
+                    entity_type,
+                    entity_name,
+                    e.id,
                 )
-                continue
-
-            if ctx.two_way_sync:
-                # use current appgate state from controller instead of from memory
-                current_appgate_state = await get_current_appgate_state(ctx=ctx)
-                total_appgate_state = deepcopy(current_appgate_state)
-
-            # Create a plan
-            # Need to copy?
-            # Now we use dicts so resolving update the contents of the keys
-            plan = create_appgate_plan(
-                current_appgate_state,
-                expected_appgate_state,
-                ctx.builtin_tags,
-                ctx.target_tags,
-                ctx.exclude_tags,
+        if not any_expected:
+            log.warning("[appgate-operator/%s] Not expected any entity", namespace)
+
+        # Only the entity types that changed since the last plan and the
+        # ones depending on them need to be resolved and compared again.
+        # With two-way-sync the current state is read again so everything
+        # needs to be reconciled.
+        entity_names = None
+        if previous_plan is not None and not ctx.two_way_sync:
+            entity_names = ctx.api_spec.entities_dependents(
+                expected_appgate_state.dirty
             )
-            if plan.needs_apply:
-                log.info(
-                    "[appgate-operator/%s] No more events for a while, creating a plan",
+            log.info(
+                "[appgate-operator/%s] Entity types to reconcile: %s",
+                namespace,
+                ", ".join(sorted(entity_names)) or "None",
+            )
+
+        # Resolve entities now, in order
+        # this will be the Topological sort
+        total_conflicts = resolve_appgate_state(
+            expected_state=expected_appgate_state,
+            total_appgate_state=total_appgate_state,
+            reverse=False,
+            api_spec=ctx.api_spec,
+            entity_names=entity_names,
+        )
+        if total_conflicts:
+            log.error(
+                "[appgate-operator/%s] Found errors in expected state and plan can"
+                " not be applied.",
+                namespace,
+            )
+            entities_conflict_summary(conflicts=total_conflicts, namespace=namespace)
+            log.info(
+                "[appgate-operator/%s] Waiting for more events that can fix the state.",
+                namespace,
+            )
+            continue
+
+        if ctx.two_way_sync:
+            # use current appgate state from controller instead of from memory
+            current_appgate_state = await get_current_appgate_state(
+                ctx=ctx,
+                previous_state=current_appgate_state,
+                appgate_client=appgate_client,
+            )
+            total_appgate_state = current_appgate_state.snapshot()
+
+        # Create a plan
+        # Need to copy?
+        # Now we use dicts so resolving update the contents of the keys
+        plan = create_appgate_plan(
+            current_appgate_state,
+            expected_appgate_state,
+            ctx.builtin_tags,
+            ctx.target_tags,
+            ctx.exclude_tags,
+            previous_plan=previous_plan,
+            entity_names=entity_names,
+        )
+        expected_appgate_state.dirty.clear()
+        previous_plan = plan
+        if plan.needs_apply:
+            log.info(
+                "[appgate-operator/%s] No more events for a while, creating a plan",
+                namespace,
+            )
+            apply_client: Optional[AppgateClient] = None
+            if not ctx.dry_run_mode:
+                apply_client = appgate_client
+            else:
+                log.warning(
+                    "[appgate-operator/%s] Running in dry-mode, nothing will be created",
                     namespace,
                 )
-                async with AsyncExitStack() as exit_stack:
-                    appgate_client = None
-                    if not ctx.dry_run_mode:
-                        if ctx.device_id is None:
-                            raise AppgateException("No device id specified")
-                        appgate_client = await exit_stack.enter_async_context(
-                            AppgateClient(
-                                controller=ctx.controller,
-                                user=ctx.user,
-                                password=ctx.password,
-                                provider=ctx.provider,
-                                device_id=ctx.device_id,
-                                version=ctx.api_spec.api_version,
-                                no_verify=ctx.no_verify,
-                                cafile=ctx.cafile,
-                            )
-                        )
-                    else:
-                        log.warning(
-                            "[appgate-operator/%s] Running in dry-mode, nothing will be created",
-                            namespace,
-                        )
-                    new_plan = await appgate_plan_apply(
-                        appgate_plan=plan,
-                        namespace=namespace,
-                        entity_clients=generate_api_spec_clients(
-                            api_spec=ctx.api_spec, appgate_client=appgate_client
-                        )
-                        if appgate_client
-                        else {},
-                        k8s_configmap_client=k8s_configmap_client,
-                        api_spec=ctx.api_spec,
-                    )
+            new_plan = await appgate_plan_apply(
+                appgate_plan=plan,
+                namespace=namespace,
+                entity_clients=generate_api_spec_clients(
+                    api_spec=ctx.api_spec, appgate_client=apply_client
+                )
+                if apply_client
+                else {},
+                k8s_configmap_client=k8s_configmap_client,
+                api_spec=ctx.api_spec,
+                parallelism=ctx.parallelism,
+                diff_mode=ctx.diff_mode,
+            )
 
-                    if len(new_plan.errors) > 0:
-                        log.error(
-                            "[appgate-operator/%s] Found errors when applying plan:",
-                            namespace,
-                        )
-                        for err in new_plan.errors:
-                            log.error("[appgate-operator/%s] Error %s:", namespace, err)
-                        sys.exit(1)
-
-                    if appgate_client:
-                        current_appgate_state = new_plan.appgate_state
-                        expected_appgate_state = (
-                            expected_appgate_state.sync_generations()
-                        )
-            else:
-                log.info(
-                    "[appgate-operator/%s] Nothing changed! Keeping watching!",
+            if len(new_plan.errors) > 0:
+                log.error(
+                    "[appgate-operator/%s] Found errors when applying plan:",
                     namespace,
                 )
+                for err in new_plan.errors:
+                    log.error("[appgate-operator/%s] Error %s:", namespace, err)
+                sys.exit(1)
+
+            if apply_client:
+                # Only the entity types applied have changed, the plans
+                # for the rest of them are still valid.
+                applied = {k for k, v in plan.entities_plan.items() if v.needs_apply}
+                current_appgate_state = current_appgate_state.copy(
+                    {k: new_plan.entities_plan[k].entities for k in applied}
+                )
+                expected_appgate_state = expected_appgate_state.sync_generations(
+                    applied
+                )
+                expected_appgate_state.dirty.update(applied)
+                if ctx.state_cache:
+                    save_state_cache(
+                        ctx.state_cache,
+                        current_appgate_state,
+                        ctx.api_spec,
+                        ctx.controller,
+                    )
+        else:
+            log.info(
+                "[appgate-operator/%s] Nothing changed! Keeping watching!",
+                namespace,
+            )
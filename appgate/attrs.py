@@ -1,6 +1,21 @@
 import datetime
+from weakref import WeakKeyDictionary
+
+from attr import NOTHING, attrib, attrs, has as is_attrs
 from dateutil import parser
-from typing import Dict, Any, List, Callable, Optional, Iterable, Union, Type
+from typing import (
+    Dict,
+    Any,
+    List,
+    Optional,
+    Iterable,
+    Union,
+    Type,
+    Tuple,
+    Set,
+    MutableMapping,
+    get_args,
+)
 
 from typedload import dataloader
 from typedload import datadumper
@@ -37,7 +52,9 @@ __all__ = [
     "K8S_LOADER",
     "APPGATE_LOADER",
     "DIFF_DUMPER",
+    "CACHE_DUMPER",
     "get_loader",
+    "compile_loaders",
     "get_dumper",
     "dump_datetime",
     "parse_datetime",
@@ -58,6 +75,151 @@ def _attrdump(d, value) -> Dict[str, Any]:
     return r
 
 
+@attrs(frozen=True, slots=True)
+class FieldLoader:
+    """
+    How to prepare the value of an attribute before loading it: the key used
+    in the data (when it differs from the attribute name) and the custom
+    attribute loaders to run.
+    """
+
+    name: str = attrib()
+    dataname: Optional[str] = attrib()
+    loaders: Tuple[CustomAttribLoader, ...] = attrib()
+
+
+@attrs(frozen=True, slots=True)
+class LoaderFieldsTable:
+    """
+    Attributes of a generated class that are loaded for a PlatformType,
+    computed once per class instead of on every load.
+    """
+
+    fields: dataloader._FakeNamedTuple = attrib()
+    fields_loaders: Tuple[FieldLoader, ...] = attrib()
+
+
+def make_loader_fields_table(
+    type_: Any, platform_type: PlatformType
+) -> LoaderFieldsTable:
+    names = []
+    defaults = {}
+    types = {}
+    fields_loaders = []
+    for attribute in type_.__attrs_attrs__:
+        read_only = attribute.metadata.get("readOnly", False)
+        write_only = attribute.metadata.get("writeOnly", False)
+        if read_only and platform_type == PlatformType.K8S:
+            # Don't load attribute from K8S in read only mode even if
+            # it's defined
+            continue
+        elif write_only and platform_type == PlatformType.APPGATE:
+            # Don't load attribute from APPGATE in read only mode even if
+            # it's defined
+            continue
+        names.append(attribute.name)
+        types[attribute.name] = attribute.type
+        defaults[attribute.name] = attribute.default
+
+        cls: Iterable[CustomLoader] = []
+        if platform_type == PlatformType.K8S:
+            cls = attribute.metadata.get(K8S_LOADERS_FIELD_NAME) or []
+        elif platform_type == PlatformType.APPGATE:
+            cls = attribute.metadata.get(APPGATE_LOADERS_FIELD_NAME) or []
+        loaders = tuple(cl for cl in cls if isinstance(cl, CustomAttribLoader))
+        dataname = attribute.metadata.get("name")
+        if dataname == attribute.name:
+            dataname = None
+        if dataname is not None or loaders:
+            fields_loaders.append(
+                FieldLoader(name=attribute.name, dataname=dataname, loaders=loaders)
+            )
+
+    return LoaderFieldsTable(
+        fields=dataloader._FakeNamedTuple(
+            (
+                tuple(names),
+                types,
+                defaults,
+                type_,
+            )
+        ),
+        fields_loaders=tuple(fields_loaders),
+    )
+
+
+@attrs(frozen=True, slots=True)
+class FieldDumper:
+    """
+    Attribute to dump: the key used in the dumped data and the value hidden
+    when it is the default one.
+    """
+
+    name: str = attrib()
+    dataname: str = attrib()
+    default: Any = attrib()
+
+
+@attrs(frozen=True, slots=True)
+class DumperFieldsTable:
+    """
+    Attributes of a generated class that are dumped for a PlatformType,
+    computed once per class instead of on every dump.
+    """
+
+    fields_dumpers: Tuple[FieldDumper, ...] = attrib()
+
+
+def make_dumper_fields_table(
+    type_: Any, platform_type: PlatformType, cache: bool = False
+) -> DumperFieldsTable:
+    """
+    With cache the fields are dumped as the controller returns them: read only
+    fields are dumped and write only fields are not.
+    """
+    fields_dumpers = []
+    for attribute in type_.__attrs_attrs__:
+        read_only = attribute.metadata.get("readOnly", False)
+        write_only = attribute.metadata.get("writeOnly", False)
+        name = attribute.metadata.get("name", attribute.name)
+        if platform_type == PlatformType.DIFF and not attribute.eq:
+            # DIFF mode we only dump eq fields
+            continue
+        elif not platform_type == PlatformType.DIFF:
+            if not attribute.repr:
+                continue
+            if name == APPGATE_METADATA_ATTRIB_NAME:
+                continue
+            if cache and write_only:
+                continue
+            if read_only and not cache:
+                continue
+        default = attribute.default
+        if hasattr(default, "factory"):
+            # Build the default value once, values equal to it are hidden
+            default = NOTHING if default.takes_self else default.factory()
+        fields_dumpers.append(
+            FieldDumper(name=attribute.name, dataname=name, default=default)
+        )
+    return DumperFieldsTable(fields_dumpers=tuple(fields_dumpers))
+
+
+def attrs_types(type_: Any, seen: Optional[Set[type]] = None) -> Set[type]:
+    """
+    All the attrs classes reachable from type_ through its attributes
+    """
+    seen = set() if seen is None else seen
+    if is_attrs(type_):
+        if type_ in seen:
+            return seen
+        seen.add(type_)
+        for attribute in type_.__attrs_attrs__:
+            attrs_types(attribute.type, seen)
+    for arg in get_args(type_):
+        attrs_types(arg, seen)
+    return seen
+
+
 def is_datetime_loader(type_: Type[Any]) -> bool:
     name = getattr(type_, "__name__", None)
     return name == "datetime"
@@ -79,48 +241,36 @@ def dump_datetime(v: datetime.datetime) -> str:
     return v.isoformat(timespec="milliseconds").replace("+00:00", "Z")
 
 
-def get_dumper(platform_type: PlatformType):
+def get_dumper(platform_type: PlatformType, cache: bool = False):
     def _attrdump(d, value) -> Dict[str, Any]:
         r = {}
-        for attr in value.__attrs_attrs__:
-            attrval = getattr(value, attr.name)
-            read_only = attr.metadata.get("readOnly", False)
-            name = attr.metadata.get("name", attr.name)
-            if platform_type == PlatformType.DIFF and not attr.eq:
-                # DIFF mode we only dump eq fields
+        fields_table = get_fields_table(type(value))
+        for field_dumper in fields_table.fields_dumpers:
+            attrval = getattr(value, field_dumper.name)
+            if d.hidedefault and attrval == field_dumper.default:
                 continue
-            elif not platform_type == PlatformType.DIFF:
-                if not attr.repr:
-                    continue
-                if name == APPGATE_METADATA_ATTRIB_NAME:
-                    continue
-                if read_only:
-                    continue
-            if d.hidedefault:
-                if attrval == attr.default:
-                    continue
-                elif (
-                    hasattr(attr.default, "factory")
-                    and attrval == attr.default.factory()
-                ):
-                    continue
             d_val = d.dump(attrval)
             if isinstance(d_val, dict) and not d_val:
                 continue
-            name = attr.metadata.get("name", attr.name)
-            r[name] = d_val
+            r[field_dumper.dataname] = d_val
 
         return r
 
+    def get_fields_table(type_: type) -> DumperFieldsTable:
+        fields_table = fields_tables.get(type_)
+        if fields_table is None:
+            fields_table = make_dumper_fields_table(type_, platform_type, cache)
+            fields_tables[type_] = fields_table
+        return fields_table
+
+    fields_tables: MutableMapping[type, DumperFieldsTable] = WeakKeyDictionary()
     dumper = datadumper.Dumper(**{})
     dumper.handlers.insert(0, (datadumper.is_attrs, _attrdump))
     dumper.handlers.insert(0, (is_datetime_dumper, lambda _a, v: dump_datetime(v)))
     return dumper
 
 
-def get_loader(
-    platform_type: PlatformType,
-) -> Callable[[Dict[str, Any], Optional[Dict[str, Any]], type], Entity_T]:
+def get_loader(platform_type: PlatformType) -> EntityLoader:
     def _namedtupleload_wrapper(orig_values, l, value, t):
         entity = dataloader._namedtupleload(l, value, t)
         try:
@@ -159,71 +309,33 @@ def get_loader(
             raise dataloader.TypedloadTypeError(
                 "Expected dictionary, got %s" % type(value), type_=type_, value=value
             )
+        fields_table = get_fields_table(type_)
         value = value.copy()
         orig_values = value.copy()
-        names = []
-        defaults = {}
-        types = {}
-        for attribute in type_.__attrs_attrs__:
-            read_only = attribute.metadata.get("readOnly", False)
-            write_only = attribute.metadata.get("writeOnly", False)
-            if read_only and platform_type == PlatformType.K8S:
-                # Don't load attribute from K8S in read only mode even if
-                # it's defined
-                continue
-            elif write_only and platform_type == PlatformType.APPGATE:
-                # Don't load attribute from APPGATE in read only mode even if
-                # it's defined
-                continue
-            names.append(attribute.name)
-            types[attribute.name] = attribute.type
-            defaults[attribute.name] = attribute.default
-
+        for field_loader in fields_table.fields_loaders:
             # Manage name mangling
-            if "name" in attribute.metadata:
-                dataname = attribute.metadata["name"]
-                pyname = attribute.name
-
-                if dataname in value:
-                    tmp = value[dataname]
-                    del value[dataname]
-                    value[pyname] = tmp
-
+            if field_loader.dataname in value:
+                value[field_loader.name] = value.pop(field_loader.dataname)
             # Custom loading values
             try:
-                if (
-                    platform_type == PlatformType.K8S
-                    and "k8s_loader" in attribute.metadata
-                ):
-                    cls: Iterable[CustomLoader] = attribute.metadata[
-                        K8S_LOADERS_FIELD_NAME
-                    ]
-                    for cl in cls:
-                        if isinstance(cl, CustomAttribLoader):
-                            value = cl.load(value)
-                elif (
-                    platform_type == PlatformType.APPGATE
-                    and "appgate_loader" in attribute.metadata
-                ):
-                    cls: Iterable[CustomLoader] = attribute.metadata[
-                        APPGATE_LOADERS_FIELD_NAME
-                    ]
-                    for cl in cls:
-                        if isinstance(cl, CustomAttribLoader):
-                            value = cl.load(value)
+                for cl in field_loader.loaders:
+                    value = cl.load(value)
             except Exception as e:
                 raise TypedloadException(str(e))
+        return _namedtupleload_wrapper(orig_values, l, value, fields_table.fields)
 
-        t = dataloader._FakeNamedTuple(
-            (
-                tuple(names),
-                types,
-                defaults,
-                type_,
-            )
-        )
-        return _namedtupleload_wrapper(orig_values, l, value, t)
+    def get_fields_table(type_: type) -> LoaderFieldsTable:
+        fields_table = fields_tables.get(type_)
+        if fields_table is None:
+            fields_table = make_loader_fields_table(type_, platform_type)
+            fields_tables[type_] = fields_table
+        return fields_table
+
+    def compile(entity: type) -> None:
+        for type_ in attrs_types(entity):
+            get_fields_table(type_)
 
+    fields_tables: MutableMapping[type, LoaderFieldsTable] = WeakKeyDictionary()
     loader = dataloader.Loader(**{})
     loader.handlers.insert(0, (dataloader.is_attrs, _attrload))
     loader.handlers.insert(0, (is_datetime_loader, lambda _1, v, _2: parse_datetime(v)))
@@ -258,12 +370,25 @@ def get_loader(
             ) from None
 
     if platform_type == PlatformType.K8S:
-        return load
-    return lambda data, _, entity: load(data, None, entity)
+        return EntityLoader(load=load, compile=compile)
+    return EntityLoader(
+        load=lambda data, _, entity: load(data, None, entity), compile=compile
+    )
 
 
-K8S_LOADER = EntityLoader(load=get_loader(PlatformType.K8S))
+K8S_LOADER = get_loader(PlatformType.K8S)
 K8S_DUMPER = EntityDumper(dump=get_dumper(PlatformType.K8S).dump)
-APPGATE_LOADER = EntityLoader(load=get_loader(PlatformType.APPGATE))
+APPGATE_LOADER = get_loader(PlatformType.APPGATE)
 APPGATE_DUMPER = EntityDumper(dump=get_dumper(PlatformType.APPGATE).dump)
 DIFF_DUMPER = EntityDumper(dump=get_dumper(PlatformType.DIFF).dump)
+CACHE_DUMPER = EntityDumper(dump=get_dumper(PlatformType.APPGATE, cache=True).dump)
+
+
+def compile_loaders(entities: Iterable[type]) -> None:
+    """
+    Build the loaders fields tables for the generated classes (and the classes
+    reachable from them) so the first load of an entity does not pay for it.
+    """
+    for entity in entities:
+        K8S_LOADER.compile(entity)
+        APPGATE_LOADER.compile(entity)
@@ -1,21 +1,41 @@
 import asyncio
 import datetime
+import hashlib
+import json
 import ssl
 import uuid
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, Any, Optional, List, Callable, Union
+from typing import (
+    Dict,
+    Any,
+    Optional,
+    List,
+    Callable,
+    Union,
+    AsyncIterator,
+    Tuple,
+    Mapping,
+    Set,
+)
 import aiohttp
 from aiohttp import InvalidURL, ClientConnectorCertificateError, ClientConnectorError
-from kubernetes.client import CoreV1Api, V1ConfigMap, V1ObjectMeta
+from kubernetes.client import CoreV1Api, V1ConfigMap, V1ObjectMeta, Configuration
 from kubernetes.client.exceptions import ApiException
 
 from appgate.attrs import APPGATE_DUMPER, APPGATE_LOADER, parse_datetime, dump_datetime
 from appgate.logger import log
 from appgate.openapi.types import Entity_T, AppgateException
-from appgate.types import LatestEntityGeneration
+from appgate.types import EntitiesVersion, LatestEntityGeneration
 
 
-__all__ = ["AppgateClient", "EntityClient", "K8SConfigMapClient", "entity_unique_id"]
+__all__ = [
+    "AppgateClient",
+    "EntityClient",
+    "K8SConfigMapClient",
+    "K8SWatchClient",
+    "entity_unique_id",
+]
 
 
 class EntityClient:
@@ -27,6 +47,7 @@ class EntityClient:
         load: Callable[[Dict[str, Any]], Entity_T],
         dump: Callable[[Entity_T], Dict[str, Any]],
         magic_entities: Optional[List[Entity_T]] = None,
+        page_size: int = 0,
     ) -> None:
         self._client = appgate_client
         self.path = path
@@ -34,9 +55,113 @@ class EntityClient:
         self.dump = dump
         self.singleton = singleton
         self.magic_entities = magic_entities
+        # Number of entities read per request, 0 to read all of them at once
+        self.page_size = page_size
 
     async def get(self) -> Optional[List[Entity_T]]:
         data = await self._client.get(self.path)
+        return self._load_entities(data)
+
+    async def get_if_changed(
+        self, version: Optional[EntitiesVersion] = None
+    ) -> Tuple[Optional[List[Entity_T]], Optional[EntitiesVersion]]:
+        """
+        Same as get but without entities when they did not change since
+        version. The version returned is None when the entities could not
+        be read.
+        """
+        if self.page_size and not self.singleton:
+            return await self._get_pages_if_changed(version)
+        data, new_version = await self._client.get_if_changed(self.path, version)
+        if version is not None and new_version.checksum == version.checksum:
+            return None, new_version
+        entities = self._load_entities(data)
+        return entities, new_version if entities is not None else None
+
+    async def _get_pages_if_changed(
+        self, version: Optional[EntitiesVersion] = None
+    ) -> Tuple[Optional[List[Entity_T]], Optional[EntitiesVersion]]:
+        checksum = hashlib.sha256()
+        entities: List[Entity_T] = []
+        async for body, page in self.pages():
+            if not body.strip():
+                log.error(
+                    "[aggpate-client] GET %s :: Expecting a response but we got empty data",
+                    self.path,
+                )
+                return None, None
+            checksum.update(body)
+            entities.extend(page)
+        new_version = EntitiesVersion(checksum=checksum.hexdigest())
+        if version is not None and new_version.checksum == version.checksum:
+            return None, new_version
+        if self.magic_entities:
+            entities.extend(self.magic_entities)
+        return entities, new_version
+
+    async def pages(self) -> AsyncIterator[Tuple[bytes, List[Entity_T]]]:
+        """
+        Reads the entities page_size at a time with the range list parameter,
+        ordered by id so the pages do not shift while they are read, yielding
+        the response and the entities of each page. The next page is
+        requested before the current one is loaded. It stops on a short page
+        or once the total of the response range is read. A page without new
+        entities before that means that the controller ignores the range,
+        AppgateException is raised since the entities can not be read.
+        """
+        start = 0
+        ids: Set[str] = set()
+        next_page: Optional[asyncio.Task] = asyncio.create_task(
+            self._client.get_page(self.path, start, self.page_size)
+        )
+        try:
+            while next_page is not None:
+                body, data = await next_page
+                next_page = None
+                items = (data or {}).get("data") or []
+                if items and all(e.get("id") in ids for e in items):
+                    log.error(
+                        "[aggpate-client] GET %s :: Got the same entities again from %s",
+                        self.path,
+                        start,
+                    )
+                    raise AppgateException(
+                        f"Unable to read {self.path} page by page, the total "
+                        f"number of entities can not be determined"
+                    )
+                ids.update(e["id"] for e in items if e.get("id") is not None)
+                start += len(items)
+                total = parse_range_total((data or {}).get("range"))
+                if len(items) >= self.page_size and (total is None or start < total):
+                    next_page = asyncio.create_task(
+                        self._client.get_page(self.path, start, self.page_size)
+                    )
+                yield body, [self.load(e) for e in items]
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+                await asyncio.gather(next_page, return_exceptions=True)
+
+    async def get_latest(self) -> Optional[Tuple[int, Optional[Entity_T]]]:
+        """
+        Number of entities in the controller and the last one updated, read
+        with a page of one entity ordered by updated. None for singletons and
+        when the controller does not report the number of entities.
+        """
+        if self.singleton:
+            return None
+        _, data = await self._client.get_page(
+            self.path, 0, 1, order_by="updated", descending=True
+        )
+        total = parse_range_total((data or {}).get("range"))
+        if total is None:
+            return None
+        items = (data or {}).get("data") or []
+        return total, self.load(items[0]) if items else None
+
+    def _load_entities(
+        self, data: Optional[Dict[str, Any]]
+    ) -> Optional[List[Entity_T]]:
         if not data:
             log.error(
                 "[aggpate-client] GET %s :: Expecting a response but we got empty data",
@@ -92,6 +217,18 @@ class EntityClient:
         return True
 
 
+def parse_range_total(value: Any) -> Optional[int]:
+    """
+    Total number of entities from the range of a list response: start-end/total
+    """
+    if not isinstance(value, str) or "/" not in value:
+        return None
+    try:
+        return int(value.rsplit("/", maxsplit=1)[1])
+    except ValueError:
+        return None
+
+
 def load_latest_entity_generation(key: str, value: str) -> LatestEntityGeneration:
     try:
         generation, modified = value.split(",", maxsplit=2)
@@ -116,7 +253,7 @@ def entity_unique_id(entity_type: str, name: str) -> str:
 
 
 class K8SConfigMapClient:
-    def __init__(self, namespace: str, name: str) -> None:
+    def __init__(self, namespace: str, name: str, max_batch_size: int = 500) -> None:
         self._v1 = CoreV1Api()
         self._configmap_mt: Optional[V1ObjectMeta] = None
         self.namespace = namespace
@@ -124,6 +261,11 @@ class K8SConfigMapClient:
         # Store configmap data locally as a key-value store of strings,
         # convert to and from higher level types at the boundaries.
         self._data: Dict[str, str] = {}
+        # Entries waiting to be written while batching, None when not batching.
+        # A None value means that the entry needs to be deleted.
+        self._batch: Optional[Dict[str, Optional[str]]] = None
+        # Maximum number of entries written in a single patch
+        self.max_batch_size = max_batch_size
 
     async def init(self) -> None:
         log.info(
@@ -151,15 +293,13 @@ class K8SConfigMapClient:
     def _device_id_key() -> str:
         return "device-id"
 
-    async def _patch_key(
-        self, key: str, value: Optional[str]
+    async def _patch_keys(
+        self, data: Dict[str, Optional[str]]
     ) -> Optional[V1ObjectMeta]:
         body = V1ConfigMap(
             api_version="v1",
             kind="ConfigMap",
-            data={
-                key: value,
-            },
+            data=data,
         )
         configmap = await asyncio.to_thread(
             self._v1.patch_namespaced_config_map,
@@ -169,12 +309,96 @@ class K8SConfigMapClient:
         )
         return configmap.metadata
 
+    async def _patch_key(
+        self, key: str, value: Optional[str]
+    ) -> Optional[V1ObjectMeta]:
+        return await self._patch_keys({key: value})
+
+    async def _write_key(self, key: str, value: Optional[str]) -> None:
+        if self._batch is not None:
+            self._batch[key] = value
+            return
+        self._configmap_mt = await self._patch_key(key, value)
+
+    async def _flush(
+        self, batch: Dict[str, Optional[str]], original: Dict[str, str]
+    ) -> None:
+        """
+        Write the batch entries. When a write fails the entries not written
+        get back the values they had in original, so _data matches the
+        configmap again.
+        """
+        keys = list(batch.keys())
+        for i in range(0, len(keys), self.max_batch_size):
+            chunk = {k: batch[k] for k in keys[i : i + self.max_batch_size]}
+            try:
+                self._configmap_mt = await self._patch_keys(chunk)
+            except ApiException as e:
+                log.error(
+                    "[k8s-configmap-client/%s/%s] Unable to write entity generations: %s",
+                    self.name,
+                    self.namespace,
+                    ", ".join(keys[i:]),
+                )
+                for k in keys[i:]:
+                    if k in original:
+                        self._data[k] = original[k]
+                    else:
+                        self._data.pop(k, None)
+                raise AppgateException(f"Error writing configmap: {e.body}")
+        log.info(
+            "[k8s-configmap-client/%s/%s] Written %s entity generations",
+            self.name,
+            self.namespace,
+            len(keys),
+        )
+
+    @asynccontextmanager
+    async def batch(self) -> AsyncIterator["K8SConfigMapClient"]:
+        """
+        Batch the writes of entity generations done inside the context and
+        write them as a single merged patch (or a few of them when there are
+        more than max_batch_size entries) when the context exits, even if it
+        exits with an exception.
+
+        Generations are updated in memory right away so reads inside the
+        context see them. If writing the batch fails the entries not written
+        are restored in memory to their values before the batch and
+        AppgateException is raised, unless the context already exited with an
+        exception: that one is raised instead and the write error is only
+        logged. The same as when the operator dies before the batch is written,
+        entities with secrets whose generations were not written look changed
+        and are applied again on the next plan, the other entities are
+        compared by their fields as usual.
+        """
+        if self._batch is not None:
+            # Nested batch, the outermost one writes the entries
+            yield self
+            return
+        self._batch = {}
+        original = dict(self._data)
+        try:
+            yield self
+        except BaseException:
+            batch, self._batch = self._batch, None
+            if batch:
+                try:
+                    await self._flush(batch, original)
+                except AppgateException as e:
+                    log.error(
+                        "[k8s-configmap-client/%s/%s] %s",
+                        self.name,
+                        self.namespace,
+                        e,
+                    )
+            raise
+        batch, self._batch = self._batch, None
+        if batch:
+            await self._flush(batch, original)
+
     async def _update_key(self, key: str, value: str) -> Optional[V1ObjectMeta]:
         return await self._patch_key(key, value)
 
-    async def _delete_key(self, key: str) -> Optional[V1ObjectMeta]:
-        return await self._patch_key(key, None)
-
     async def ensure_device_id(self) -> str:
         """
         Try to get the device id from the config map.
@@ -232,7 +456,7 @@ class K8SConfigMapClient:
             key,
             gen,
         )
-        self._configmap_mt = await self._update_key(entry_key, gen)
+        await self._write_key(entry_key, gen)
         return entry
 
     async def delete_entity_generation(
@@ -251,10 +475,194 @@ class K8SConfigMapClient:
             self.namespace,
             key,
         )
-        self._configmap_mt = await self._delete_key(entry_key)
+        await self._write_key(entry_key, None)
         return entry
 
 
+class K8SWatchClient:
+    """
+    Client to watch kubernetes custom objects from the event loop.
+    All the watches share the same aiohttp session and use the kubernetes
+    configuration already loaded (in cluster or from kubeconfig).
+    """
+
+    def __init__(self, configuration: Optional[Configuration] = None) -> None:
+        self.configuration = configuration or Configuration.get_default_copy()
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self) -> "K8SWatchClient":
+        # Watches are long-lived so there is no limit on connections nor timeout
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(ssl=self._ssl_context(), limit=0),
+            timeout=aiohttp.ClientTimeout(total=None),
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._session:
+            await self._session.close()
+        self._session = None
+
+    def _ssl_context(self) -> ssl.SSLContext:
+        ssl_context = ssl.create_default_context(cafile=self.configuration.ssl_ca_cert)
+        if not self.configuration.verify_ssl:
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        if self.configuration.cert_file:
+            ssl_context.load_cert_chain(
+                self.configuration.cert_file, self.configuration.key_file
+            )
+        return ssl_context
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Accept": "application/json"}
+        # Tokens can be refreshed so get them for every request
+        for auth in self.configuration.auth_settings().values():
+            if auth["in"] == "header" and auth["value"]:
+                headers[auth["key"]] = auth["value"]
+        return headers
+
+    @staticmethod
+    async def _lines(response: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        buffer = b""
+        async for chunk in response.content.iter_any():
+            buffer += chunk
+            if b"\n" not in chunk:
+                continue
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield line
+        if buffer.strip():
+            yield buffer
+
+    @staticmethod
+    async def _raise_for_status(response: aiohttp.ClientResponse) -> None:
+        if response.status != 200:
+            e = ApiException(status=response.status, reason=response.reason)
+            e.body = await response.text()
+            raise e
+
+    async def _list(self, url: str) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        Lists the objects in url, returns them and the resource version to
+        watch them from.
+        """
+        assert self._session
+        async with self._session.get(
+            url, headers=self._headers(), proxy=self.configuration.proxy
+        ) as response:
+            await self._raise_for_status(response)
+            data = await response.json(content_type=None)
+        kind = data.get("kind", "").removesuffix("List")
+        items = data.get("items") or []
+        for item in items:
+            item.setdefault("kind", kind)
+        return items, data["metadata"]["resourceVersion"]
+
+    @staticmethod
+    def _track(objects: Dict[str, Dict[str, Any]], event: Dict[str, Any]) -> bool:
+        """
+        Registers the object in the event in objects. Returns False if the
+        event is a replay of a known object whose spec did not change.
+        """
+        obj = event["object"]
+        name = obj["metadata"]["name"]
+        if event["type"] == "DELETED":
+            objects.pop(name, None)
+            return True
+        known = objects.get(name)
+        objects[name] = obj
+        return known is None or (
+            known.get("spec"),
+            known["metadata"].get("generation"),
+        ) != (obj.get("spec"), obj["metadata"].get("generation"))
+
+    async def watch(
+        self, group: str, version: str, namespace: str, plural: str
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Watches the custom objects in namespace, yielding the events as dicts
+        with type and object keys.
+        When the server closes the watch it is resumed from the last resource
+        version seen (bookmarks included). If that resource version is too
+        old (410 Gone) the objects are listed again and the watch continues
+        from the list, yielding only the changes missed in between.
+        Events for known objects whose spec did not change are not yielded.
+        """
+        if not self._session:
+            raise AppgateException("K8SWatchClient needs to be used as a context")
+        url = (
+            f"{self.configuration.host}/apis/{group}/{version}"
+            f"/namespaces/{namespace}/{plural}"
+        )
+        # Last object seen for each name
+        objects: Dict[str, Dict[str, Any]] = {}
+        resource_version: Optional[str] = None
+        while True:
+            params = {"watch": "true", "allowWatchBookmarks": "true"}
+            if resource_version is not None:
+                params["resourceVersion"] = resource_version
+            expired = False
+            async with self._session.get(
+                url,
+                params=params,
+                headers=self._headers(),
+                proxy=self.configuration.proxy,
+            ) as response:
+                if response.status == 410:
+                    expired = True
+                else:
+                    await self._raise_for_status(response)
+                    async for line in self._lines(response):
+                        event = json.loads(line)
+                        obj = event["object"]
+                        if event["type"] == "ERROR":
+                            if obj.get("code") == 410:
+                                expired = True
+                                break
+                            raise ApiException(
+                                status=obj.get("code"),
+                                reason=f'{obj.get("reason")}: {obj.get("message")}',
+                            )
+                        resource_version = obj.get("metadata", {}).get(
+                            "resourceVersion", resource_version
+                        )
+                        if event["type"] != "BOOKMARK" and self._track(objects, event):
+                            yield event
+            if expired:
+                log.info(
+                    "[k8s-watch-client/%s] Resource version %s for %s expired, listing",
+                    namespace,
+                    resource_version,
+                    plural,
+                )
+                items, resource_version = await self._list(url)
+                names = set()
+                for item in items:
+                    name = item["metadata"]["name"]
+                    names.add(name)
+                    event = {
+                        "type": "MODIFIED" if name in objects else "ADDED",
+                        "object": item,
+                    }
+                    if self._track(objects, event):
+                        yield event
+                for name in set(objects) - names:
+                    event = {"type": "DELETED", "object": objects[name]}
+                    self._track(objects, event)
+                    yield event
+
+
+# Seconds an idle connection to the controller is kept open
+KEEPALIVE_TIMEOUT = 120
+# Seconds the controller address is cached
+DNS_CACHE_TTL = 300
+LOGIN_PATH = "admin/login"
+# The token is renewed when it is about to expire
+TOKEN_RENEW_MARGIN = datetime.timedelta(minutes=5)
+
+
 class AppgateClient:
     def __init__(
         self,
@@ -266,20 +674,43 @@ class AppgateClient:
         device_id: str,
         no_verify: bool = False,
         cafile: Optional[Path] = None,
+        page_size: int = 0,
+        parallelism: int = 8,
     ) -> None:
         self.controller = controller
         self.user = user
         self.password = password
         self.provider = provider
-        self._session = aiohttp.ClientSession()
         self.device_id = device_id
-        self._token = None
+        self._token: Optional[str] = None
+        self._token_expires: Optional[datetime.datetime] = None
+        # Only one login at a time, requests waiting for it reuse its token
+        self._login_lock = asyncio.Lock()
         self.version = version
         self.no_verify = no_verify
-        self.ssl_context = (
-            ssl.create_default_context(cafile=str(cafile)) if cafile else None
+        self.page_size = page_size
+        # Built once and shared by all the connections
+        self.ssl_context = self._ssl_context(cafile, no_verify)
+        # Connections are kept alive between requests, and between reconcile
+        # cycles when the client is long-lived, to save TCP and TLS handshakes
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                ssl=self.ssl_context,
+                limit=parallelism,
+                limit_per_host=parallelism,
+                keepalive_timeout=KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=DNS_CACHE_TTL,
+            )
         )
 
+    @staticmethod
+    def _ssl_context(cafile: Optional[Path], no_verify: bool) -> ssl.SSLContext:
+        ssl_context = ssl.create_default_context(cafile=str(cafile) if cafile else None)
+        if no_verify:
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        return ssl_context
+
     async def close(self) -> None:
         await self._session.close()
 
@@ -302,6 +733,50 @@ class AppgateClient:
     async def request(
         self, verb: str, path: str, data: Optional[Dict[str, Any]] = None
     ) -> Optional[Dict[str, Any]]:
+        status, _, body = await self._request(verb, path, data)
+        if status == 204:
+            return {}
+        return json.loads(body) if body.strip() else None
+
+    async def _request(
+        self,
+        verb: str,
+        path: str,
+        data: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, Mapping[str, str], bytes]:
+        """
+        Makes the request and returns the status, headers and body of the
+        response. Raises AppgateException unless the status is 2xx or 304.
+        The token is renewed before it expires, and when the controller
+        rejects it the request is retried once with a new one.
+        """
+        if path == LOGIN_PATH:
+            return await self._send(verb, path, data, headers, retry=False)
+        if self._token_expiring():
+            await self._renew_token(self._token)
+        token = self._token
+        status, resp_headers, body = await self._send(verb, path, data, headers)
+        if status == 401:
+            log.info("[appgate-client] Token rejected by the controller, logging in")
+            await self._renew_token(token)
+            status, resp_headers, body = await self._send(
+                verb, path, data, headers, retry=False
+            )
+        return status, resp_headers, body
+
+    async def _send(
+        self,
+        verb: str,
+        path: str,
+        data: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        retry: bool = True,
+    ) -> Tuple[int, Mapping[str, str], bytes]:
+        """
+        Makes the request, a 401 is returned instead of raised if it can be
+        retried.
+        """
         verbs = {
             "POST": self._session.post,
             "DELETE": self._session.delete,
@@ -314,6 +789,7 @@ class AppgateClient:
         headers = {
             "Accept": f"application/vnd.appgate.peer-v{self.version}+json",
             "Content-Type": "application/json",
+            **(headers or {}),
         }
         auth_header = self.auth_header()
         if auth_header:
@@ -324,15 +800,12 @@ class AppgateClient:
                 url=url,  # type: ignore
                 headers=headers,
                 json=data,
-                ssl=self.ssl_context,
-                verify_ssl=not self.no_verify,
             ) as resp:
                 status_code = resp.status // 100
-                if status_code == 2:
-                    if resp.status == 204:
-                        return {}
-                    else:
-                        return await resp.json()
+                if status_code == 2 or resp.status == 304:
+                    return resp.status, resp.headers, await resp.read()
+                elif resp.status == 401 and retry:
+                    return resp.status, resp.headers, await resp.read()
                 else:
                     error_data = await resp.text()
                     log.error(
@@ -367,6 +840,43 @@ class AppgateClient:
     async def get(self, path: str) -> Optional[Dict[str, Any]]:
         return await self.request("GET", path=path)
 
+    async def get_page(
+        self,
+        path: str,
+        start: int,
+        size: int,
+        order_by: str = "id",
+        descending: bool = False,
+    ) -> Tuple[bytes, Optional[Dict[str, Any]]]:
+        """
+        GET the size entities in path from start ordered by order_by, returns
+        the response and the data read.
+        """
+        query = f"range={start}-{start + size}&orderBy={order_by}"
+        if descending:
+            query = f"{query}&descending=true"
+        _, _, body = await self._request("GET", f"{path}?{query}")
+        return body, json.loads(body) if body.strip() else None
+
+    async def get_if_changed(
+        self, path: str, version: Optional[EntitiesVersion] = None
+    ) -> Tuple[Optional[Dict[str, Any]], EntitiesVersion]:
+        """
+        GET path unless the response did not change since version: the
+        controller answers 304 to the ETag or the response has the same
+        checksum. Returns None in that case and the version of the response.
+        """
+        headers = {"If-None-Match": version.etag} if version and version.etag else {}
+        status, resp_headers, body = await self._request("GET", path, headers=headers)
+        if status == 304 and version is not None:
+            return None, version
+        new_version = EntitiesVersion(
+            etag=resp_headers.get("ETag"), checksum=hashlib.sha256(body).hexdigest()
+        )
+        if version is not None and version.checksum == new_version.checksum:
+            return None, new_version
+        return json.loads(body) if body.strip() else None, new_version
+
     async def put(
         self, path: str, body: Optional[Dict[str, Any]] = None
     ) -> Optional[Dict[str, Any]]:
@@ -384,9 +894,32 @@ class AppgateClient:
             "password": self.password,
             "deviceId": self.device_id,
         }
-        resp = await self.post("admin/login", body=body)
+        resp = await self.post(LOGIN_PATH, body=body)
         if resp:
             self._token = resp["token"]
+            self._token_expires = None
+            if resp.get("expires"):
+                expires = parse_datetime(resp["expires"])
+                if expires.tzinfo is None:
+                    expires = expires.replace(tzinfo=datetime.timezone.utc)
+                self._token_expires = expires
+
+    def _token_expiring(self) -> bool:
+        """
+        Whether the token expires soon and needs to be renewed
+        """
+        if self._token_expires is None:
+            return False
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return self._token_expires - TOKEN_RENEW_MARGIN <= now
+
+    async def _renew_token(self, token: Optional[str]) -> None:
+        """
+        Logs in again unless the token was already renewed by another request
+        """
+        async with self._login_lock:
+            if self._token == token:
+                await self.login()
 
     @property
     def authenticated(self) -> bool:
@@ -407,4 +940,5 @@ class AppgateClient:
             load=lambda d: APPGATE_LOADER.load(d, None, entity),
             dump=lambda e: dumper.dump(e),
             magic_entities=magic_entities,
+            page_size=self.page_size,
         )
@@ -0,0 +1,241 @@
+import bisect
+import difflib
+import json
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+)
+
+from attr import attrib, attrs
+
+
+__all__ = [
+    "FieldChange",
+    "diff_dumps",
+    "unified_diff",
+]
+
+
+FieldChangeOp = Literal["add", "remove", "change"]
+OpCode = Tuple[str, int, int, int, int]
+
+
+@attrs(frozen=True, slots=True)
+class FieldChange:
+    """
+    A field that differs between two dumped entities. path is the list of
+    keys to the field in the dump, current or expected are None when the
+    field is missing on that side.
+    """
+
+    path: Tuple[str, ...] = attrib()
+    op: FieldChangeOp = attrib()
+    current: Any = attrib(default=None)
+    expected: Any = attrib(default=None)
+
+    def __str__(self) -> str:
+        return ".".join(self.path) or "."
+
+
+def diff_dumps(
+    current: Any, expected: Any, path: Tuple[str, ...] = ()
+) -> List[FieldChange]:
+    """
+    Field level differences between two dumped entities. Equal subtrees are
+    skipped without being walked, dicts are compared key by key and any other
+    value (lists included) is compared as a whole.
+    """
+    if current == expected:
+        return []
+    if not (isinstance(current, dict) and isinstance(expected, dict)):
+        return [FieldChange(path=path, op="change", current=current, expected=expected)]
+    changes = []
+    for k, v in current.items():
+        if k not in expected:
+            changes.append(FieldChange(path=path + (k,), op="remove", current=v))
+        else:
+            changes.extend(diff_dumps(v, expected[k], path + (k,)))
+    for k, v in expected.items():
+        if k not in current:
+            changes.append(FieldChange(path=path + (k,), op="add", expected=v))
+    return changes
+
+
+CONTAINER_TYPES: FrozenSet[type] = frozenset({dict, list, tuple})
+
+
+def _count_lines(value: Any) -> int:
+    """
+    Number of lines of json.dumps(value, indent=4)
+    """
+    if isinstance(value, dict):
+        values: Collection[Any] = value.values()
+    elif isinstance(value, (list, tuple)):
+        values = value
+    else:
+        return 1
+    if not values:
+        return 1
+    # brackets plus a line per value, nested containers add their own lines
+    n = 2 + len(values)
+    if CONTAINER_TYPES.isdisjoint(map(type, values)):
+        return n
+    for v in values:
+        if isinstance(v, (dict, list, tuple)):
+            n += _count_lines(v) - 1
+    return n
+
+
+class _DumpLines:
+    """
+    Lines of json.dumps(dump, indent=4) split in blocks: the opening brace,
+    one block per top level field and the closing brace. The lines of a block
+    are only serialized when they are read.
+    """
+
+    def __init__(self, dump: Dict[str, Any]) -> None:
+        self.items = list(dump.items())
+        last = len(self.items) - 1
+        # Compact json (C encoder) identifies a block, without indenting it
+        compact_values = [json.dumps(v) for _, v in self.items]
+        self.block_ids: List[Hashable] = [
+            (k, compact_value, i < last)
+            for i, ((k, _), compact_value) in enumerate(zip(self.items, compact_values))
+        ]
+        self.offsets = [0, 1]
+        for _, v in self.items:
+            self.offsets.append(self.offsets[-1] + _count_lines(v))
+        self.offsets.append(self.offsets[-1] + 1)
+        if self.items:
+            self.block_ids = ["{", *self.block_ids, "}"]
+        else:
+            # json.dumps({}) is a single line
+            self.block_ids = ["{}"]
+            self.offsets = [0, 1]
+        self.blocks: Dict[int, List[str]] = {}
+
+    def block(self, i: int) -> List[str]:
+        if i not in self.blocks:
+            if not self.items:
+                self.blocks[i] = ["{}"]
+            elif i == 0:
+                self.blocks[i] = ["{\n"]
+            elif i == len(self.items) + 1:
+                self.blocks[i] = ["}"]
+            else:
+                k, v = self.items[i - 1]
+                lines = [
+                    f"{line}\n"
+                    for line in json.dumps({k: v}, indent=4).splitlines()[1:-1]
+                ]
+                if i < len(self.items):
+                    lines[-1] = f"{lines[-1][:-1]},\n"
+                self.blocks[i] = lines
+        return self.blocks[i]
+
+    def __getitem__(self, lines: slice) -> List[str]:
+        start, stop = lines.start or 0, lines.stop
+        i = bisect.bisect_right(self.offsets, start) - 1
+        r: List[str] = []
+        while start < stop:
+            block = self.block(i)
+            r.extend(block[start - self.offsets[i] : stop - self.offsets[i]])
+            start = self.offsets[i + 1]
+            i += 1
+        return r
+
+
+class _BlocksMatcher(difflib.SequenceMatcher):
+    """
+    SequenceMatcher over the lines of two dumps that first matches whole top
+    level blocks and only compares lines inside the blocks that changed.
+    """
+
+    def __init__(self, a: _DumpLines, b: _DumpLines) -> None:
+        super().__init__(None, a.block_ids, b.block_ids)
+        self.a_lines = a
+        self.b_lines = b
+        self.line_opcodes: Optional[List[OpCode]] = None
+
+    def get_opcodes(self) -> List[OpCode]:
+        if self.line_opcodes is not None:
+            return self.line_opcodes
+        line_opcodes: List[OpCode] = []
+        for tag, i1, i2, j1, j2 in super().get_opcodes():
+            a1, a2 = self.a_lines.offsets[i1], self.a_lines.offsets[i2]
+            b1, b2 = self.b_lines.offsets[j1], self.b_lines.offsets[j2]
+            if tag == "equal":
+                line_opcodes.append((tag, a1, a2, b1, b2))
+                continue
+            lines_matcher = difflib.SequenceMatcher(
+                None, self.a_lines[a1:a2], self.b_lines[b1:b2], autojunk=False
+            )
+            for t, x1, x2, y1, y2 in lines_matcher.get_opcodes():
+                line_opcodes.append((t, a1 + x1, a1 + x2, b1 + y1, b1 + y2))
+        # Join consecutive opcodes with the same tag, as difflib does
+        self.line_opcodes = []
+        for opcode in line_opcodes:
+            if self.line_opcodes and self.line_opcodes[-1][0] == opcode[0]:
+                tag, i1, _, j1, _ = self.line_opcodes.pop()
+                opcode = (tag, i1, opcode[2], j1, opcode[4])
+            self.line_opcodes.append(opcode)
+        return self.line_opcodes
+
+
+def _format_range(start: int, stop: int) -> str:
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+
+def _unified_diff_lines(
+    a: _DumpLines, b: _DumpLines, groups: Iterable[List[OpCode]]
+) -> Iterator[str]:
+    started = False
+    for group in groups:
+        if not started:
+            started = True
+            yield "--- \n"
+            yield "+++ \n"
+        first, last = group[0], group[-1]
+        yield "@@ -{} +{} @@\n".format(
+            _format_range(first[1], last[2]), _format_range(first[3], last[4])
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield f" {line}"
+                continue
+            if tag in {"replace", "delete"}:
+                for line in a[i1:i2]:
+                    yield f"-{line}"
+            if tag in {"replace", "insert"}:
+                for line in b[j1:j2]:
+                    yield f"+{line}"
+
+
+def unified_diff(current: Dict[str, Any], expected: Dict[str, Any]) -> List[str]:
+    """
+    Unified diff, as difflib.unified_diff with n=1, of the json.dumps(indent=4)
+    lines of both dumps. Unchanged top level fields are matched as a whole so
+    only the lines of the changed fields are compared.
+    """
+    matcher = _BlocksMatcher(_DumpLines(current), _DumpLines(expected))
+    return list(
+        _unified_diff_lines(
+            matcher.a_lines, matcher.b_lines, matcher.get_grouped_opcodes(n=1)
+        )
+    )
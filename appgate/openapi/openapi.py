@@ -1,17 +1,30 @@
+import time
 from pathlib import Path
-from typing import Dict, Optional, Tuple, Type, Callable, Sequence, List
+from typing import (
+    Dict,
+    Optional,
+    Tuple,
+    Type,
+    Callable,
+    Sequence,
+    List,
+    Mapping,
+    Iterator,
+)
 
 import attrs
-import yaml
 
 from apischema import settings
 from apischema.json_schema import deserialization_schema
 from apischema.json_schema.types import JsonType
 from apischema.objects import ObjectField, AliasedStr
 
+from appgate.attrs import compile_loaders
 from appgate.client import AppgateClient, EntityClient
 from appgate.logger import log
 from appgate.openapi.parser import is_compound, Parser, ParserContext
+from appgate.openapi.spec_cache import load_spec_data
+from appgate.yaml import add_representer, safe_dump
 from appgate.openapi.types import (
     APISpec,
     OpenApiParserException,
@@ -19,6 +32,7 @@ from appgate.openapi.types import (
     K8S_APPGATE_DOMAIN,
     K8S_APPGATE_VERSION,
     GeneratedEntity,
+    EntityParseProfile,
     APPGATE_METADATA_ATTRIB_NAME,
     ENTITY_METADATA_ATTRIB_NAME,
 )
@@ -39,26 +53,35 @@ K8S_CRD_KIND = "CustomResourceDefinition"
 LIST_PROPERTIES = {"range", "data", "query", "orderBy", "descending", "filterBy"}
 
 
-def parse_files(
-    spec_entities: Dict[str, str],
-    spec_directory: Optional[Path] = None,
-    spec_file: str = "api_specs.yml",
-    k8s_get_secret: Optional[Callable[[str, str], str]] = None,
-    secrets_key: Optional[str] = None,
-) -> APISpec:
-    parser_context = ParserContext(
-        spec_entities=spec_entities,
-        spec_api_path=spec_directory or Path(SPEC_DIR),
-        secrets_key=secrets_key,
-        k8s_get_secret=k8s_get_secret,
-    )
-    parser = Parser(parser_context, spec_file)
-    # First parse those paths we are interested in
-    for path, v in parser.data["paths"].items():
-        if not parser_context.get_entity_name(path):
-            continue
-        entity_name = spec_entities[path]
+class GeneratedEntities(Mapping[str, GeneratedEntity]):
+    """
+    Entities generated from the spec. An api entity is generated the first time
+    it is accessed, together with its nested entities and the api entities it
+    depends on. Iterating over it generates all the entities.
+    """
+
+    def __init__(self, parser: Parser, paths: Dict[str, str]) -> None:
+        self.parser = parser
+        # Generated entities, nested entities included
+        self.entities = parser.parser_context.entities
+        # Api entities not generated yet and their paths
+        self.pending: Dict[str, str] = paths
+        self.parse_profile: Dict[str, EntityParseProfile] = {}
+
+    def _generate(self, entity_name: str) -> None:
+        """
+        Generates the entity and its nested entities. If that fails the
+        entities registered meanwhile are removed and the entity is still
+        pending, so accessing it again raises the same error.
+        """
+        path = self.pending[entity_name]
+        parser = self.parser
+        parser_context = parser.parser_context
         log.info("Generating entity %s for path %s", entity_name, path)
+        start = time.perf_counter()
+        references_resolved = parser_context.references_resolved
+        references_cached = parser_context.references_cached
+        generated = set(self.entities)
         keys = ["requestBody", "content", "application/json", "schema"]
         # Check if path returns a singleton or a list of entities
         get_schema = parser.get_keys(
@@ -83,11 +106,89 @@ def parse_files(
         singleton = not all(
             map(lambda f: f in parsed_schema.get("properties", {}), LIST_PROPERTIES)
         )
-        parser.parse_definition(
-            entity_name=entity_name,
-            keys=[["paths", path] + ["post"] + keys, ["paths", path] + ["put"] + keys],
-            singleton=singleton,
+        try:
+            parser.parse_definition(
+                entity_name=entity_name,
+                keys=[
+                    ["paths", path] + ["post"] + keys,
+                    ["paths", path] + ["put"] + keys,
+                ],
+                singleton=singleton,
+            )
+            compile_loaders(
+                v.cls for k, v in self.entities.items() if k not in generated
+            )
+        except BaseException:
+            for k in set(self.entities) - generated:
+                del self.entities[k]
+            raise
+        self.parse_profile[entity_name] = EntityParseProfile(
+            seconds=time.perf_counter() - start,
+            references=parser_context.references_resolved - references_resolved,
+            cached_references=parser_context.references_cached - references_cached,
         )
+        del self.pending[entity_name]
+
+    def _generate_all(self) -> None:
+        while self.pending:
+            self._generate(next(iter(self.pending)))
+
+    def __getitem__(self, entity_name: str) -> GeneratedEntity:
+        if self.pending:
+            # The dependencies are checked even when the entity is generated,
+            # generating one of them could have failed before
+            to_generate = [entity_name]
+            visited = set()
+            while to_generate:
+                name = to_generate.pop()
+                if name in visited:
+                    continue
+                visited.add(name)
+                if name in self.pending:
+                    self._generate(name)
+                if name in self.entities:
+                    to_generate.extend(self.entities[name].entity_dependencies)
+        return self.entities[entity_name]
+
+    def __contains__(self, entity_name: object) -> bool:
+        return entity_name in self.pending or entity_name in self.entities
+
+    def __iter__(self) -> Iterator[str]:
+        self._generate_all()
+        return iter(self.entities)
+
+    def __len__(self) -> int:
+        self._generate_all()
+        return len(self.entities)
+
+
+def parse_files(
+    spec_entities: Dict[str, str],
+    spec_directory: Optional[Path] = None,
+    spec_file: str = "api_specs.yml",
+    k8s_get_secret: Optional[Callable[[str, str], str]] = None,
+    secrets_key: Optional[str] = None,
+    spec_cache: Optional[Path] = None,
+) -> APISpec:
+    spec_api_path = spec_directory or Path(SPEC_DIR)
+    parser_context = ParserContext(
+        spec_entities=spec_entities,
+        spec_api_path=spec_api_path,
+        secrets_key=secrets_key,
+        k8s_get_secret=k8s_get_secret,
+    )
+    if spec_cache:
+        parser_context.data.update(load_spec_data(spec_api_path, spec_cache))
+    parser = Parser(parser_context, spec_file)
+    # Only those paths we are interested in, the entities are generated lazily
+    entities = GeneratedEntities(
+        parser,
+        {
+            spec_entities[path]: path
+            for path in parser.data["paths"]
+            if parser_context.get_entity_name(path)
+        },
+    )
 
     # Now parse the API version
     api_version_str = parser.get_keys(["info", "version"])
@@ -97,7 +198,11 @@ def parse_files(
         api_version = api_version_str.split(" ")[2].split(".")[0]
     except IndexError:
         raise OpenApiParserException("Unable to find Appgate API version")
-    return APISpec(entities=parser_context.entities, api_version=api_version)
+    return APISpec(
+        entities=entities,
+        api_version=api_version,
+        parse_profile=entities.parse_profile,
+    )
 
 
 def entity_names(
@@ -274,28 +379,32 @@ def generate_crd(entity: Type, short_names: Dict[str, str], api_version: str) ->
     def str_representer(dumper, data):
         """
         Register representers for types unknown to YAML safe dumper.
+        libyaml only emits exact str values, not str subclasses.
         """
-        return dumper.represent_scalar("tag:yaml.org,2002:str", data)
+        return dumper.represent_scalar("tag:yaml.org,2002:str", str.__str__(data))
 
-    yaml.SafeDumper.add_representer(AliasedStr, str_representer)
-    yaml.SafeDumper.add_representer(JsonType, str_representer)
+    add_representer(AliasedStr, str_representer)
+    add_representer(JsonType, str_representer)
 
-    return yaml.safe_dump(crd)
+    return safe_dump(crd)
 
 
 def generate_api_spec(
     spec_directory: Optional[Path] = None,
     secrets_key: Optional[str] = None,
     k8s_get_secret: Optional[Callable[[str, str], str]] = None,
+    spec_cache: Optional[Path] = None,
 ) -> APISpec:
     """
     Parses openapi yaml files and generates the ApiSpec.
+    When spec_cache is set the parsed yaml files are cached there.
     """
     return parse_files(
         SPEC_ENTITIES,
         spec_directory=spec_directory,
         secrets_key=secrets_key,
         k8s_get_secret=k8s_get_secret,
+        spec_cache=spec_cache,
     )
 
 
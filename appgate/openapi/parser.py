@@ -1,8 +1,18 @@
 import datetime
 from pathlib import Path
-from typing import Optional, Dict, Set, Any, List, Type, FrozenSet, cast, Callable
+from typing import (
+    Optional,
+    Dict,
+    Set,
+    Any,
+    List,
+    Type,
+    FrozenSet,
+    cast,
+    Callable,
+    Tuple,
+)
 
-import yaml
 from attr import attrib, make_class
 from cryptography.fernet import Fernet
 
@@ -53,6 +63,10 @@ from appgate.openapi.utils import (
 )
 from appgate.secrets import PasswordAttribMaker
 from appgate.types import BUILTIN_TAGS
+from appgate.yaml import safe_load
+
+# (namespace, json pointer) of a reference
+Reference = Tuple[str, str]
 
 TYPES_MAP: Dict[str, Type] = {
     "string": str,
@@ -280,6 +294,13 @@ class ParserContext:
             v: k for k, v in spec_entities.items()
         }
         self.k8s_get_secret = k8s_get_secret
+        # References and their resolved definitions by (namespace, json pointer)
+        self.references: Dict[Reference, Any] = {}
+        self.definitions: Dict[Reference, OpenApiDict] = {}
+        # Definitions being resolved, to detect circular references
+        self.resolving: List[Reference] = []
+        self.references_resolved = 0
+        self.references_cached = 0
 
     def get_entity_path(self, entity_name: str) -> Optional[str]:
         return self.entity_path_by_name.get(entity_name)
@@ -304,7 +325,7 @@ class ParserContext:
             return self.data[path.name]
         with path.open("r") as f:
             log.trace("Loading namespace %s from disk", path)
-            self.data[path.name] = yaml.safe_load(f.read())
+            self.data[path.name] = safe_load(f.read())
         return self.data[path.name]
 
 
@@ -316,9 +337,32 @@ class Parser:
         self.data: Dict[str, Any] = parser_context.load_namespace(namespace)
 
     def resolve_reference(self, reference: str, keys: List[str]) -> Dict[str, Any]:
+        """
+        Resolves the reference, followed by keys. Resolved references are
+        cached in the ParserContext, references in the current namespace are
+        only cached when they are found there.
+        """
+        return self._resolve_reference(reference, keys)[0]
+
+    def _resolve_reference(
+        self, reference: str, keys: List[str]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Same as resolve_reference, also returns whether the reference can be
+        cached: False when it was only found in a previous namespace, since
+        it depends on the namespaces seen by this parser.
+        """
         path, ref = reference.split("#", maxsplit=2)
         new_keys = [x for x in ref.split("/") if x] + keys
         key_copy = new_keys.copy()
+        if path:
+            self.previous_namespaces.add(path)
+        cache_key = (path or self.namespace, join("/", new_keys))
+        self.parser_context.references_resolved += 1
+        if cache_key in self.parser_context.references:
+            self.parser_context.references_cached += 1
+            return self.parser_context.references[cache_key], True
+        cache = True
         if not path:
             # Resolve in current namespace
             log.trace(
@@ -328,6 +372,7 @@ class Parser:
             )
             resolved_ref = self.get_keys(new_keys)
             if not resolved_ref:
+                cache = False
                 for previous in self.previous_namespaces:
                     keys = key_copy.copy()
                     resolved_ref = Parser(
@@ -343,10 +388,38 @@ class Parser:
             resolved_ref = Parser(self.parser_context, namespace=path).get_keys(
                 new_keys
             )
-            self.previous_namespaces.add(path)
         if not resolved_ref:
             raise OpenApiParserException(f"Unable to resolve reference {reference}")
-        return resolved_ref
+        if cache:
+            self.parser_context.references[cache_key] = resolved_ref
+        return resolved_ref, cache
+
+    def resolve_reference_definition(self, reference: str) -> OpenApiDict:
+        """
+        Resolves the reference and its definition. The resolved definitions
+        are shared across the ParserContext, except the ones of references
+        only found in a previous namespace.
+        """
+        path, ref = reference.split("#", maxsplit=2)
+        key = (path or self.namespace, join("/", [x for x in ref.split("/") if x]))
+        definitions = self.parser_context.definitions
+        if key in definitions:
+            return definitions[key]
+        resolving = self.parser_context.resolving
+        if key in resolving:
+            cycle = resolving[resolving.index(key) :] + [key]
+            raise OpenApiParserException(
+                "Circular reference: " + " -> ".join(f"{n}#{r}" for n, r in cycle)
+            )
+        resolving.append(key)
+        try:
+            resolved_ref, cache = self._resolve_reference(reference, [])
+            definition = self.resolve_definition(resolved_ref)
+        finally:
+            resolving.pop()
+        if cache:
+            definitions[key] = definition
+        return definition
 
     def get_keys(self, keys: List[str]) -> Optional[Any]:
         keys_cp = keys.copy()
@@ -390,16 +463,12 @@ class Parser:
             definition = self.parse_all_of(definition["allOf"])
         for k, v in definition.items():
             if is_ref(v):
-                resolved = self.resolve_reference(v["$ref"], [])
-                resolved = self.resolve_definition(resolved)
-                definition[k] = resolved
+                definition[k] = self.resolve_reference_definition(v["$ref"])
             elif is_mapping(k, v):
                 for mk, kv in v.items():
-                    resolved = self.resolve_reference(kv, [])
-                    if is_compound(resolved):
-                        resolved = self.parse_all_of(resolved["allOf"])
-                    resolved = self.resolve_definition(resolved)
-                    definition[k][mk] = resolved
+                    # Shared definitions can have their mapping resolved already
+                    if isinstance(kv, str):
+                        definition[k][mk] = self.resolve_reference_definition(kv)
             else:
                 definition[k] = self.resolve_definition(v)
         return definition
@@ -0,0 +1,89 @@
+import contextlib
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import Dict, Optional
+
+from appgate.logger import log
+from appgate.openapi.types import OpenApiDict
+from appgate.yaml import safe_load
+
+
+__all__ = [
+    "spec_checksum",
+    "load_spec_data",
+]
+
+
+SPEC_CACHE_VERSION = 1
+SPEC_FILES_PATTERNS = ("*.yml", "*.yaml")
+
+
+def _spec_files(spec_directory: Path) -> Dict[str, Path]:
+    return {
+        p.name: p
+        for pattern in SPEC_FILES_PATTERNS
+        for p in spec_directory.glob(pattern)
+        if p.is_file()
+    }
+
+
+def spec_checksum(spec_directory: Path) -> str:
+    """
+    sha256 of the names and contents of the spec files in spec_directory.
+    """
+    h = hashlib.sha256(f"{SPEC_CACHE_VERSION}".encode())
+    for name, path in sorted(_spec_files(spec_directory).items()):
+        h.update(name.encode())
+        h.update(b"\0")
+        h.update(path.read_bytes())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _load_spec_cache(path: Path, checksum: str) -> Optional[Dict[str, OpenApiDict]]:
+    try:
+        with path.open("rb") as f:
+            cached_checksum, data = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning("[spec-cache] Unable to read spec cache %s: %s", path, e)
+        return None
+    if cached_checksum != checksum:
+        log.info("[spec-cache] Spec cache %s is outdated, ignoring it", path)
+        return None
+    return data
+
+
+def _save_spec_cache(path: Path, checksum: str, data: Dict[str, OpenApiDict]) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with tmp_path.open("wb") as f:
+            pickle.dump((checksum, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        # Replace the previous cache only once the new one is complete
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning("[spec-cache] Unable to save spec cache %s: %s", path, e)
+        with contextlib.suppress(OSError):
+            tmp_path.unlink()
+
+
+def load_spec_data(spec_directory: Path, cache: Path) -> Dict[str, OpenApiDict]:
+    """
+    Parsed spec files in spec_directory by file name. The parsed files are
+    stored in cache, a pickle keyed by spec_checksum, so they are only parsed
+    again when the spec files change.
+    """
+    checksum = spec_checksum(spec_directory)
+    data = _load_spec_cache(cache, checksum)
+    if data is not None:
+        log.debug("[spec-cache] Using spec cache %s", cache)
+        return data
+    data = {}
+    for name, path in _spec_files(spec_directory).items():
+        with path.open("r") as f:
+            data[name] = safe_load(f.read())
+    _save_spec_cache(cache, checksum, data)
+    return data
@@ -13,6 +13,8 @@ from typing import (
     Set,
     Union,
     Iterator,
+    Iterable,
+    Mapping,
     Tuple,
     Type,
 )
@@ -167,6 +169,8 @@ DumperFunc = Callable[[Entity_T], Dict[str, Any]]
 @attrs()
 class EntityLoader:
     load: LoaderFunc = attrib()
+    # Prepares the loader for a generated class ahead of its first load
+    compile: Callable[[type], None] = attrib(default=lambda entity: None)
 
 
 @attrs()
@@ -324,22 +328,76 @@ class EntityClassGeneratorConfig:
         return properties
 
 
+@attrs(frozen=True, slots=True)
+class EntityParseProfile:
+    """
+    Time spent parsing an api entity, nested entities included, and the
+    references resolved while parsing it.
+    """
+
+    seconds: float = attrib()
+    references: int = attrib()
+    cached_references: int = attrib()
+
+
 @attrs()
 class APISpec:
-    entities: EntitiesDict = attrib()
+    entities: Mapping[str, GeneratedEntity] = attrib()
     api_version: int = attrib()
+    parse_profile: Dict[str, EntityParseProfile] = attrib(factory=dict, eq=False)
 
     @property
-    def entities_sorted(self) -> List[str]:
-        entities_to_sort: Dict[str, Set[str]] = {
+    def entities_graph(self) -> Dict[str, Set[str]]:
+        """
+        Dependency graph of the api entities: entity -> entities it depends on
+        """
+        return {
             entity_name: entity.entity_dependencies
             for entity_name, entity in self.entities.items()
             if entity.api_path is not None
         }
+
+    def entities_dependents(self, entity_names: Iterable[str]) -> Set[str]:
+        """
+        Entities in entity_names plus all the api entities depending on any of
+        them, directly or through other entities.
+        """
+        reverse_graph: Dict[str, Set[str]] = {}
+        for entity_name, dependencies in self.entities_graph.items():
+            for dependency in dependencies:
+                reverse_graph.setdefault(dependency, set()).add(entity_name)
+        dependents = set(entity_names)
+        to_visit = list(dependents)
+        while to_visit:
+            for entity_name in reverse_graph.get(to_visit.pop(), set()):
+                if entity_name not in dependents:
+                    dependents.add(entity_name)
+                    to_visit.append(entity_name)
+        return dependents
+
+    @property
+    def entities_sorted(self) -> List[str]:
+        entities_to_sort = self.entities_graph
         log.trace("Entities to sort %s", entities_to_sort)
         ts = TopologicalSorter(entities_to_sort)
         return list(ts.static_order())
 
+    @property
+    def entities_sorted_waves(self) -> List[List[str]]:
+        """
+        Topological sort of the api entities grouped in waves.
+        Entities in a wave only depend on entities from previous waves so
+        all the entities in the same wave are independent of each other.
+        """
+        ts = TopologicalSorter(self.entities_graph)
+        ts.prepare()
+        waves = []
+        while ts.is_active():
+            wave = sorted(ts.get_ready())
+            waves.append(wave)
+            ts.done(*wave)
+        return waves
+
     @property
     def api_entities(self) -> EntitiesDict:
         return {k: v for k, v in self.entities.items() if v.api_path is not None}
@@ -1,4 +1,4 @@
-import difflib
+import asyncio
 import itertools
 import json
 import re
@@ -18,14 +18,16 @@ from typing import (
     List,
     FrozenSet,
     Iterator,
+    Callable,
+    Awaitable,
 )
 
-import yaml
 from attr import attrib, attrs, evolve
 
 from appgate.logger import is_debug
 from appgate.attrs import K8S_DUMPER, DIFF_DUMPER, dump_datetime
 from appgate.client import EntityClient, K8SConfigMapClient, entity_unique_id
+from appgate.diff import FieldChange, diff_dumps, unified_diff
 from appgate.logger import log
 from appgate.openapi.parser import ENTITY_METADATA_ATTRIB_NAME
 from appgate.openapi.types import (
@@ -39,7 +41,9 @@ from appgate.openapi.types import (
     AppgateException,
 )
 from appgate.types import (
+    DiffMode,
     EntityWrapper,
+    EntitiesVersion,
     EntitiesSet,
     EntityFieldDependency,
     MissingFieldDependencies,
@@ -47,6 +51,7 @@ from appgate.types import (
     is_target,
 )
 from appgate.openapi.utils import has_name
+from appgate.yaml import safe_dump
 
 
 __all__ = [
@@ -56,12 +61,13 @@ __all__ = [
     "create_appgate_plan",
     "appgate_plan_apply",
     "entities_conflict_summary",
-    "appgate_plan_apply",
+    "plan_apply",
     "resolve_field_entity",
     "resolve_field_entities",
     "resolve_appgate_state",
     "compare_entities",
     "compute_diff",
+    "compute_changes",
     "exclude_appgate_entities",
     "exclude_appgate_entity",
 ]
@@ -129,10 +135,12 @@ def dump_entity(
     entity_name = k8s_name(entity.name) if has_name(entity) else k8s_name(entity_type)
     entity_mt = getattr(entity.value, ENTITY_METADATA_ATTRIB_NAME, {})
     singleton = entity_mt.get("singleton", False)
+    # Entities are shared between states, never modify them in place
+    value = entity.value
     if not singleton:
-        entity.value = evolve(
-            entity.value,
-            appgate_metadata=evolve(entity.value.appgate_metadata, uuid=entity.id),
+        value = evolve(
+            value,
+            appgate_metadata=evolve(value.appgate_metadata, uuid=entity.id),
         )
     return {
         "apiVersion": f"{K8S_APPGATE_DOMAIN}/{K8S_APPGATE_VERSION}",
@@ -140,7 +148,7 @@ def dump_entity(
         "metadata": {
             "name": entity_name if entity.is_singleton() else k8s_name(entity.name)
         },
-        "spec": K8S_DUMPER.dump(entity.value),
+        "spec": K8S_DUMPER.dump(value),
     }
 
 
@@ -168,7 +176,7 @@ def dump_entities(
             entity_passwords = appgate_metadata.get(
                 APPGATE_METADATA_PASSWORD_FIELDS_FIELD
             )
-        dumped_entities.append(yaml.safe_dump(dumped_entity, default_flow_style=False))
+        dumped_entities.append(safe_dump(dumped_entity, default_flow_style=False))
     if not dumped_entities:
         return None
     f = dump_file.open("w") if dump_file else sys.stdout
@@ -186,9 +194,14 @@ class AppgateState:
     """
     Class to maintain the state of the Appgate system in memory.
     The state is stored in a dictionary that maps: EntityType -> EntitiesSet
+    It also keeps track of the entity types changed with with_entity so they
+    can be reconciled incrementally.
     """
 
     entities_set: Dict[str, EntitiesSet] = attrib()
+    dirty: Set[str] = attrib(factory=set, eq=False)
+    # Version of the entities read from the controller, by entity type
+    versions: Dict[str, EntitiesVersion] = attrib(factory=dict, eq=False)
 
     def with_entity(
         self,
@@ -207,23 +220,52 @@ class AppgateState:
             log.error("[appgate-operator] Unknown entity type: %s", type(entity))
             return
         entities_op(entities, entity, op, current_entities)
+        self.dirty.add(type(entity.value).__name__)
 
-    def sync_generations(self) -> "AppgateState":
+    def sync_generations(
+        self, entity_names: Optional[Set[str]] = None
+    ) -> "AppgateState":
+        """
+        Syncs the generations of the entities, only for the entity types in
+        entity_names if specified.
+        """
         return AppgateState(
             entities_set={
                 k: EntitiesSet({entity_sync_generation(e) for e in v.entities})
+                if entity_names is None or k in entity_names
+                else v
                 for k, v in self.entities_set.items()
-            }
+            },
+            dirty=set(self.dirty),
+        )
+
+    def snapshot(self) -> "AppgateState":
+        """
+        Returns a copy of the state sharing the entities with this one,
+        see EntitiesSet.snapshot.
+        """
+        return AppgateState(
+            entities_set={k: v.snapshot() for k, v in self.entities_set.items()},
+            dirty=set(self.dirty),
+            versions=dict(self.versions),
         )
 
     def copy(self, entities_set: Dict[str, EntitiesSet]) -> "AppgateState":
+        """
+        Returns a copy of the state with the entities in entities_set replaced,
+        they are not the ones read from the controller anymore so their
+        versions are dropped.
+        """
         new_entities_set = {}
         for k, v in self.entities_set.items():
             if k in entities_set:
                 new_entities_set[k] = entities_set[k]
             else:
                 new_entities_set[k] = v
-        return AppgateState(new_entities_set)
+        return AppgateState(
+            new_entities_set,
+            versions={k: v for k, v in self.versions.items() if k not in entities_set},
+        )
 
     def dump(
         self,
@@ -298,8 +340,46 @@ class Plan:
     not_to_create: EntitiesSet = attrib(factory=EntitiesSet)
     modify: EntitiesSet = attrib(factory=EntitiesSet)
     not_to_modify: EntitiesSet = attrib(factory=EntitiesSet)
-    modifications_diff: Dict[str, List[str]] = attrib(factory=dict)
+    # current entity for each entity to modify, the diffs are computed from
+    # them only when requested
+    modifications: Dict[str, EntityWrapper] = attrib(factory=dict)
     errors: Optional[Set[str]] = attrib(default=None)
+    _modifications_dumps: Dict[str, Tuple[Dict[str, Any], Dict[str, Any]]] = attrib(
+        factory=dict, init=False, repr=False, eq=False
+    )
+
+    def modification_dumps(self, name: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        if name not in self._modifications_dumps:
+            self._modifications_dumps[name] = diff_dumps_entities(
+                self.modifications[name], self.modify.entities_by_name[name]
+            )
+        return self._modifications_dumps[name]
+
+    def modification_diff(self, name: str) -> List[str]:
+        """
+        Diff lines between the current and the expected entity with that name
+        """
+        if name not in self.modifications:
+            return []
+        return unified_diff(*self.modification_dumps(name))
+
+    def modification_changes(self, name: str) -> List[FieldChange]:
+        """
+        Fields changed between the current and the expected entity with that name
+        """
+        if name not in self.modifications:
+            return []
+        return diff_dumps(*self.modification_dumps(name))
+
+    @cached_property
+    def modifications_diff(self) -> Dict[str, List[str]]:
+        diffs = {name: self.modification_diff(name) for name in self.modifications}
+        return {name: diff for name, diff in diffs.items() if diff}
+
+    @cached_property
+    def modifications_changes(self) -> Dict[str, List[FieldChange]]:
+        changes = {name: self.modification_changes(name) for name in self.modifications}
+        return {name: c for name, c in changes.items() if c}
 
     @cached_property
     def expected_entities(self) -> EntitiesSet:
@@ -313,9 +393,9 @@ class Plan:
         entities = merge_entities(
             share=self.share, create=self.create, modify=self.modify, errors=self.errors
         )
-        entities.entities.update(
-            {e for e in self.delete.entities if e.id in (self.errors or set())}
-        )
+        for e in self.delete.entities:
+            if e.id in (self.errors or set()):
+                entities.add(e)
         return entities
 
     @cached_property
@@ -340,14 +420,50 @@ class Plan:
         )
 
 
+def entity_generation_key(entity: EntityWrapper) -> str:
+    """
+    Key used to store the generation of the entity in the configmap
+    """
+    name = "singleton" if entity.is_singleton() else entity.name
+    return entity_unique_id(entity.value.__class__.__name__, name)
+
+
+async def apply_entities(
+    entities: Iterable[EntityWrapper],
+    apply: Callable[[EntityWrapper], Awaitable[Any]],
+    semaphore: asyncio.Semaphore,
+    errors: Set[str],
+) -> None:
+    """
+    Applies concurrently all the entities, the semaphore limits the number
+    of operations in flight. Errors are registered in the errors set.
+    """
+
+    async def _apply(entity: EntityWrapper) -> None:
+        async with semaphore:
+            try:
+                await apply(entity)
+            except Exception as err:
+                errors.add(f"{entity.name} [{entity.id}]: {str(err)}")
+
+    await asyncio.gather(*(_apply(e) for e in entities))
+
+
 # TODO: Save the kind info the wrapper
-async def plan_apply(
+async def plan_apply_upserts(
     plan: Plan,
     namespace: str,
     k8s_configmap_client: K8SConfigMapClient,
+    semaphore: asyncio.Semaphore,
+    errors: Set[str],
     entity_client: Optional[EntityClient] = None,
-) -> Plan:
-    errors = set()
+    diff_mode: DiffMode = "full",
+) -> None:
+    """
+    Applies the entities to create and to modify in the plan.
+    The diff of each modified entity is logged according to diff_mode: all
+    the diff lines (full), the changed fields (summary) or nothing (off).
+    """
     for e in plan.create.entities:
         log.info(
             "[appgate-operator/%s] + %s: %s [%s]",
@@ -356,20 +472,6 @@ async def plan_apply(
             e.name,
             e.id,
         )
-        if entity_client:
-            try:
-                await entity_client.post(e.value)
-                name = (
-                    "singleton"
-                    if e.value._entity_metadata.get("singleton", False)
-                    else e.name
-                )
-                await k8s_configmap_client.update_entity_generation(
-                    key=entity_unique_id(e.value.__class__.__name__, name),
-                    generation=e.value.appgate_metadata.current_generation,
-                )
-            except Exception as err:
-                errors.add(f"{e.name} [{e.id}]: {str(err)}")
     if is_debug():
         for e in plan.not_to_create.entities:
             log.debug(
@@ -388,25 +490,21 @@ async def plan_apply(
             e.name,
             e.id,
         )
-        diff = plan.modifications_diff.get(e.name)
-        if diff:
-            log.info("[appgate-operator/%s]    DIFF for %s:", namespace, e.name)
-            for d in diff:
-                log.info("%s", d.rstrip())
-        if entity_client:
-            try:
-                await entity_client.put(e.value)
-                name = (
-                    "singleton"
-                    if e.value._entity_metadata.get("singleton", False)
-                    else e.name
-                )
-                await k8s_configmap_client.update_entity_generation(
-                    key=entity_unique_id(e.value.__class__.__name__, name),
-                    generation=e.value.appgate_metadata.current_generation,
+        if diff_mode == "full":
+            diff = plan.modification_diff(e.name)
+            if diff:
+                log.info("[appgate-operator/%s]    DIFF for %s:", namespace, e.name)
+                for d in diff:
+                    log.info("%s", d.rstrip())
+        elif diff_mode == "summary":
+            changes = plan.modification_changes(e.name)
+            if changes:
+                log.info(
+                    "[appgate-operator/%s]    CHANGED for %s: %s",
+                    namespace,
+                    e.name,
+                    ", ".join(str(c) for c in changes),
                 )
-            except Exception as err:
-                errors.add(f"{e.name} [{e.id}]: {str(err)}")
     if is_debug():
         for e in plan.not_to_modify.entities:
             log.debug(
@@ -417,6 +515,50 @@ async def plan_apply(
                 e.id,
             )
 
+    for e in plan.share.entities:
+        log.debug(
+            "[appgate-operator/%s] = %s: %s [%s]",
+            namespace,
+            e.value.__class__.__name__,
+            e.name,
+            e.id,
+        )
+
+    if not entity_client:
+        return
+    client: EntityClient = entity_client
+
+    async def create(e: EntityWrapper) -> None:
+        await client.post(e.value)
+        await k8s_configmap_client.update_entity_generation(
+            key=entity_generation_key(e),
+            generation=e.value.appgate_metadata.current_generation,
+        )
+
+    async def modify(e: EntityWrapper) -> None:
+        await client.put(e.value)
+        await k8s_configmap_client.update_entity_generation(
+            key=entity_generation_key(e),
+            generation=e.value.appgate_metadata.current_generation,
+        )
+
+    await asyncio.gather(
+        apply_entities(plan.create.entities, create, semaphore, errors),
+        apply_entities(plan.modify.entities, modify, semaphore, errors),
+    )
+
+
+async def plan_apply_deletes(
+    plan: Plan,
+    namespace: str,
+    k8s_configmap_client: K8SConfigMapClient,
+    semaphore: asyncio.Semaphore,
+    errors: Set[str],
+    entity_client: Optional[EntityClient] = None,
+) -> None:
+    """
+    Applies the entities to delete in the plan.
+    """
     for e in plan.delete.entities:
         log.info(
             "[appgate-operator/%s] - %s: %s [%s]",
@@ -425,19 +567,6 @@ async def plan_apply(
             e.name,
             e.id,
         )
-        if entity_client:
-            try:
-                await entity_client.delete(e.id)
-                name = (
-                    "singleton"
-                    if e.value._entity_metadata.get("singleton", False)
-                    else e.name
-                )
-                await k8s_configmap_client.delete_entity_generation(
-                    entity_unique_id(e.value.__class__.__name__, name)
-                )
-            except Exception as err:
-                errors.add(f"{e.name} [{e.id}]: {str(err)}")
     if is_debug():
         for e in plan.not_to_delete.entities:
             log.debug(
@@ -448,27 +577,40 @@ async def plan_apply(
                 e.id,
             )
 
-    for e in plan.share.entities:
-        log.debug(
-            "[appgate-operator/%s] = %s: %s [%s]",
-            namespace,
-            e.value.__class__.__name__,
-            e.name,
-            e.id,
-        )
+    if not entity_client:
+        return
+    client: EntityClient = entity_client
 
-    has_errors = len(errors) > 0
-    return Plan(
-        create=plan.create,
-        not_to_create=plan.not_to_create,
-        share=plan.share,
-        delete=plan.delete,
-        not_to_delete=plan.not_to_delete,
-        modify=plan.modify,
-        not_to_modify=plan.not_to_modify,
-        modifications_diff=plan.modifications_diff,
-        errors=errors if has_errors else None,
+    async def delete(e: EntityWrapper) -> None:
+        await client.delete(e.id)
+        await k8s_configmap_client.delete_entity_generation(entity_generation_key(e))
+
+    await apply_entities(plan.delete.entities, delete, semaphore, errors)
+
+
+async def plan_apply(
+    plan: Plan,
+    namespace: str,
+    k8s_configmap_client: K8SConfigMapClient,
+    entity_client: Optional[EntityClient] = None,
+    parallelism: int = 1,
+    diff_mode: DiffMode = "full",
+) -> Plan:
+    errors: Set[str] = set()
+    semaphore = asyncio.Semaphore(parallelism)
+    await plan_apply_upserts(
+        plan,
+        namespace,
+        k8s_configmap_client,
+        semaphore,
+        errors,
+        entity_client,
+        diff_mode,
     )
+    await plan_apply_deletes(
+        plan, namespace, k8s_configmap_client, semaphore, errors, entity_client
+    )
+    return evolve(plan, errors=errors or None)
 
 
 @attrs
@@ -491,6 +633,18 @@ class AppgatePlan:
     def ordered_entities_plan(self, api_spec: APISpec) -> Iterator[Tuple[str, Plan]]:
         return map(lambda k: (k, self.entities_plan[k]), api_spec.entities_sorted)
 
+    def ordered_entities_plan_waves(
+        self, api_spec: APISpec
+    ) -> List[List[Tuple[str, Plan]]]:
+        """
+        Plans grouped in waves of independent entity types, see
+        APISpec.entities_sorted_waves
+        """
+        return [
+            [(k, self.entities_plan[k]) for k in wave if k in self.entities_plan]
+            for wave in api_spec.entities_sorted_waves
+        ]
+
     @cached_property
     def errors(self) -> List[str]:
         maybe_errors = filter(
@@ -508,16 +662,55 @@ async def appgate_plan_apply(
     entity_clients: Dict[str, EntityClient],
     k8s_configmap_client: K8SConfigMapClient,
     api_spec: APISpec,
+    parallelism: int = 1,
+    diff_mode: DiffMode = "full",
 ) -> AppgatePlan:
+    """
+    Applies the plan in waves of independent entity types (see
+    APISpec.entities_sorted_waves). Entity types in the same wave, and the
+    entities inside each type, are applied concurrently with at most
+    parallelism operations in flight.
+    Creations and modifications are applied in dependency order and once
+    all of them are done the deletions are applied in reverse dependency order.
+    The entity generations are written to the configmap in a single batch
+    once the plan has been applied (see K8SConfigMapClient.batch).
+    """
     log.info("[appgate-operator/%s] AppgatePlan Summary:", namespace)
+    semaphore = asyncio.Semaphore(parallelism)
+    waves = appgate_plan.ordered_entities_plan_waves(api_spec)
+    errors: Dict[str, Set[str]] = {k: set() for k in appgate_plan.entities_plan}
+    async with k8s_configmap_client.batch():
+        for wave in waves:
+            await asyncio.gather(
+                *(
+                    plan_apply_upserts(
+                        v,
+                        namespace=namespace,
+                        k8s_configmap_client=k8s_configmap_client,
+                        semaphore=semaphore,
+                        errors=errors[k],
+                        entity_client=entity_clients.get(k),
+                        diff_mode=diff_mode,
+                    )
+                    for k, v in wave
+                )
+            )
+        for wave in reversed(waves):
+            await asyncio.gather(
+                *(
+                    plan_apply_deletes(
+                        v,
+                        namespace=namespace,
+                        k8s_configmap_client=k8s_configmap_client,
+                        semaphore=semaphore,
+                        errors=errors[k],
+                        entity_client=entity_clients.get(k),
+                    )
+                    for k, v in wave
+                )
+            )
     entities_plan = {
-        k: await plan_apply(
-            v,
-            namespace=namespace,
-            entity_client=entity_clients.get(k),
-            k8s_configmap_client=k8s_configmap_client,
-        )
-        for k, v in appgate_plan.ordered_entities_plan(api_spec)
+        k: evolve(v, errors=errors[k] or None) for wave in waves for k, v in wave
     }
     return AppgatePlan(entities_plan=entities_plan)
 
@@ -541,11 +734,12 @@ def entities_conflict_summary(
             )
 
 
-def compute_diff(e1: EntityWrapper, e2: EntityWrapper) -> List[str]:
+def diff_dumps_entities(
+    e1: EntityWrapper, e2: EntityWrapper
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
     """
-    Computes a list with differences between e1 and e2.
-    e1 is current entity
-    e2 is expected entity
+    DIFF_DUMPER dumps of e1 (current entity) and e2 (expected entity) to
+    compare.
     """
     e1_dump = DIFF_DUMPER.dump(e1.value)
     e2_dump = DIFF_DUMPER.dump(e2.value)
@@ -557,14 +751,25 @@ def compute_diff(e1: EntityWrapper, e2: EntityWrapper) -> List[str]:
         if updated_field:
             e1_dump["updated"] = dump_datetime(updated_field)
             e2_dump["updated"] = dump_datetime(e2.value.appgate_metadata.modified)
-    diff = list(
-        difflib.unified_diff(
-            json.dumps(e1_dump, indent=4).splitlines(keepends=True),
-            json.dumps(e2_dump, indent=4).splitlines(keepends=True),
-            n=1,
-        )
-    )
-    return diff
+    return e1_dump, e2_dump
+
+
+def compute_changes(e1: EntityWrapper, e2: EntityWrapper) -> List[FieldChange]:
+    """
+    Computes the list of fields changed between e1 and e2.
+    e1 is current entity
+    e2 is expected entity
+    """
+    return diff_dumps(*diff_dumps_entities(e1, e2))
+
+
+def compute_diff(e1: EntityWrapper, e2: EntityWrapper) -> List[str]:
+    """
+    Computes a list with differences between e1 and e2.
+    e1 is current entity
+    e2 is expected entity
+    """
+    return unified_diff(*diff_dumps_entities(e1, e2))
 
 
 def compare_entities(
@@ -574,60 +779,51 @@ def compare_entities(
     target_tags: Optional[FrozenSet[str]],
     excluded_tags: Optional[FrozenSet[str]] = None,
 ) -> Plan:
-    current_entities = {e for e in current.entities if is_target(e, target_tags)}
-    current_names = {e.name for e in current_entities}
-    expected_entities = {e for e in expected.entities if is_target(e, target_tags)}
-    expected_names = {e.name for e in expected_entities}
-    shared_names = current_names.intersection(expected_names)
-
+    current_entities = {
+        e.name: e for e in current.entities if is_target(e, target_tags)
+    }
+    expected_entities = {
+        e.name: e for e in expected.entities if is_target(e, target_tags)
+    }
     ignore_tags = builtin_tags.union(excluded_tags or frozenset())
 
-    def _to_delete_filter(e: EntityWrapper) -> bool:
-        return e.name not in expected_names and not has_tag(e, ignore_tags)
-
-    def _to_create_filter(e: EntityWrapper) -> bool:
-        return e.name not in current_names and e.name not in shared_names
-
-    def _to_modify_filter(e: EntityWrapper) -> bool:
-        return e.name in shared_names and e not in current_entities
-
-    def _to_share_filter(e: EntityWrapper) -> bool:
-        return e.name in shared_names and e in current_entities
-
     # Compute the set of entities to delete
     #  - Don't delete builtin entities
     #  - Don't delete entities that are not in target (if target set is
     #    not defined, all entities are in target)
-    xs, ys = itertools.tee(current_entities)
-    to_delete = EntitiesSet(set(filter(_to_delete_filter, xs)))
-    not_to_delete = EntitiesSet(set(itertools.filterfalse(_to_delete_filter, ys)))
-
-    # Compute the set of entities to create
-    xs, ys = itertools.tee(expected_entities)
-    to_create = EntitiesSet(set(filter(_to_create_filter, xs)))
-    not_to_create = EntitiesSet(set(itertools.filterfalse(_to_create_filter, ys)))
+    to_delete = EntitiesSet()
+    not_to_delete = EntitiesSet()
+    for name, e in current_entities.items():
+        if name not in expected_entities and not has_tag(e, ignore_tags):
+            to_delete.add(e)
+        else:
+            not_to_delete.add(e)
 
-    # Compute the set of entities to modify
+    # Compute the sets of entities to create, modify and share in one pass
     #  - Don't modify entities that are not in target (if target set is
     #    not defined, all entities are in target)
-    xs, ys = itertools.tee(expected_entities)
-    to_modify = EntitiesSet(set(filter(_to_modify_filter, xs)))
-    not_to_modify = EntitiesSet(set(itertools.filterfalse(_to_modify_filter, ys)))
-
-    modifications_diff = {}
-    for e in to_modify.entities:
-        current_entity = current.entities_by_name.get(e.name)
-        if not current_entity:
-            log.warning(
-                f"Trying to compute diff for entity %s [%s] but not registered",
-                e.name,
-                e.id,
-            )
+    #  - Entities are compared against the current entity with the same name,
+    #    the fingerprints tell apart most of the modified ones
+    #  - Diffs of the modified entities are computed later, only if needed
+    to_create = EntitiesSet()
+    not_to_create = EntitiesSet()
+    to_modify = EntitiesSet()
+    not_to_modify = EntitiesSet()
+    to_share = EntitiesSet()
+    modifications = {}
+    for name, e in expected_entities.items():
+        current_entity = current_entities.get(name)
+        if current_entity is None:
+            to_create.add(e)
+            not_to_modify.add(e)
+            continue
+        not_to_create.add(e)
+        if current_entity == e:
+            not_to_modify.add(e)
+            to_share.add(e)
             continue
-        diff = compute_diff(current_entity, e)
-        if diff:
-            modifications_diff[e.name] = diff
-    to_share = EntitiesSet(set(filter(_to_share_filter, expected_entities)))
+        to_modify.add(e)
+        modifications[name] = current_entity
 
     return Plan(
         delete=to_delete,
@@ -636,7 +832,7 @@ def compare_entities(
         not_to_create=not_to_create,
         modify=to_modify,
         not_to_modify=not_to_modify,
-        modifications_diff=modifications_diff,
+        modifications=modifications,
         share=to_share,
     )
 
@@ -842,10 +1038,36 @@ def resolve_appgate_state(
     total_appgate_state: AppgateState,
     api_spec: APISpec,
     reverse: bool = False,
+    entity_names: Optional[Set[str]] = None,
 ) -> Dict[str, List[MissingFieldDependencies]]:
+    """
+    Resolves the dependencies of the entities in expected_state.
+    If entity_names is specified only the entity types in it are resolved,
+    the caller needs to include the entity types depending on them (see
+    APISpec.entities_dependents).
+    """
     entities = api_spec.entities
     entities_sorted = api_spec.entities_sorted
+    if entity_names is not None:
+        entities_sorted = [e for e in entities_sorted if e in entity_names]
     total_conflicts: Dict[str, List[MissingFieldDependencies]] = {}
+    # Known entities (current and expected ones) for each entity type referenced,
+    # built once per entity type and shared by all the fields referencing it.
+    known_entities_cache: Dict[str, EntitiesSet] = {}
+
+    def get_known_entities(entity_name: str) -> EntitiesSet:
+        known_entities = known_entities_cache.get(entity_name)
+        if known_entities is None:
+            known_entities = EntitiesSet()
+            known_entities.extend(
+                total_appgate_state.entities_set.get(entity_name, EntitiesSet())
+            )
+            known_entities.extend(
+                expected_state.entities_set.get(entity_name, EntitiesSet())
+            )
+            known_entities_cache[entity_name] = known_entities
+        return known_entities
+
     log.info("[appgate-state] Validating expected state entities")
     log.info("[appgate-state] Resolving dependencies in order: %s", entities_sorted)
     # Iterate over all known entities in the API
@@ -867,16 +1089,11 @@ def resolve_appgate_state(
             # For example, we could have a field `myId` that could contain
             # references for EntityA or EntityB
             for d in field_dependency.dependencies:
-                known_entities = EntitiesSet()
-                known_entities.extend(
-                    total_appgate_state.entities_set.get(d, EntitiesSet())
-                )
-                known_entities.extend(expected_state.entities_set.get(d, EntitiesSet()))
                 dependencies.append(
                     EntityFieldDependency(
                         entity_name=entity_name,
                         field_path=field_dependency.field_path,
-                        known_entities=known_entities,
+                        known_entities=get_known_entities(d),
                     )
                 )
             e1 = expected_state.entities_set.get(entity_name, EntitiesSet())
@@ -890,6 +1107,9 @@ def resolve_appgate_state(
                         total_conflicts[e] = ds
 
             expected_state.entities_set[entity_name] = new_e1
+            # The expected entities changed so the known entities need to be
+            # built again if another entity references them.
+            known_entities_cache.pop(entity_name, None)
     return total_conflicts
 
 
@@ -899,14 +1119,30 @@ def create_appgate_plan(
     builtin_tags: FrozenSet[str],
     target_tags: Optional[FrozenSet[str]],
     excluded_tags: Optional[FrozenSet[str]],
+    previous_plan: Optional[AppgatePlan] = None,
+    entity_names: Optional[Set[str]] = None,
 ) -> AppgatePlan:
     """
     Creates a new AppgatePlan to apply
+    If previous_plan and entity_names are specified only the entity types in
+    entity_names are compared, the plans for the other entity types are taken
+    from previous_plan.
     """
-    entities_plan = {
-        k: compare_entities(
-            current_state.entities_set[k], v, builtin_tags, target_tags, excluded_tags
-        )
-        for k, v in expected_state.entities_set.items()
-    }
+    entities_plan = {}
+    for k, v in expected_state.entities_set.items():
+        if (
+            previous_plan is not None
+            and entity_names is not None
+            and k not in entity_names
+            and k in previous_plan.entities_plan
+        ):
+            entities_plan[k] = previous_plan.entities_plan[k]
+        else:
+            entities_plan[k] = compare_entities(
+                current_state.entities_set[k],
+                v,
+                builtin_tags,
+                target_tags,
+                excluded_tags,
+            )
     return AppgatePlan(entities_plan=entities_plan)
@@ -0,0 +1,152 @@
+import gzip
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, Optional, Set
+
+from appgate.attrs import APPGATE_LOADER, CACHE_DUMPER
+from appgate.logger import log
+from appgate.openapi.types import APISpec, AppgateTypedloadException
+from appgate.state import AppgateState, EntitiesSet
+from appgate.types import EntitiesVersion, EntityWrapper
+
+
+__all__ = [
+    "cached_entities_current",
+    "load_state_cache",
+    "save_state_cache",
+    "stale_entity_types",
+]
+
+
+STATE_CACHE_VERSION = 1
+
+
+def save_state_cache(
+    path: Path, state: AppgateState, api_spec: APISpec, controller: str
+) -> None:
+    """
+    Stores the state as gzipped compact json. The entities are dumped as the
+    controller returns them so no secrets end up in the cache.
+    Errors are logged, the operator works the same without a cache.
+    """
+    data = {
+        "version": STATE_CACHE_VERSION,
+        "controller": controller,
+        "apiVersion": api_spec.api_version,
+        "entities": {
+            k: [CACHE_DUMPER.dump(e.value) for e in v.entities]
+            for k, v in state.entities_set.items()
+        },
+        "versions": {
+            k: {"etag": v.etag, "checksum": v.checksum}
+            for k, v in state.versions.items()
+        },
+    }
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=1) as f:
+            json.dump(data, f, separators=(",", ":"))
+        # Replace the previous cache only once the new one is complete
+        os.replace(tmp_path, path)
+    except OSError as e:
+        log.warning("[state-cache] Unable to save state cache %s: %s", path, e)
+
+
+def load_state_cache(
+    path: Path, api_spec: APISpec, controller: str
+) -> Optional[AppgateState]:
+    """
+    Loads the state stored by save_state_cache. Returns None when there is no
+    cache or when it can not be used with this controller and api spec.
+    """
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data: Dict[str, Any] = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning("[state-cache] Unable to read state cache %s: %s", path, e)
+        return None
+    if (
+        data.get("version") != STATE_CACHE_VERSION
+        or data.get("controller") != controller
+        or data.get("apiVersion") != api_spec.api_version
+    ):
+        log.info("[state-cache] State cache %s is outdated, ignoring it", path)
+        return None
+    entity_names = {k for k, v in api_spec.entities.items() if v.api_path}
+    entities = data.get("entities", {})
+    if set(entities) != entity_names:
+        log.info("[state-cache] State cache %s is outdated, ignoring it", path)
+        return None
+    try:
+        return AppgateState(
+            entities_set={
+                k: EntitiesSet(
+                    {
+                        EntityWrapper(
+                            APPGATE_LOADER.load(e, None, api_spec.entities[k].cls)
+                        )
+                        for e in v
+                    }
+                )
+                for k, v in entities.items()
+            },
+            versions={
+                k: EntitiesVersion(etag=v.get("etag"), checksum=v.get("checksum"))
+                for k, v in data.get("versions", {}).items()
+                if k in entity_names
+            },
+        )
+    except AppgateTypedloadException as e:
+        log.warning("[state-cache] Unable to load state cache %s: %s", path, e)
+        return None
+
+
+def _entity_version(entity: EntityWrapper) -> Hashable:
+    updated = getattr(entity.value, "updated", None)
+    return updated if updated is not None else entity.fingerprint
+
+
+def stale_entity_types(cached: AppgateState, current: AppgateState) -> Set[str]:
+    """
+    Entity types where the cached state differs from the current one. Entities
+    are compared by id and updated timestamp, the entities without it are
+    compared by value.
+    """
+    stale = set()
+    for k, v in current.entities_set.items():
+        cached_entities = cached.entities_set.get(k)
+        if cached_entities is None or {
+            e.id: _entity_version(e) for e in cached_entities.entities
+        } != {e.id: _entity_version(e) for e in v.entities}:
+            stale.add(k)
+    return stale
+
+
+def cached_entities_current(
+    cached: Iterable[EntityWrapper], total: int, latest: Optional[EntityWrapper]
+) -> bool:
+    """
+    Whether the cached entities of a type are the ones in the controller, from
+    the number of entities there and the last one updated: an entity created,
+    updated or deleted since the cache was saved changes one of them. Entities
+    without updated timestamp can not be validated this way.
+    """
+    entities = list(cached)
+    if len(entities) != total:
+        return False
+    if latest is None:
+        return total == 0
+    latest_updated = getattr(latest.value, "updated", None)
+    if latest_updated is None:
+        return False
+    cached_latest = None
+    for e in entities:
+        updated = getattr(e.value, "updated", None)
+        if updated is None or updated > latest_updated:
+            return False
+        if e.id == latest.id:
+            cached_latest = e
+    return cached_latest is not None and cached_latest.value.updated == latest_updated
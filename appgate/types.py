@@ -1,12 +1,22 @@
 import datetime
 import enum
-from copy import deepcopy
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, Any, FrozenSet, Optional, List, Set, Literal, Union
+from typing import (
+    Dict,
+    Any,
+    FrozenSet,
+    Optional,
+    List,
+    Set,
+    Literal,
+    Union,
+    Iterable,
+    Tuple,
+)
 from attr import attrib, attrs, evolve
 
 from appgate.openapi.types import Entity_T, APISpec
-from appgate.openapi.utils import is_entity_t
 
 
 __all__ = [
@@ -20,9 +30,12 @@ __all__ = [
     "is_target",
     "EntitiesSet",
     "LatestEntityGeneration",
+    "EntitiesVersion",
     "OperatorArguments",
     "Context",
     "BUILTIN_TAGS",
+    "DiffMode",
+    "DIFF_MODES",
     "EntityFieldDependency",
     "MissingFieldDependencies",
 ]
@@ -30,6 +43,10 @@ __all__ = [
 
 BUILTIN_TAGS = frozenset({"builtin"})
 
+# How the diffs of the modified entities are logged
+DiffMode = Literal["full", "summary", "off"]
+DIFF_MODES: Tuple[DiffMode, ...] = ("full", "summary", "off")
+
 
 @attrs(slots=True, frozen=True)
 class OperatorArguments:
@@ -42,6 +59,10 @@ class OperatorArguments:
     provider: str = attrib(default="local")
     no_two_way_sync: bool = attrib(default=False)
     timeout: str = attrib(default="30")
+    parallelism: str = attrib(default="8")
+    max_latency: str = attrib(default="300")
+    page_size: str = attrib(default="0")
+    diff_mode: str = attrib(default="full")
     no_cleanup: bool = attrib(default=False)
     target_tags: List[str] = attrib(factory=list)
     builtin_tags: List[str] = attrib(factory=list)
@@ -50,6 +71,7 @@ class OperatorArguments:
     no_verify: bool = attrib(default=False)
     cafile: Optional[Path] = attrib(default=None)
     device_id: Optional[str] = attrib(default=None)
+    state_cache: Optional[Path] = attrib(default=None)
 
 
 @attrs(slots=True, frozen=True)
@@ -97,6 +119,14 @@ class EntityWrapper:
     def tags(self) -> FrozenSet[str]:
         return self.value.tags
 
+    @cached_property
+    def fingerprint(self) -> int:
+        """
+        Hash of the eq fields of the entity, computed once. Entities with
+        different fingerprints are never equal.
+        """
+        return hash(self.value)
+
     def with_id(self, id: str) -> "EntityWrapper":
         return EntityWrapper(evolve(self.value, id=id))
 
@@ -131,6 +161,10 @@ class EntityWrapper:
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, self.__class__):
             raise Exception(f"Wrong other argument {other}")
+        if self.value is other.value:
+            return True
+        if self.fingerprint != other.fingerprint:
+            return False
         if not self.has_secrets():
             return self.value == other.value
         if (
@@ -148,7 +182,7 @@ class EntityWrapper:
         return self.value == other.value
 
     def __hash__(self) -> int:
-        return self.value.__hash__()
+        return self.fingerprint
 
     def __repr__(self):
         return self.value.__repr__()
@@ -175,37 +209,66 @@ def is_target(
 
 
 class EntitiesSet:
-    def __init__(
-        self,
-        entities: Optional[Set[EntityWrapper]] = None,
-        entities_by_name: Optional[Dict[str, EntityWrapper]] = None,
-        entities_by_id: Optional[Dict[str, EntityWrapper]] = None,
-    ) -> None:
-        self.entities: Set[EntityWrapper] = entities or set()
-        if entities_by_name:
-            self.entities_by_name = entities_by_name
-        else:
-            self.entities_by_name = {}
-            for e in self.entities:
-                if is_entity_t(e):
-                    self.entities_by_name[e.name] = e
-        if entities_by_id:
-            self.entities_by_id = entities_by_id
-        else:
-            self.entities_by_id = {}
-            for e in self.entities:
-                if is_entity_t(e):
-                    self.entities_by_id[e.id] = e
+    """
+    Set of entities indexed by name.
+    entities_by_name is the primary index, entities and entities_by_id are kept
+    consistent with it so adding, modifying and deleting entities is O(1).
+    Entities are immutable so snapshots share them, the containers are shared
+    as well until the first modification (copy on write).
+    """
+
+    def __init__(self, entities: Optional[Iterable[EntityWrapper]] = None) -> None:
+        self.entities: Set[EntityWrapper] = set()
+        self.entities_by_name: Dict[str, EntityWrapper] = {}
+        self.entities_by_id: Dict[str, EntityWrapper] = {}
+        # True when the containers could be shared with a snapshot
+        self._shared = False
+        for e in entities or ():
+            self._register(e)
 
     def __str__(self) -> str:
         return str(self.entities)
 
+    def __len__(self) -> int:
+        return len(self.entities_by_name)
+
     def __copy__(self) -> "EntitiesSet":
-        return EntitiesSet(
-            entities=deepcopy(self.entities),
-            entities_by_name=deepcopy(self.entities_by_name),
-            entities_by_id=deepcopy(self.entities_by_id),
-        )
+        return self.snapshot()
+
+    def snapshot(self) -> "EntitiesSet":
+        """
+        Returns a copy of this EntitiesSet in O(1), modifications in any of
+        them are not visible in the other one.
+        """
+        entities_set = EntitiesSet()
+        entities_set.entities = self.entities
+        entities_set.entities_by_name = self.entities_by_name
+        entities_set.entities_by_id = self.entities_by_id
+        entities_set._shared = self._shared = True
+        return entities_set
+
+    def _own(self) -> None:
+        if not self._shared:
+            return
+        self.entities = self.entities.copy()
+        self.entities_by_name = self.entities_by_name.copy()
+        self.entities_by_id = self.entities_by_id.copy()
+        self._shared = False
+
+    def _register(self, entity: EntityWrapper) -> None:
+        self._own()
+        if entity.name in self.entities_by_name:
+            self._unregister(entity.name)
+        self.entities.add(entity)
+        self.entities_by_name[entity.name] = entity
+        self.entities_by_id[entity.id] = entity
+
+    def _unregister(self, name: str) -> None:
+        self._own()
+        registered = self.entities_by_name.pop(name)
+        self.entities.discard(registered)
+        if self.entities_by_id.get(registered.id) is registered:
+            del self.entities_by_id[registered.id]
 
     def entities_with_tags(self, tags: FrozenSet[str]) -> "EntitiesSet":
         return EntitiesSet(entities={e for e in self.entities if has_tag(e, tags)})
@@ -214,29 +277,21 @@ class EntitiesSet:
         if entity.name in self.entities_by_name:
             # Entity is already registered, so this is in the best case a modification
             return self.modify(entity)
-        self.entities.add(entity)
-        # Register it in the maps of ids and names
-        self.entities_by_name[entity.name] = entity
-        self.entities_by_id[entity.id] = entity
+        self._register(entity)
 
     def delete(self, entity: EntityWrapper) -> None:
-        if entity in self.entities:
-            self.entities.remove(entity)
         if entity.name in self.entities_by_name:
-            registered_id = self.entities_by_name[entity.name].id
-            del self.entities_by_name[entity.name]
-            del self.entities_by_id[registered_id]
-        if entity.id in self.entities_by_id:
-            del self.entities_by_id[entity.id]
+            self._unregister(entity.name)
+        elif entity.id in self.entities_by_id:
+            self._unregister(self.entities_by_id[entity.id].name)
 
     def modify(self, entity: EntityWrapper) -> None:
-        if entity.name not in self.entities_by_name:
+        registered = self.entities_by_name.get(entity.name)
+        if registered is None:
             # Not yet in the system, register it with its own id
-            return self.add(entity)
-        # All the entities expect the one being modified
-        self.entities = {e for e in self.entities if e.name != entity.name}
+            return self._register(entity)
         # Replace always the id with the one registered in the system
-        self.entities.add(entity.with_id(id=self.entities_by_name[entity.name].id))
+        self._register(entity.with_id(id=registered.id))
 
     def extend(self, other: "EntitiesSet") -> None:
         """
@@ -252,6 +307,18 @@ class LatestEntityGeneration:
     modified: datetime.datetime = attrib(default=datetime.datetime.now().astimezone())
 
 
+@attrs(slots=True, frozen=True)
+class EntitiesVersion:
+    """
+    Version of the entities of a type read from the controller, used to know
+    if they changed since then: the ETag sent by the controller, if any, and
+    a checksum of the response.
+    """
+
+    etag: Optional[str] = attrib(default=None)
+    checksum: Optional[str] = attrib(default=None)
+
+
 @attrs()
 class Context:
     namespace: str = attrib()
@@ -274,6 +341,16 @@ class Context:
     no_verify: bool = attrib(default=True)
     cafile: Optional[Path] = attrib(default=None)
     device_id: Optional[str] = attrib(default=None)
+    # maximum number of concurrent requests against the controller
+    parallelism: int = attrib(default=8)
+    # maximum time to wait since the first event before computing a plan
+    max_latency: int = attrib(default=300)
+    # number of entities read per request from the controller, 0 for all
+    page_size: int = attrib(default=0)
+    # how the diffs of the modified entities are logged
+    diff_mode: DiffMode = attrib(default="full")
+    # file where the last known state of the controller is stored
+    state_cache: Optional[Path] = attrib(default=None)
 
 
 @attrs(slots=True, frozen=True)
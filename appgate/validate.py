@@ -0,0 +1,200 @@
+import itertools
+import json
+import multiprocessing
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from attr import attrib, attrs
+
+from appgate.attrs import K8S_LOADER
+from appgate.logger import log
+from appgate.openapi.types import APISpec, AppgateException
+from appgate.yaml import YAMLError, safe_load_all
+
+
+__all__ = [
+    "DocumentValidation",
+    "FileValidation",
+    "validate_files",
+    "json_summary",
+    "junit_summary",
+]
+
+
+@attrs(frozen=True, slots=True)
+class DocumentValidation:
+    kind: str = attrib()
+    name: str = attrib()
+    error: Optional[str] = attrib(default=None)
+
+    def __str__(self) -> str:
+        if self.error:
+            return f" - {self.kind}::{self.name}: ERROR: loading entity: {self.error}."
+        return f" - {self.kind}::{self.name}: OK."
+
+
+@attrs(frozen=True, slots=True)
+class FileValidation:
+    """
+    Result of validating the entities in a yaml file. error is set when the
+    file does not exist or it can not be parsed, the documents before the
+    parsing error are still validated.
+    """
+
+    file: str = attrib()
+    documents: List[DocumentValidation] = attrib(factory=list)
+    error: Optional[str] = attrib(default=None)
+    seconds: float = attrib(default=0.0)
+
+    @property
+    def errors(self) -> int:
+        return len([d for d in self.documents if d.error]) + (1 if self.error else 0)
+
+    def lines(self) -> Iterator[str]:
+        for d in self.documents:
+            yield str(d)
+        if self.error:
+            yield f" - {self.file}: ERROR: {self.error}."
+
+
+def _files(files: Iterable[str]) -> Iterator[Path]:
+    """
+    Files to validate, in the order they have always been validated: from
+    the last one and the directories expanded after the files given.
+    """
+    candidates = [Path(f) for f in files]
+    while candidates:
+        file = candidates.pop()
+        if file.is_dir():
+            candidates.extend(itertools.chain(file.glob("*.yaml"), file.glob("*.yml")))
+            continue
+        yield file
+
+
+def validate_file(api_spec: APISpec, file: Path) -> FileValidation:
+    start = time.perf_counter()
+    if not file.exists():
+        return FileValidation(file=str(file), error="file does not exist")
+    documents = []
+    error = None
+    with file.open() as f:
+        try:
+            for d in safe_load_all(f.read()):
+                kind = d.get("kind")
+                name = d["metadata"]["name"]
+                try:
+                    api_spec.validate(d, kind, K8S_LOADER)
+                    documents.append(DocumentValidation(kind=kind, name=name))
+                except AppgateException as e:
+                    documents.append(
+                        DocumentValidation(kind=kind, name=name, error=str(e))
+                    )
+        except YAMLError as e:
+            error = f"parsing entity: {e}"
+    return FileValidation(
+        file=str(file),
+        documents=documents,
+        error=error,
+        seconds=time.perf_counter() - start,
+    )
+
+
+# Files sent to a worker process at once
+CHUNK_SIZE = 16
+# APISpec used by a worker process, set when the worker starts
+_worker_api_spec: Optional[APISpec] = None
+
+
+def _init_worker(api_spec: APISpec) -> None:
+    global _worker_api_spec
+    _worker_api_spec = api_spec
+
+
+def _worker_validate_file(file: Path) -> FileValidation:
+    assert _worker_api_spec is not None
+    return validate_file(_worker_api_spec, file)
+
+
+def validate_files(
+    api_spec: APISpec, files: Iterable[str], jobs: int = 1
+) -> Iterator[FileValidation]:
+    """
+    Validates the entities in files, directories are expanded to the yaml files
+    in them. With more than one job the files are sent to a pool of forked
+    processes sharing api_spec, a file is always validated by a single
+    process. The files are validated sequentially when forking processes is
+    not supported. The results are always in the same order.
+    """
+    if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+        log.warning("Unable to fork processes, validating the files sequentially")
+        jobs = 1
+    if jobs <= 1:
+        for file in _files(files):
+            yield validate_file(api_spec, file)
+        return
+    # Generate all the entities before forking so the workers share them
+    list(api_spec.entities.values())
+    # The workers are forked, api_spec is inherited instead of pickled
+    with multiprocessing.get_context("fork").Pool(
+        jobs, initializer=_init_worker, initargs=(api_spec,)
+    ) as pool:
+        yield from pool.imap(_worker_validate_file, _files(files), chunksize=CHUNK_SIZE)
+
+
+def json_summary(results: List[FileValidation], seconds: float) -> str:
+    return json.dumps(
+        {
+            "errors": sum(r.errors for r in results),
+            "seconds": seconds,
+            "files": [
+                {
+                    "file": r.file,
+                    "errors": r.errors,
+                    "error": r.error,
+                    "seconds": r.seconds,
+                    "documents": [
+                        {"kind": d.kind, "name": d.name, "error": d.error}
+                        for d in r.documents
+                    ],
+                }
+                for r in results
+            ],
+        },
+        indent=2,
+    )
+
+
+def junit_summary(results: List[FileValidation], seconds: float) -> str:
+    """
+    JUnit report with a test suite per file and a test case per entity.
+    """
+    testsuites = ET.Element(
+        "testsuites",
+        name="validate-entities",
+        tests=str(sum(len(r.documents) + (1 if r.error else 0) for r in results)),
+        failures=str(sum(r.errors for r in results)),
+        time=f"{seconds:.6f}",
+    )
+    for r in results:
+        testsuite = ET.SubElement(
+            testsuites,
+            "testsuite",
+            name=r.file,
+            tests=str(len(r.documents) + (1 if r.error else 0)),
+            failures=str(r.errors),
+            time=f"{r.seconds:.6f}",
+        )
+        for d in r.documents:
+            testcase = ET.SubElement(
+                testsuite, "testcase", classname=r.file, name=f"{d.kind}::{d.name}"
+            )
+            if d.error:
+                ET.SubElement(testcase, "failure", message=d.error)
+        if r.error:
+            testcase = ET.SubElement(
+                testsuite, "testcase", classname=r.file, name=r.file
+            )
+            ET.SubElement(testcase, "failure", message=r.error)
+    return ET.tostring(testsuites, encoding="unicode", xml_declaration=True)
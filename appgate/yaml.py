@@ -0,0 +1,64 @@
+import re
+from typing import Any, Callable, Iterator, Optional, Type
+
+import yaml
+
+
+__all__ = [
+    "YAMLError",
+    "add_representer",
+    "safe_dump",
+    "safe_load",
+    "safe_load_all",
+]
+
+
+YAMLError = yaml.YAMLError
+
+
+class _SafeDumper(yaml.SafeDumper):
+    pass
+
+
+# libyaml bindings, only available when PyYAML was built with libyaml
+_SafeLoader: Type[Any] = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_CSafeDumper: Optional[Type[Any]] = None
+if hasattr(yaml, "CSafeDumper"):
+
+    class _CSafeDumper(yaml.CSafeDumper):  # type: ignore
+        pass
+
+
+# A double quoted scalar starts at the beginning of a line or after a space or
+# a flow indicator, it can give false positives but never false negatives.
+_DOUBLE_QUOTED_RE = re.compile(r'(?:^|[\s\[{,])"')
+
+
+def safe_load(stream: Any) -> Any:
+    return yaml.load(stream, Loader=_SafeLoader)
+
+
+def safe_load_all(stream: Any) -> Iterator[Any]:
+    return yaml.load_all(stream, Loader=_SafeLoader)
+
+
+def safe_dump(data: Any, **kwargs: Any) -> str:
+    """
+    Same output as yaml.safe_dump, using the libyaml emitter when available.
+    libyaml folds long double quoted scalars in a different way, dumps with
+    double quoted scalars are done again with the python emitter.
+    """
+    if _CSafeDumper is not None:
+        dumped = yaml.dump(data, Dumper=_CSafeDumper, **kwargs)
+        if not _DOUBLE_QUOTED_RE.search(dumped):
+            return dumped
+    return yaml.dump(data, Dumper=_SafeDumper, **kwargs)
+
+
+def add_representer(data_type: Type, representer: Callable[..., Any]) -> None:
+    """
+    Register a representer for types unknown to the safe dumpers.
+    """
+    _SafeDumper.add_representer(data_type, representer)
+    if _CSafeDumper is not None:
+        _CSafeDumper.add_representer(data_type, representer)
@@ -0,0 +1,151 @@
+"""
+Duration of the reconcile cycles against a mock controller over TLS when a new
+AppgateClient is created for every cycle (previous implementation) and when
+a long-lived client is reused between cycles. Every cycle reads all the
+entity types, the per-cycle clients log in every time while the long-lived
+one keeps its token.
+
+Usage: python -m benchmarks.controller [CYCLES]
+"""
+import asyncio
+import datetime
+import ssl
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+
+from appgate.client import AppgateClient
+
+CYCLES = 20
+ENTITY_TYPES = 30
+ENTITIES = 100
+PARALLELISM = 8
+
+
+def self_signed_cert(directory: Path) -> Tuple[Path, Path]:
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.utcnow()
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    cert_file, key_file = directory / "cert.pem", directory / "key.pem"
+    cert_file.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_file.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    return cert_file, key_file
+
+
+def mock_controller(connections: Set[Any], logins: List[int]) -> web.Application:
+    entities = [
+        {"id": f"id-{i}", "name": f"entity-{i}", "notes": "benchmark"}
+        for i in range(ENTITIES)
+    ]
+
+    async def login(request: web.Request) -> web.Response:
+        connections.add(request.transport)
+        logins.append(1)
+        return web.json_response({"token": "token"})
+
+    async def get(request: web.Request) -> web.Response:
+        connections.add(request.transport)
+        return web.json_response({"data": entities, "range": f"0-{ENTITIES}"})
+
+    app = web.Application()
+    app.router.add_post("/admin/login", login)
+    app.router.add_get("/admin/{entity}", get)
+    return app
+
+
+def new_client(controller: str) -> AppgateClient:
+    return AppgateClient(
+        controller=controller,
+        user="admin",
+        password="admin",
+        provider="local",
+        version=17,
+        device_id="device-id",
+        no_verify=True,
+        parallelism=PARALLELISM,
+    )
+
+
+async def read_all(client: AppgateClient) -> None:
+    semaphore = asyncio.Semaphore(PARALLELISM)
+
+    async def read(i: int) -> None:
+        async with semaphore:
+            await client.get(f"admin/entity-{i}")
+
+    await asyncio.gather(*(read(i) for i in range(ENTITY_TYPES)))
+
+
+async def measure(mode: str, cycles: int, ssl_context: ssl.SSLContext) -> Dict:
+    connections: Set[Any] = set()
+    logins: List[int] = []
+    server = TestServer(mock_controller(connections, logins))
+    await server.start_server(ssl=ssl_context)
+    try:
+        controller = f"https://{server.host}:{server.port}"
+        durations: List[float] = []
+        if mode == "per-cycle":
+            for _ in range(cycles):
+                t = time.perf_counter()
+                async with new_client(controller) as client:
+                    await read_all(client)
+                durations.append(time.perf_counter() - t)
+        else:
+            async with new_client(controller) as client:
+                for _ in range(cycles):
+                    t = time.perf_counter()
+                    await read_all(client)
+                    durations.append(time.perf_counter() - t)
+    finally:
+        await server.close()
+    return {
+        "cycle": sum(durations) / len(durations),
+        "connections": len(connections),
+        "logins": len(logins),
+    }
+
+
+def main(cycles: int) -> None:
+    print(
+        f"{'client':>10} {'cycles':>7} {'ms/cycle':>9} {'connections':>12}"
+        f" {'logins':>7}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file, key_file = self_signed_cert(Path(directory))
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(cert_file, key_file)
+        for mode in ("per-cycle", "long-lived"):
+            result = asyncio.run(measure(mode, cycles, ssl_context))
+            print(
+                f"{mode:>10} {cycles:>7} {result['cycle'] * 1000:>9.2f}"
+                f" {result['connections']:>12} {result['logins']:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else CYCLES)
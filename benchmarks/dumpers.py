@@ -0,0 +1,43 @@
+"""
+Throughput of K8S_DUMPER, APPGATE_DUMPER and DIFF_DUMPER on the entities
+defined in the tests/resources spec.
+
+Usage: python -m benchmarks.dumpers [N]
+"""
+import sys
+from pathlib import Path
+
+from appgate.attrs import APPGATE_DUMPER, APPGATE_LOADER, DIFF_DUMPER, K8S_DUMPER
+from appgate.openapi.openapi import parse_files
+from benchmarks.loaders import DATA, SPEC_ENTITIES
+from benchmarks.utils import timeit
+
+N = 10000
+
+
+def main(n: int) -> None:
+    api_spec = parse_files(
+        spec_entities=SPEC_ENTITIES,
+        spec_directory=Path("tests/resources/"),
+        spec_file="test_entity.yaml",
+    )
+    print(f"{'entity':>20} {'dumper':>8} {'entities/s':>12}")
+    for entity_name, data in DATA.items():
+        cls = api_spec.entities[entity_name].cls
+        values = [APPGATE_LOADER.load(data(i), None, cls) for i in range(n)]
+        for dumper_name, dumper in (
+            ("k8s", K8S_DUMPER),
+            ("appgate", APPGATE_DUMPER),
+            ("diff", DIFF_DUMPER),
+        ):
+
+            def dump() -> None:
+                for v in values:
+                    dumper.dump(v)
+
+            t = timeit(dump)
+            print(f"{entity_name:>20} {dumper_name:>8} {n / t:>12.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else N)
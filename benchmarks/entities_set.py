@@ -0,0 +1,51 @@
+"""
+Micro-benchmark for EntitiesSet operations.
+
+Usage: python -m benchmarks.entities_set [SIZE ...]
+"""
+import sys
+from typing import Dict, List
+
+from appgate.types import EntitiesSet
+from benchmarks.utils import entities, timeit
+
+SIZES = [1000, 5000, 10000, 50000]
+
+
+def run(n: int) -> Dict[str, float]:
+    xs = entities(n)
+    ys = entities(n, value=1)
+    entities_set = EntitiesSet(xs)
+    other = EntitiesSet(ys)
+    results = {
+        "init": timeit(lambda: EntitiesSet(xs)),
+        "extend": timeit(lambda: EntitiesSet(xs).extend(other)),
+    }
+
+    def modify() -> None:
+        for e in ys:
+            entities_set.modify(e)
+
+    def delete() -> None:
+        for e in ys:
+            entities_set.delete(e)
+
+    def add() -> None:
+        for e in xs:
+            entities_set.add(e)
+
+    results["modify"] = timeit(modify)
+    results["delete"] = timeit(delete)
+    results["add"] = timeit(add)
+    return results
+
+
+def main(sizes: List[int]) -> None:
+    print(f"{'size':>8} {'op':>8} {'total (ms)':>12} {'per op (us)':>12}")
+    for n in sizes:
+        for op, t in run(n).items():
+            print(f"{n:>8} {op:>8} {t * 1000:>12.2f} {t * 1e6 / n:>12.2f}")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or SIZES)
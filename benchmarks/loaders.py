@@ -0,0 +1,87 @@
+"""
+Throughput of K8S_LOADER and APPGATE_LOADER on the entities defined in the
+tests/resources spec.
+
+Usage: python -m benchmarks.loaders [N]
+"""
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from appgate.attrs import APPGATE_LOADER, K8S_LOADER, get_loader
+from appgate.openapi.openapi import parse_files
+from appgate.openapi.types import PlatformType
+from benchmarks.utils import timeit
+
+N = 10000
+
+SPEC_ENTITIES = {
+    "/entity-test1": "EntityTest1",
+    "/entity-dep-1": "EntityDep1",
+    "/entity-dep-5": "EntityDep5",
+    "/entity-dep-6": "EntityDep6",
+    "/entity-discriminator": "EntityDiscriminator",
+}
+
+DATA: Dict[str, Callable[[int], Dict[str, Any]]] = {
+    "EntityTest1": lambda i: {
+        "fieldOne": "this is read only",
+        "fieldTwo": "this is write only",
+        "fieldFour": f"field {i}",
+        "from": "this has a weird key name",
+    },
+    "EntityDep1": lambda i: {"id": f"id-{i}", "name": f"dep1-{i}"},
+    "EntityDep5": lambda i: {
+        "id": f"id-{i}",
+        "name": f"dep5-{i}",
+        "obj1": {"obj2": {"dep1": f"dep1-{i}"}},
+    },
+    "EntityDep6": lambda i: {
+        "id": f"id-{i}",
+        "name": f"dep6-{i}",
+        "deps4": [f"dep4-{j}" for j in range(i % 10)],
+    },
+    "EntityDiscriminator": lambda i: {
+        "id": f"id-{i}",
+        "name": f"discriminator-{i}",
+        "fieldOne": "hello",
+        "type": "DiscriminatorOne",
+        "discriminatorOneFieldOne": "hi",
+        "discriminatorOneFieldTwo": "bye",
+    },
+}
+
+
+def main(n: int) -> None:
+    api_spec = parse_files(
+        spec_entities=SPEC_ENTITIES,
+        spec_directory=Path("tests/resources/"),
+        spec_file="test_entity.yaml",
+    )
+    print(f"{'entity':>20} {'loader':>8} {'entities/s':>12}")
+    for entity_name, data in DATA.items():
+        cls = api_spec.entities[entity_name].cls
+        values = [data(i) for i in range(n)]
+        for loader_name, loader in (("k8s", K8S_LOADER), ("appgate", APPGATE_LOADER)):
+
+            def load() -> None:
+                for v in values:
+                    loader.load(v, None, cls)
+
+            t = timeit(load)
+            print(f"{entity_name:>20} {loader_name:>8} {n / t:>12.0f}")
+
+    entities = [e.cls for e in api_spec.entities.values()]
+
+    def compile() -> None:
+        for platform_type in (PlatformType.K8S, PlatformType.APPGATE):
+            loader = get_loader(platform_type)
+            for cls in entities:
+                loader.compile(cls)
+
+    t = timeit(compile)
+    print(f"compiled {len(entities)} classes for both loaders in {t * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else N)
@@ -0,0 +1,61 @@
+"""
+Memory and time benchmark for AppgateState snapshots compared with deepcopy.
+
+Usage: python -m benchmarks.snapshot [SIZE ...]
+"""
+import sys
+import tracemalloc
+from copy import deepcopy
+from typing import Any, Callable, Dict, List, Tuple
+
+from appgate.state import AppgateState
+from appgate.types import EntitiesSet
+from benchmarks.utils import entities, timeit
+
+SIZES = [1000, 10000, 50000]
+ENTITY_TYPES = 5
+
+
+def measure(f: Callable[[], Any]) -> Tuple[float, int]:
+    """
+    Returns the time in seconds and the memory in bytes still allocated by
+    the object returned by f.
+    """
+    tracemalloc.start()
+    result = []
+    t = timeit(lambda: result.append(f()))
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return t, memory
+
+
+def run(n: int) -> Dict[str, Tuple[float, int]]:
+    state = AppgateState(
+        entities_set={
+            f"Entity{i}": EntitiesSet(entities(n // ENTITY_TYPES))
+            for i in range(ENTITY_TYPES)
+        }
+    )
+    ys = entities(n // ENTITY_TYPES, value=1)
+
+    def snapshot_and_modify() -> AppgateState:
+        snapshot = state.snapshot()
+        snapshot.entities_set["Entity0"].modify(ys[0])
+        return snapshot
+
+    return {
+        "deepcopy": measure(lambda: deepcopy(state)),
+        "snapshot": measure(state.snapshot),
+        "snapshot+modify": measure(snapshot_and_modify),
+    }
+
+
+def main(sizes: List[int]) -> None:
+    print(f"{'size':>8} {'op':>16} {'time (ms)':>10} {'memory (KiB)':>13}")
+    for n in sizes:
+        for op, (t, memory) in run(n).items():
+            print(f"{n:>8} {op:>16} {t * 1000:>10.2f} {memory / 1024:>13.1f}")
+
+
+if __name__ == "__main__":
+    main([int(x) for x in sys.argv[1:]] or SIZES)
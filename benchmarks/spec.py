@@ -0,0 +1,59 @@
+"""
+Time to generate the APISpec when the spec files are parsed on every start
+(previous implementation) and when the parsed files are read from the spec
+cache. The entities are generated lazily, so generating all of them and only
+the first one are measured separately. Without arguments it uses the
+tests/resources spec, otherwise the given spec directory (for example
+api_specs/v17).
+
+Usage: python -m benchmarks.spec [SPEC_DIRECTORY] [N]
+"""
+import sys
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from appgate.openapi.openapi import generate_api_spec, parse_files
+from appgate.openapi.types import APISpec
+from benchmarks.loaders import SPEC_ENTITIES
+from benchmarks.utils import timeit
+
+N = 10
+
+
+def main(spec_directory: Optional[Path], n: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        cache = Path(directory) / "spec-cache.pickle"
+
+        def api_spec(spec_cache: Optional[Path]) -> APISpec:
+            if spec_directory:
+                return generate_api_spec(spec_directory, spec_cache=spec_cache)
+            return parse_files(
+                spec_entities=SPEC_ENTITIES,
+                spec_directory=Path("tests/resources/"),
+                spec_file="test_entity.yaml",
+                spec_cache=spec_cache,
+            )
+
+        def all_entities(spec_cache: Optional[Path]) -> None:
+            list(api_spec(spec_cache).entities.values())
+
+        def one_entity(spec_cache: Optional[Path]) -> None:
+            api_spec(spec_cache).entities["Policy" if spec_directory else "EntityTest1"]
+
+        print(f"{'spec cache':>12} {'entities':>9} {'ms/start':>9}")
+        t = sum(timeit(lambda: all_entities(None)) for _ in range(n))
+        print(f"{'none':>12} {'all':>9} {t / n * 1000:>9.1f}")
+        t = timeit(lambda: all_entities(cache))
+        print(f"{'first run':>12} {'all':>9} {t * 1000:>9.1f}")
+        t = sum(timeit(lambda: all_entities(cache)) for _ in range(n))
+        print(f"{'cached':>12} {'all':>9} {t / n * 1000:>9.1f}")
+        t = sum(timeit(lambda: one_entity(cache)) for _ in range(n))
+        print(f"{'cached':>12} {'one':>9} {t / n * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main(
+        Path(sys.argv[1]) if sys.argv[1:] else None,
+        int(sys.argv[2]) if sys.argv[2:] else N,
+    )
@@ -0,0 +1,37 @@
+import time
+from typing import Any, Callable, Dict, FrozenSet, List
+
+from attr import attrib, attrs
+
+from appgate.types import EntityWrapper
+
+
+@attrs(frozen=True, slots=True)
+class BenchEntity:
+    name: str = attrib()
+    id: str = attrib()
+    tags: FrozenSet[str] = attrib(factory=frozenset)
+    value: int = attrib(default=0)
+    notes: str = attrib(default="")
+    _entity_metadata: Dict[str, Any] = attrib(factory=dict, eq=False, hash=False)
+
+
+def entities(n: int, value: int = 0) -> List[EntityWrapper]:
+    return [
+        EntityWrapper(
+            BenchEntity(  # type: ignore
+                name=f"entity-{i}",
+                id=f"id-{i}",
+                tags=frozenset({"benchmark", f"tag-{i % 10}"}),
+                value=value,
+                notes=f"entity number {i} used in benchmarks",
+            )
+        )
+        for i in range(n)
+    ]
+
+
+def timeit(f: Callable[[], Any]) -> float:
+    t = time.perf_counter()
+    f()
+    return time.perf_counter() - t
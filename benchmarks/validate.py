@@ -0,0 +1,55 @@
+"""
+Duration of validate-entities on generated entity files with one process
+(previous implementation) and with a pool of processes sharing the APISpec.
+
+Usage: python -m benchmarks.validate [FILES]
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from appgate.openapi.openapi import parse_files
+from appgate.validate import validate_files
+from benchmarks.loaders import SPEC_ENTITIES
+
+FILES = 2000
+DOCUMENTS = 5
+
+ENTITY = """apiVersion: beta.appgate.com/v1
+kind: EntityDep5
+metadata:
+  name: dep5-{i}
+spec:
+  name: dep5-{i}
+  obj1:
+    obj2:
+      dep1: dep1-{i}
+"""
+
+
+def main(n: int) -> None:
+    api_spec = parse_files(
+        spec_entities=SPEC_ENTITIES,
+        spec_directory=Path("tests/resources/"),
+        spec_file="test_entity.yaml",
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(n):
+            Path(directory, f"entities-{i}.yaml").write_text(
+                "---\n".join(
+                    ENTITY.format(i=i * DOCUMENTS + j) for j in range(DOCUMENTS)
+                )
+            )
+        print(f"{'jobs':>5} {'files':>6} {'seconds':>8} {'files/s':>8}")
+        for jobs in sorted({1, 2, 4, os.cpu_count() or 1}):
+            t = time.perf_counter()
+            results = list(validate_files(api_spec, [directory], jobs=jobs))
+            t = time.perf_counter() - t
+            assert len(results) == n and not any(r.errors for r in results)
+            print(f"{jobs:>5} {n:>6} {t:>8.2f} {n / t:>8.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else FILES)
@@ -0,0 +1,128 @@
+"""
+Threads and memory (resident memory increase) used watching CRDs with a thread per CRD running the
+kubernetes Watch (previous implementation) and with K8SWatchClient.
+A mock kubernetes API sends one event per watch and keeps it open.
+
+Usage: python -m benchmarks.watch [CRDS]
+"""
+import asyncio
+import json
+import resource
+import subprocess
+import sys
+import threading
+from typing import Any, Awaitable, Callable, Dict, List
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from kubernetes.client import (  # type: ignore[attr-defined]
+    ApiClient,
+    Configuration,
+    CustomObjectsApi,
+)
+from kubernetes.watch import Watch
+
+from appgate.client import K8SWatchClient
+
+CRDS = 20
+
+
+def rss() -> int:
+    """
+    Resident memory in KiB, peak resident memory if not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+async def watch_handler(request: web.Request) -> web.StreamResponse:
+    response = web.StreamResponse()
+    await response.prepare(request)
+    obj = {"metadata": {"name": "entity", "resourceVersion": "1"}}
+    await response.write(json.dumps({"type": "ADDED", "object": obj}).encode() + b"\n")
+    await request.app["stop"].wait()
+    return response
+
+
+def watch_threads(
+    configuration: Configuration, crds: int, received: Callable[[], None]
+) -> None:
+    api = CustomObjectsApi(ApiClient(configuration))  # type: ignore[call-arg]
+
+    def run(crd: str) -> None:
+        try:
+            for _ in Watch().stream(
+                api.list_namespaced_custom_object, "g", "v1", "ns", crd
+            ):
+                received()
+        except Exception:
+            # The mock server has been stopped
+            pass
+
+    for i in range(crds):
+        threading.Thread(target=run, args=(f"crd{i}",), daemon=True).start()
+
+
+async def watch_async(
+    configuration: Configuration, crds: int, received: Callable[[], None]
+) -> None:
+    async def run(client: K8SWatchClient, crd: str) -> None:
+        async for _ in client.watch("g", "v1", "ns", crd):
+            received()
+
+    async with K8SWatchClient(configuration) as client:
+        await asyncio.gather(*(run(client, f"crd{i}") for i in range(crds)))
+
+
+async def measure(mode: str, crds: int) -> Dict[str, Any]:
+    app = web.Application()
+    app["stop"] = asyncio.Event()
+    app.router.add_get(
+        "/apis/{group}/{version}/namespaces/{ns}/{plural}", watch_handler
+    )
+    events: List[int] = []
+    loop = asyncio.get_running_loop()
+
+    def received() -> None:
+        loop.call_soon_threadsafe(events.append, 1)
+
+    async with TestServer(app) as server:
+        configuration = Configuration()
+        configuration.host = str(server.make_url("")).rstrip("/")
+        task = None
+        rss_start = rss()
+        if mode == "thread":
+            watch_threads(configuration, crds, received)
+        else:
+            task = asyncio.create_task(watch_async(configuration, crds, received))
+        while len(events) < crds:
+            await asyncio.sleep(0.1)
+        result = {
+            "threads": threading.active_count(),
+            "rss": rss() - rss_start,
+        }
+        if task:
+            task.cancel()
+        app["stop"].set()
+        return result
+
+
+def main(crds: int) -> None:
+    print(f"{'mode':>8} {'crds':>6} {'threads':>8} {'rss (KiB)':>10}")
+    for mode in ("thread", "async"):
+        # Run each mode in its own process to measure memory
+        output = subprocess.check_output(
+            [sys.executable, "-m", "benchmarks.watch", "--measure", mode, str(crds)]
+        )
+        result = json.loads(output)
+        print(f"{mode:>8} {crds:>6} {result['threads']:>8} {result['rss']:>10}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        print(json.dumps(asyncio.run(measure(sys.argv[2], int(sys.argv[3])))))
+        sys.exit(0)
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else CRDS)
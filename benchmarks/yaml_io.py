@@ -0,0 +1,91 @@
+"""
+Throughput of the python yaml loader and emitter (previous implementation)
+and of appgate.yaml, that uses libyaml when available, on the entity files in
+tests/resources/v14-v17 and on a large generated entity file.
+
+Usage: python -m benchmarks.yaml_io [N]
+"""
+import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import yaml
+
+from appgate.yaml import safe_dump, safe_load_all
+from benchmarks.utils import timeit
+
+N = 5000
+ROUNDS = 20
+
+
+def generated_entities(n: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "apiVersion": "beta.appgate.com/v1",
+            "kind": "Policy",
+            "metadata": {"name": f"policy-{i}"},
+            "spec": {
+                "name": f"policy-{i}",
+                "notes": f"Policy number {i} generated for the benchmark",
+                "disabled": i % 2 == 0,
+                "expression": f"return claims.user.groups.indexOf('group-{i}') >= 0;",
+                "entitlements": [f"entitlement-{j}" for j in range(i % 10)],
+                "tags": ["benchmark", f"tag-{i % 10}"],
+                "overrideSite": None,
+            },
+        }
+        for i in range(n)
+    ]
+
+
+def main(n: int) -> None:
+    files = sorted(Path("tests/resources").glob("v1[4-7]/*.y*ml"))
+    specs = [f.read_text() for f in files]
+    entities = generated_entities(n)
+    generated = "---\n".join(yaml.safe_dump(e) for e in entities)
+    print(f"libyaml: {yaml.__with_libyaml__}")
+    print(f"{'input':>14} {'operation':>10} {'python ms':>10} {'appgate ms':>11}")
+
+    def row(name: str, op: str, python: Callable, appgate: Callable) -> None:
+        print(
+            f"{name:>14} {op:>10} {timeit(python) * 1000:>10.1f}"
+            f" {timeit(appgate) * 1000:>11.1f}"
+        )
+
+    row(
+        f"v14-v17 x{ROUNDS}",
+        "load",
+        lambda: [list(yaml.safe_load_all(s)) for _ in range(ROUNDS) for s in specs],
+        lambda: [list(safe_load_all(s)) for _ in range(ROUNDS) for s in specs],
+    )
+    documents = [d for s in specs for d in yaml.safe_load_all(s)]
+    row(
+        f"v14-v17 x{ROUNDS}",
+        "dump",
+        lambda: [
+            yaml.safe_dump(d, default_flow_style=False)
+            for _ in range(ROUNDS)
+            for d in documents
+        ],
+        lambda: [
+            safe_dump(d, default_flow_style=False)
+            for _ in range(ROUNDS)
+            for d in documents
+        ],
+    )
+    row(
+        f"{n} entities",
+        "load",
+        lambda: list(yaml.safe_load_all(generated)),
+        lambda: list(safe_load_all(generated)),
+    )
+    row(
+        f"{n} entities",
+        "dump",
+        lambda: [yaml.safe_dump(e, default_flow_style=False) for e in entities],
+        lambda: [safe_dump(e, default_flow_style=False) for e in entities],
+    )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else N)
@@ -1,6 +1,10 @@
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Tuple
 
 
 class TopologicalSorter:
     def __init__(self, entities_to_sort: Dict[str, Set[str]]) -> None: ...
-    def static_order(self) -> List[str]: ...
\ No newline at end of file
+    def static_order(self) -> List[str]: ...
+    def prepare(self) -> None: ...
+    def is_active(self) -> bool: ...
+    def get_ready(self) -> Tuple[str, ...]: ...
+    def done(self, *nodes: str) -> None: ...
\ No newline at end of file
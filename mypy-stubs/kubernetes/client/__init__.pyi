@@ -1,4 +1,16 @@
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
+
+
+class Configuration:
+    host: str
+    verify_ssl: bool
+    ssl_ca_cert: Optional[str]
+    cert_file: Optional[str]
+    key_file: Optional[str]
+    proxy: Optional[str]
+    @classmethod
+    def get_default_copy(cls) -> "Configuration": ...
+    def auth_settings(self) -> Dict[str, Dict[str, Any]]: ...
 
 
 class CustomObjectsApi:
@@ -1,2 +1,8 @@
+from typing import Optional
+
+
 class ApiException(Exception):
+    def __init__(self, status: Optional[int] = None, reason: Optional[str] = None) -> None: ...
+    status: Optional[int]
+    reason: Optional[str]
     body: str
@@ -0,0 +1,204 @@
+import asyncio
+from typing import Any, Dict, Optional, cast
+
+import pytest
+from attr import attrib, attrs
+
+from appgate.appgate import (
+    get_current_appgate_state,
+    get_events_batch,
+    stale_cached_entity_types,
+)
+from appgate.client import AppgateClient
+from appgate.openapi.types import AppgateException
+from appgate.types import (
+    AppgateEventSuccess,
+    AppgateEventError,
+    Context,
+    EntitiesVersion,
+)
+from tests.utils import load_test_open_api_spec
+
+
+@attrs(frozen=True)
+class Entity:
+    name: str = attrib()
+    value: int = attrib(default=0)
+
+
+def test_get_events_batch_coalesce():
+    async def run():
+        queue = asyncio.Queue()
+        for op, name, value in [
+            ("ADDED", "e1", 1),
+            ("MODIFIED", "e2", 1),
+            ("MODIFIED", "e1", 2),
+            ("DELETED", "e2", 1),
+            ("MODIFIED", "e1", 3),
+        ]:
+            queue.put_nowait(AppgateEventSuccess(op=op, entity=Entity(name, value)))
+        queue.put_nowait(AppgateEventError(name="e3", kind="Entity", error="error"))
+        return await get_events_batch(queue, quiet_period=0.01, max_latency=1)
+
+    events_batch = asyncio.run(run())
+    assert events_batch.received == 6
+    assert events_batch.coalesced == 3
+    assert [(e.op, e.entity) for e in events_batch.events.values()] == [
+        ("DELETED", Entity("e2", 1)),
+        ("MODIFIED", Entity("e1", 3)),
+    ]
+    assert [e.name for e in events_batch.errors] == ["e3"]
+
+
+def test_get_events_batch_max_latency():
+    async def producer(queue):
+        for i in range(100):
+            queue.put_nowait(AppgateEventSuccess(op="ADDED", entity=Entity(f"e{i}")))
+            await asyncio.sleep(0.01)
+
+    async def run():
+        queue = asyncio.Queue()
+        task = asyncio.create_task(producer(queue))
+        events_batch = await get_events_batch(queue, quiet_period=0.1, max_latency=0.2)
+        task.cancel()
+        return events_batch
+
+    events_batch = asyncio.run(run())
+    # Events keep arriving before the quiet period ends but the batch is
+    # closed once max_latency expires
+    assert 0 < events_batch.received < 100
+    assert 0.2 <= events_batch.latency < 0.5
+
+
+def test_get_events_batch_quiet_period():
+    async def run():
+        return await get_events_batch(asyncio.Queue(), quiet_period=0.01, max_latency=1)
+
+    events_batch = asyncio.run(run())
+    assert events_batch.received == 0
+    assert events_batch.events == {}
+
+
+class FakeEntityClient:
+    def __init__(self, name: str, latest: Any = (0, None)) -> None:
+        self.name = name
+        self.latest = latest
+        self.magic_entities = None
+        self.reads = 0
+
+    async def get_latest(self) -> Any:
+        if isinstance(self.latest, Exception):
+            raise self.latest
+        return self.latest
+
+    async def get_if_changed(self, version: Optional[EntitiesVersion] = None) -> Any:
+        self.reads += 1
+        return [], EntitiesVersion(checksum=self.name)
+
+
+class FakeAppgateClient:
+    authenticated = True
+
+    def __init__(self, clients: Dict[str, Any]) -> None:
+        self.clients = clients
+
+    def entity_client(self, entity, api_path, singleton, magic_entities):
+        return self.clients[entity.__name__]
+
+
+def fake_controller(client_cls=FakeEntityClient):
+    api_spec = load_test_open_api_spec(reload=True)
+    ctx = Context(
+        namespace="ns",
+        user="user",
+        password="password",
+        provider="local",
+        controller="controller",
+        two_way_sync=True,
+        timeout=1,
+        dry_run_mode=False,
+        cleanup_mode=False,
+        api_spec=api_spec,
+        metadata_configmap="cm",
+        parallelism=2,
+    )
+    clients = {k: client_cls(k) for k, v in api_spec.entities.items() if v.api_path}
+    return ctx, clients, cast(AppgateClient, FakeAppgateClient(clients))
+
+
+def test_get_current_appgate_state_entity_types():
+    ctx, clients, appgate_client = fake_controller()
+    name = next(iter(clients))
+
+    async def run():
+        state = await get_current_appgate_state(ctx, appgate_client=appgate_client)
+        for c in clients.values():
+            c.reads = 0
+        new_state = await get_current_appgate_state(
+            ctx,
+            previous_state=state,
+            appgate_client=appgate_client,
+            entity_types={name},
+        )
+        return state, new_state
+
+    state, new_state = asyncio.run(run())
+    # Only the entity types given are read, the rest are the previous ones
+    assert {k for k, c in clients.items() if c.reads} == {name}
+    assert new_state.entities_set.keys() == state.entities_set.keys()
+    assert new_state.versions == state.versions
+
+
+def test_stale_cached_entity_types():
+    ctx, clients, appgate_client = fake_controller()
+    name, other_name = list(clients)[:2]
+    clients[name].latest = None
+    clients[other_name].latest = AppgateException("orderBy not supported")
+
+    async def run():
+        state = await get_current_appgate_state(ctx, appgate_client=appgate_client)
+        return await stale_cached_entity_types(ctx, state, appgate_client)
+
+    # Entities that can not be validated with the latest updated one are stale
+    assert asyncio.run(run()) == {name, other_name}
+
+
+def test_get_current_appgate_state_error():
+    started = asyncio.Event()
+    reading = []
+    cancelled = []
+
+    class BlockedEntityClient(FakeEntityClient):
+        async def get_if_changed(self, version=None):
+            reading.append(self.name)
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(self.name)
+                raise
+
+    class FailingEntityClient(FakeEntityClient):
+        async def get_if_changed(self, version=None):
+            await started.wait()
+            raise AppgateException("Error reading entities")
+
+    ctx, clients, appgate_client = fake_controller(BlockedEntityClient)
+    name = next(iter(clients))
+    clients[name] = FailingEntityClient(name)
+    pending = []
+
+    async def run():
+        try:
+            return await get_current_appgate_state(ctx, appgate_client=appgate_client)
+        finally:
+            pending.extend(asyncio.all_tasks() - {asyncio.current_task()})
+
+    # The error is raised without any partial state and the requests in
+    # flight are cancelled, the rest are never sent
+    with pytest.raises(AppgateException, match="Error reading current state"):
+        asyncio.run(run())
+    assert reading
+    assert cancelled == reading
+    assert len(reading) < len(clients) - 1
+    assert pending == []
@@ -0,0 +1,528 @@
+import asyncio
+import datetime
+import json
+from types import SimpleNamespace
+from typing import Dict, List, Optional, cast
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from kubernetes.client import Configuration, CoreV1Api
+from kubernetes.client.exceptions import ApiException
+
+from appgate.client import (
+    AppgateClient,
+    EntityClient,
+    K8SConfigMapClient,
+    K8SWatchClient,
+)
+from appgate.openapi.types import AppgateException
+
+
+class FakeCoreV1Api:
+    def __init__(self, fail: bool = False) -> None:
+        self.patches: List[Dict[str, Optional[str]]] = []
+        self.fail = fail
+
+    def read_namespaced_config_map(self, name, namespace):
+        return SimpleNamespace(metadata=SimpleNamespace(name=name), data={})
+
+    def patch_namespaced_config_map(self, name, namespace, body):
+        if self.fail:
+            raise ApiException(status=500, reason="Error")
+        self.patches.append(dict(body.data))
+        return SimpleNamespace(metadata=SimpleNamespace(name=name))
+
+
+def configmap_client(v1: FakeCoreV1Api) -> K8SConfigMapClient:
+    client = K8SConfigMapClient(namespace="ns", name="cm", max_batch_size=2)
+    client._v1 = cast(CoreV1Api, v1)
+    return client
+
+
+def test_configmap_client_batch():
+    v1 = FakeCoreV1Api()
+    client = configmap_client(v1)
+
+    async def run() -> None:
+        await client.update_entity_generation("e1", 1)
+        assert len(v1.patches) == 1
+        async with client.batch():
+            await client.update_entity_generation("e2", 3)
+            await client.update_entity_generation("e3", 4)
+            await client.delete_entity_generation("e1")
+            await client.update_entity_generation("e2", 5)
+            # generations are visible before the batch is written
+            assert client.get_entity_generation("e2").generation == 5
+            assert client.get_entity_generation("e1") is None
+            assert len(v1.patches) == 1
+
+    asyncio.run(run())
+    # 3 keys written in chunks of max_batch_size
+    assert len(v1.patches) == 3
+    assert list(v1.patches[1].keys()) == ["entry.e2", "entry.e3"]
+    assert v1.patches[1]["entry.e2"].startswith("5,")
+    assert v1.patches[2] == {"entry.e1": None}
+
+
+def test_configmap_client_batch_written_on_error():
+    v1 = FakeCoreV1Api()
+    client = configmap_client(v1)
+
+    async def run() -> None:
+        async with client.batch():
+            await client.update_entity_generation("e1", 1)
+            raise ValueError("error applying plan")
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+    assert list(v1.patches[0].keys()) == ["entry.e1"]
+
+    v1.fail = True
+
+    async def run_fail() -> None:
+        async with client.batch():
+            await client.update_entity_generation("e2", 1)
+
+    with pytest.raises(AppgateException):
+        asyncio.run(run_fail())
+    # generations not written are restored
+    assert client.get_entity_generation("e2") is None
+    assert client.get_entity_generation("e1").generation == 1
+
+
+def test_configmap_client_batch_write_error_keeps_original_error():
+    v1 = FakeCoreV1Api(fail=True)
+    client = configmap_client(v1)
+
+    async def run() -> None:
+        await client.init()
+        async with client.batch():
+            await client.update_entity_generation("e1", 1)
+            raise ValueError("error applying plan")
+
+    with pytest.raises(ValueError, match="error applying plan"):
+        asyncio.run(run())
+    assert client.get_entity_generation("e1") is None
+
+
+def test_configmap_client_batch_partial_write_error():
+    v1 = FakeCoreV1Api()
+    client = configmap_client(v1)
+
+    async def run() -> None:
+        await client.update_entity_generation("e1", 1)
+        await client.update_entity_generation("e2", 1)
+        patch = v1.patch_namespaced_config_map
+
+        def fail_after_first_chunk(name, namespace, body):
+            if len(v1.patches) == 3:
+                raise ApiException(status=500, reason="Error")
+            return patch(name, namespace, body)
+
+        v1.patch_namespaced_config_map = fail_after_first_chunk
+        async with client.batch():
+            await client.update_entity_generation("e3", 7)
+            await client.update_entity_generation("e4", 7)
+            await client.update_entity_generation("e1", 7)
+            await client.delete_entity_generation("e2")
+
+    with pytest.raises(AppgateException):
+        asyncio.run(run())
+    # The first chunk was written, the second one is restored
+    assert client.get_entity_generation("e3").generation == 7
+    assert client.get_entity_generation("e4").generation == 7
+    assert client.get_entity_generation("e1").generation == 1
+    assert client.get_entity_generation("e2").generation == 1
+
+
+def watch_event(
+    type_: str, name: str, resource_version: str, spec: Optional[dict] = None
+) -> bytes:
+    obj = {
+        "kind": "Entity",
+        "metadata": {"name": name, "resourceVersion": resource_version},
+        "spec": spec or {"name": name},
+    }
+    return json.dumps({"type": type_, "object": obj}).encode() + b"\n"
+
+
+async def run_watch_server(responses, requests, f):
+    """
+    Serves the responses in order and calls f with a K8SWatchClient
+    """
+
+    async def handler(request):
+        requests.append(dict(request.query))
+        status, chunks = responses.pop(0)
+        response = web.StreamResponse(status=status)
+        await response.prepare(request)
+        for chunk in chunks:
+            await response.write(chunk)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/apis/{group}/{version}/namespaces/{ns}/{plural}", handler)
+    async with TestServer(app) as server:
+        configuration = Configuration()
+        configuration.host = str(server.make_url("")).rstrip("/")
+        async with K8SWatchClient(configuration) as client:
+            return await f(client)
+
+
+def watch(n):
+    async def f(client):
+        events = []
+        async for event in client.watch("g", "v1", "ns", "entities"):
+            events.append(
+                (
+                    event["type"],
+                    event["object"]["metadata"]["name"],
+                    event["object"]["spec"],
+                )
+            )
+            if len(events) == n:
+                break
+        return events
+
+    return f
+
+
+def test_k8s_watch_client_resume():
+    e1 = watch_event("ADDED", "e1", "1")
+    e2 = watch_event("ADDED", "e2", "2")
+    bookmark = json.dumps(
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "5"}}}
+    ).encode()
+    responses = [
+        # Events split in several chunks
+        (200, [e1[:10], e1[10:] + e2[:5], e2[5:], bookmark]),
+        # Replayed events with the same spec are not yielded
+        (200, [watch_event("ADDED", "e1", "6")]),
+        (200, [watch_event("MODIFIED", "e1", "7", {"name": "e1", "v": 1})]),
+    ]
+    requests = []
+    events = asyncio.run(run_watch_server(responses, requests, watch(3)))
+    assert events == [
+        ("ADDED", "e1", {"name": "e1"}),
+        ("ADDED", "e2", {"name": "e2"}),
+        ("MODIFIED", "e1", {"name": "e1", "v": 1}),
+    ]
+    # Resumes from the last resource version seen
+    assert requests == [
+        {"watch": "true", "allowWatchBookmarks": "true"},
+        {"watch": "true", "allowWatchBookmarks": "true", "resourceVersion": "5"},
+        {"watch": "true", "allowWatchBookmarks": "true", "resourceVersion": "6"},
+    ]
+
+
+def test_k8s_watch_client_expired():
+    gone = json.dumps(
+        {"type": "ERROR", "object": {"code": 410, "reason": "Gone", "message": "old"}}
+    ).encode()
+
+    def item(name, spec):
+        return {"metadata": {"name": name, "resourceVersion": "9"}, "spec": spec}
+
+    entities_list = json.dumps(
+        {
+            "kind": "EntityList",
+            "metadata": {"resourceVersion": "10"},
+            "items": [
+                item("e1", {"name": "e1"}),
+                item("e2", {"name": "e2", "v": 1}),
+                item("e4", {"name": "e4"}),
+            ],
+        }
+    ).encode()
+    responses = [
+        (
+            200,
+            [
+                watch_event("ADDED", "e1", "1"),
+                watch_event("ADDED", "e2", "2"),
+                watch_event("ADDED", "e3", "3"),
+                gone,
+            ],
+        ),
+        (200, [entities_list]),
+        (410, []),
+        (200, [entities_list]),
+        (200, [watch_event("DELETED", "e4", "11")]),
+    ]
+    requests = []
+    events = asyncio.run(run_watch_server(responses, requests, watch(7)))
+    # Only the changes since the watch expired are yielded
+    assert events[3:] == [
+        ("MODIFIED", "e2", {"name": "e2", "v": 1}),
+        ("ADDED", "e4", {"name": "e4"}),
+        ("DELETED", "e3", {"name": "e3"}),
+        ("DELETED", "e4", {"name": "e4"}),
+    ]
+    assert requests[1] == {}
+    assert requests[2] == {
+        "watch": "true",
+        "allowWatchBookmarks": "true",
+        "resourceVersion": "10",
+    }
+    assert requests[3] == {}
+    assert requests[4]["resourceVersion"] == "10"
+
+
+def test_k8s_watch_client_errors():
+    requests = []
+    error = json.dumps(
+        {"type": "ERROR", "object": {"code": 500, "reason": "Error", "message": ""}}
+    ).encode()
+    with pytest.raises(ApiException) as e:
+        asyncio.run(run_watch_server([(200, [error])], requests, watch(1)))
+    assert e.value.status == 500
+
+    with pytest.raises(ApiException) as e:
+        asyncio.run(run_watch_server([(403, [b"forbidden"])], requests, watch(1)))
+    assert e.value.status == 403
+    assert e.value.body == "forbidden"
+
+
+async def run_appgate_server(responses, requests, f):
+    """
+    Serves the responses in order and calls f with an AppgateClient
+    """
+
+    async def handler(request):
+        requests.append(request.headers.get("If-None-Match"))
+        status, headers, body = responses.pop(0)
+        return web.Response(status=status, headers=headers, body=body)
+
+    app = web.Application()
+    app.router.add_get("/{path:.*}", handler)
+    async with TestServer(app) as server:
+        client = AppgateClient(
+            controller=str(server.make_url("")).rstrip("/"),
+            user="user",
+            password="password",
+            provider="local",
+            version=17,
+            device_id="device-id",
+        )
+        try:
+            return await f(client)
+        finally:
+            await client.close()
+
+
+def test_entity_client_get_if_changed():
+    def body(*names):
+        return json.dumps({"data": [{"id": n, "name": n} for n in names]}).encode()
+
+    responses = [
+        (200, {"ETag": '"v1"'}, body("e1")),
+        # Not modified since the ETag
+        (304, {}, b""),
+        # Same response, the controller does not support ETags
+        (200, {}, body("e1")),
+        (200, {}, body("e1", "e2")),
+    ]
+    requests = []
+
+    async def f(client):
+        entity_client = EntityClient(
+            path="/admin/entities",
+            appgate_client=client,
+            singleton=False,
+            load=lambda d: d["name"],
+            dump=lambda e: {"name": e},
+        )
+        reads = []
+        version = None
+        for _ in range(len(responses)):
+            entities, version = await entity_client.get_if_changed(version)
+            reads.append((entities, version.etag))
+        return reads
+
+    reads = asyncio.run(run_appgate_server(responses, requests, f))
+    assert reads == [
+        (["e1"], '"v1"'),
+        (None, '"v1"'),
+        (None, None),
+        (["e1", "e2"], None),
+    ]
+    assert requests == [None, '"v1"', '"v1"', None]
+
+
+def test_entity_client_pages():
+    names = [f"e{i}" for i in range(5)]
+    requests = []
+    orders = set()
+
+    async def handler(request):
+        requests.append(request.query["range"])
+        orders.add(request.query["orderBy"])
+        start, end = map(int, request.query["range"].split("-"))
+        data = [{"id": n, "name": n} for n in names[start:end]]
+        return web.json_response(
+            {"data": data, "range": f"{start}-{start + len(data)}/{len(names)}"}
+        )
+
+    async def f():
+        app = web.Application()
+        app.router.add_get("/{path:.*}", handler)
+        async with TestServer(app) as server:
+            client = AppgateClient(
+                controller=str(server.make_url("")).rstrip("/"),
+                user="user",
+                password="password",
+                provider="local",
+                version=17,
+                device_id="device-id",
+                page_size=2,
+            )
+            try:
+                entity_client = client.entity_client(
+                    SimpleNamespace, "entities", singleton=False, magic_entities=None
+                )
+                entity_client.load = lambda d: d["name"]
+                pages = [page async for _, page in entity_client.pages()]
+                entities, version = await entity_client.get_if_changed()
+                unchanged, _ = await entity_client.get_if_changed(version)
+                return pages, entities, unchanged
+            finally:
+                await client.close()
+
+    pages, entities, unchanged = asyncio.run(f())
+    assert pages == [["e0", "e1"], ["e2", "e3"], ["e4"]]
+    assert entities == names
+    assert unchanged is None
+    assert requests[:3] == ["0-2", "2-4", "4-6"]
+    assert orders == {"id"}
+
+
+def test_entity_client_pages_range_ignored():
+    names = [f"e{i}" for i in range(5)]
+
+    async def handler(request):
+        # range ignored, always the same full page without total
+        data = [{"id": n, "name": n} for n in names[:2]]
+        return web.json_response({"data": data})
+
+    async def f():
+        app = web.Application()
+        app.router.add_get("/{path:.*}", handler)
+        async with TestServer(app) as server:
+            client = AppgateClient(
+                controller=str(server.make_url("")).rstrip("/"),
+                user="user",
+                password="password",
+                provider="local",
+                version=17,
+                device_id="device-id",
+                page_size=2,
+            )
+            try:
+                entity_client = client.entity_client(
+                    SimpleNamespace, "entities", singleton=False, magic_entities=None
+                )
+                entity_client.load = lambda d: d["name"]
+                return [page async for _, page in entity_client.pages()]
+            finally:
+                await client.close()
+
+    with pytest.raises(AppgateException, match="can not be determined"):
+        asyncio.run(f())
+
+
+def test_entity_client_get_latest():
+    queries = []
+    responses = [
+        {"data": [{"id": "e1", "name": "e1"}], "range": "0-1/5"},
+        {"data": [], "range": "0-0/0"},
+        {"data": [{"id": "e1", "name": "e1"}]},
+    ]
+
+    async def handler(request):
+        queries.append(dict(request.query))
+        return web.json_response(responses.pop(0))
+
+    async def f():
+        app = web.Application()
+        app.router.add_get("/{path:.*}", handler)
+        async with TestServer(app) as server:
+            client = AppgateClient(
+                controller=str(server.make_url("")).rstrip("/"),
+                user="user",
+                password="password",
+                provider="local",
+                version=17,
+                device_id="device-id",
+            )
+            try:
+                entity_client = client.entity_client(
+                    SimpleNamespace, "entities", singleton=False, magic_entities=None
+                )
+                entity_client.load = lambda d: d["name"]
+                return [await entity_client.get_latest() for _ in range(3)]
+            finally:
+                await client.close()
+
+    # Without total the entities can not be validated
+    assert asyncio.run(f()) == [(5, "e1"), (0, None), None]
+    assert queries[0] == {"range": "0-1", "orderBy": "updated", "descending": "true"}
+
+
+def test_appgate_client_token():
+    logins = []
+    valid_tokens = set()
+
+    async def login(request):
+        token = f"token-{len(logins)}"
+        logins.append(token)
+        valid_tokens.add(token)
+        expires = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            hours=1
+        )
+        return web.json_response({"token": token, "expires": expires.isoformat()})
+
+    async def get(request):
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if token not in valid_tokens:
+            return web.Response(status=401, text="invalid token")
+        return web.json_response({"data": []})
+
+    async def rejected(request):
+        return web.Response(status=401, text="invalid token")
+
+    async def f():
+        app = web.Application()
+        app.router.add_post("/admin/login", login)
+        app.router.add_get("/admin/entities", get)
+        app.router.add_get("/admin/rejected", rejected)
+        async with TestServer(app) as server:
+            async with AppgateClient(
+                controller=str(server.make_url("")).rstrip("/"),
+                user="user",
+                password="password",
+                provider="local",
+                version=17,
+                device_id="device-id",
+            ) as client:
+                # The token is reused while it is valid
+                await client.get("admin/entities")
+                await client.get("admin/entities")
+                assert logins == ["token-0"]
+                # Rejected tokens are renewed once for all the requests
+                valid_tokens.clear()
+                await asyncio.gather(*(client.get("admin/entities") for _ in range(4)))
+                assert logins == ["token-0", "token-1"]
+                # Tokens about to expire are renewed before the request
+                client._token_expires = datetime.datetime.now(
+                    datetime.timezone.utc
+                ) + datetime.timedelta(minutes=1)
+                await client.get("admin/entities")
+                assert logins == ["token-0", "token-1", "token-2"]
+                # Requests are retried only once
+                with pytest.raises(AppgateException):
+                    await client.get("admin/rejected")
+                assert len(logins) == 4
+
+    asyncio.run(f())
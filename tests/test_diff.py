@@ -0,0 +1,63 @@
+import difflib
+import json
+
+from appgate.diff import FieldChange, diff_dumps, unified_diff
+
+
+def test_diff_dumps():
+    current = {
+        "name": "policy1",
+        "expression": "return true;",
+        "obj": {"a": 1, "b": [1, 2], "c": {"d": "x"}},
+        "tags": ["t1"],
+    }
+    expected = {
+        "name": "policy1",
+        "expression": "return false;",
+        "obj": {"a": 1, "b": [1, 3], "c": {"d": "x"}, "e": "new"},
+    }
+    assert diff_dumps(current, current) == []
+    changes = diff_dumps(current, expected)
+    assert changes == [
+        FieldChange(
+            path=("expression",),
+            op="change",
+            current="return true;",
+            expected="return false;",
+        ),
+        FieldChange(path=("obj", "b"), op="change", current=[1, 2], expected=[1, 3]),
+        FieldChange(path=("obj", "e"), op="add", expected="new"),
+        FieldChange(path=("tags",), op="remove", current=["t1"]),
+    ]
+    assert [str(c) for c in changes] == ["expression", "obj.b", "obj.e", "tags"]
+
+
+def test_unified_diff():
+    def _difflib_diff(d1, d2):
+        return list(
+            difflib.unified_diff(
+                json.dumps(d1, indent=4).splitlines(keepends=True),
+                json.dumps(d2, indent=4).splitlines(keepends=True),
+                n=1,
+            )
+        )
+
+    d1 = {
+        "name": "entitlement1",
+        "site": "site1",
+        "conditions": ["c1", "c2"],
+        "actions": [{"subtype": "icmp_up", "hosts": ["h1", "h2"]}],
+        "notes": "some notes",
+    }
+    cases = [
+        {**d1, "site": "site2"},
+        {**d1, "conditions": ["c1"]},
+        {**d1, "actions": [{"subtype": "icmp_up", "hosts": ["h1", "h3"]}]},
+        {k: v for k, v in d1.items() if k != "notes"},
+        {**d1, "displayName": "new field"},
+        {},
+    ]
+    assert unified_diff(d1, d1) == []
+    for d2 in cases:
+        assert unified_diff(d1, d2) == _difflib_diff(d1, d2)
+        assert unified_diff(d2, d1) == _difflib_diff(d2, d1)
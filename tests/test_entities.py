@@ -12,9 +12,16 @@ from appgate.attrs import (
     K8S_DUMPER,
     APPGATE_DUMPER,
     DIFF_DUMPER,
+    attrs_types,
+    make_dumper_fields_table,
+    make_loader_fields_table,
 )
 from appgate.openapi.openapi import generate_api_spec, SPEC_DIR
-from appgate.openapi.types import AppgateMetadata, AppgateTypedloadException
+from appgate.openapi.types import (
+    AppgateMetadata,
+    AppgateTypedloadException,
+    PlatformType,
+)
 from tests.utils import (
     load_test_open_api_spec,
     CERTIFICATE_FIELD,
@@ -211,6 +218,54 @@ def test_loader_1():
     )
 
 
+def test_loader_fields_table():
+    entities = load_test_open_api_spec(secrets_key=None, reload=True).entities
+    EntityTest1 = entities["EntityTest1"].cls
+    k8s_table = make_loader_fields_table(EntityTest1, PlatformType.K8S)
+    appgate_table = make_loader_fields_table(EntityTest1, PlatformType.APPGATE)
+    # read only fields are not loaded from k8s, write only from appgate
+    assert "fieldOne" not in k8s_table.fields._fields
+    assert "fieldTwo" in k8s_table.fields._fields
+    assert "fieldOne" in appgate_table.fields._fields
+    assert "fieldTwo" not in appgate_table.fields._fields
+    assert [(f.name, f.dataname) for f in appgate_table.fields_loaders] == [
+        ("fromm", "from")
+    ]
+
+    EntityDep5 = entities["EntityDep5"].cls
+    assert attrs_types(EntityDep5) == {
+        EntityDep5,
+        entities["EntityDep5_Obj1"].cls,
+        entities["EntityDep5_Obj1_Obj2"].cls,
+        AppgateMetadata,
+    }
+
+
+def test_dumper_fields_table():
+    entities = load_test_open_api_spec(secrets_key=None, reload=True).entities
+    EntityTest1 = entities["EntityTest1"].cls
+    k8s_table = make_dumper_fields_table(EntityTest1, PlatformType.K8S)
+    diff_table = make_dumper_fields_table(EntityTest1, PlatformType.DIFF)
+    # read only fields are not dumped, DIFF only dumps the eq fields
+    assert [(f.name, f.dataname) for f in k8s_table.fields_dumpers] == [
+        ("fieldTwo", "fieldTwo"),
+        ("fieldFour", "fieldFour"),
+        ("fromm", "from"),
+        ("_entity_metadata", "_entity_metadata"),
+    ]
+    assert [(f.name, f.dataname) for f in diff_table.fields_dumpers] == [
+        ("fieldFour", "fieldFour"),
+        ("fromm", "from"),
+    ]
+
+    # defaults built from factories are computed once
+    EntityDep6 = entities["EntityDep6"].cls
+    table = make_dumper_fields_table(EntityDep6, PlatformType.APPGATE)
+    defaults = {f.name: f.default for f in table.fields_dumpers}
+    assert defaults["deps4"] == frozenset()
+    assert APPGATE_DUMPER.dump(EntityDep6(name="dep6")) == {"name": "dep6"}
+
+
 def test_loader_2():
     """
     Test that id fields are created if missing
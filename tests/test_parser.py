@@ -0,0 +1,168 @@
+import pytest
+
+from appgate.openapi.openapi import parse_files
+from appgate.openapi.parser import Parser, ParserContext
+from appgate.openapi.types import OpenApiParserException
+from tests.utils import TestSpec, load_test_open_api_spec
+
+CIRCULAR_SPEC = """
+info:
+  version: Appgate Operator 666
+paths:
+  /entity-circular:
+    put:
+      requestBody:
+        content:
+          application/json:
+            schema:
+              $ref: '#/definitions/EntityCircular'
+definitions:
+  EntityCircular:
+    allOf:
+      - type: object
+        properties:
+          name:
+            type: string
+      - type: object
+        properties:
+          child:
+            $ref: '#/definitions/Child'
+  Child:
+    type: object
+    properties:
+      parent:
+        $ref: '#/definitions/Parent'
+  Parent:
+    type: object
+    properties:
+      child:
+        $ref: '#/definitions/Child'
+"""
+
+
+BROKEN_DEPENDENCY_SPEC = """
+info:
+  version: Appgate Operator 666
+paths:
+  /entity-parent:
+    put:
+      requestBody:
+        content:
+          application/json:
+            schema:
+              $ref: '#/definitions/EntityParent'
+  /entity-broken:
+    put:
+      requestBody:
+        content:
+          application/json:
+            schema:
+              $ref: '#/definitions/EntityBroken'
+definitions:
+  EntityParent:
+    type: object
+    properties:
+      id:
+        type: string
+      name:
+        type: string
+      broken:
+        type: string
+        x-uuid-ref: EntityBroken
+  EntityBroken:
+    allOf:
+      - type: object
+        properties:
+          child:
+            $ref: '#/definitions/Loop'
+  Loop:
+    type: object
+    properties:
+      loop:
+        $ref: '#/definitions/Loop'
+"""
+
+
+def test_lazy_entities():
+    api_spec = load_test_open_api_spec(reload=True)
+    assert "EntityDep4" in api_spec.entities
+    assert api_spec.parse_profile == {}
+    # EntityDep4 depends on EntityDep1 and EntityDep2
+    assert api_spec.entities["EntityDep4"].api_path == "/entity-dep-4"
+    assert set(api_spec.parse_profile) == {"EntityDep1", "EntityDep2", "EntityDep4"}
+    assert "EntityDep6" not in api_spec.entities.entities
+    assert set(api_spec.api_entities) == set(TestSpec.values())
+    assert set(api_spec.parse_profile) == set(TestSpec.values())
+
+
+def test_parse_profile():
+    api_spec = load_test_open_api_spec(reload=True)
+    assert set(api_spec.api_entities) == set(TestSpec.values())
+    profile = api_spec.parse_profile["EntityTest1"]
+    assert profile.seconds > 0
+    assert profile.references > 0
+    # EntityTestList is shared by all the entities, only resolved for the first one
+    assert (
+        sum(p.cached_references for p in api_spec.parse_profile.values())
+        >= len(TestSpec) - 1
+    )
+
+
+def test_circular_reference(tmp_path):
+    (tmp_path / "circular.yaml").write_text(CIRCULAR_SPEC)
+    api_spec = parse_files(
+        spec_entities={"/entity-circular": "EntityCircular"},
+        spec_directory=tmp_path,
+        spec_file="circular.yaml",
+    )
+    # The error is raised every time the entity is accessed
+    for _ in range(2):
+        with pytest.raises(OpenApiParserException) as e:
+            api_spec.entities["EntityCircular"]
+        assert str(e.value) == (
+            "Circular reference: circular.yaml#definitions/Child"
+            " -> circular.yaml#definitions/Parent -> circular.yaml#definitions/Child"
+        )
+    assert "EntityCircular" in api_spec.entities
+    assert api_spec.parse_profile == {}
+
+
+def test_previous_namespace_reference_not_cached(tmp_path):
+    (tmp_path / "main.yaml").write_text("definitions: {}\n")
+    for namespace in ("a", "b"):
+        (tmp_path / f"{namespace}.yaml").write_text(
+            f"definitions:\n  Shared:\n    type: object\n    description: {namespace}\n"
+        )
+    parser_context = ParserContext(
+        spec_entities={},
+        spec_api_path=tmp_path,
+        secrets_key=None,
+        k8s_get_secret=None,
+    )
+    # Shared is not in main.yaml, each parser finds it in its previous namespace
+    descriptions = []
+    for namespace in ("a.yaml", "b.yaml"):
+        parser = Parser(parser_context, namespace="main.yaml")
+        parser.previous_namespaces.add(namespace)
+        descriptions.append(
+            parser.resolve_reference_definition("#/definitions/Shared")["description"]
+        )
+    assert descriptions == ["a", "b"]
+    assert parser_context.definitions == {}
+
+
+def test_broken_dependency(tmp_path):
+    (tmp_path / "broken.yaml").write_text(BROKEN_DEPENDENCY_SPEC)
+    api_spec = parse_files(
+        spec_entities={
+            "/entity-parent": "EntityParent",
+            "/entity-broken": "EntityBroken",
+        },
+        spec_directory=tmp_path,
+        spec_file="broken.yaml",
+    )
+    # The entity is not returned until its dependencies are generated
+    for name in ("EntityParent", "EntityParent", "EntityBroken"):
+        with pytest.raises(OpenApiParserException, match="Circular reference"):
+            api_spec.entities[name]
+    assert set(api_spec.parse_profile) == {"EntityParent"}
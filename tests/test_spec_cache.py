@@ -0,0 +1,69 @@
+import shutil
+from pathlib import Path
+
+from appgate.__main__ import SPEC_CACHE_ENV, get_spec_cache
+from appgate.openapi import spec_cache
+from appgate.openapi.openapi import parse_files
+from appgate.openapi.spec_cache import load_spec_data, spec_checksum
+from tests.utils import TestSpec
+
+
+def test_spec_cache(tmp_path, monkeypatch):
+    spec_directory = tmp_path / "spec"
+    spec_directory.mkdir()
+    shutil.copy("tests/resources/test_entity.yaml", spec_directory)
+    cache = tmp_path / "spec-cache.pickle"
+    checksum = spec_checksum(spec_directory)
+    data = load_spec_data(spec_directory, cache)
+    assert cache.exists()
+    assert list(data) == ["test_entity.yaml"]
+
+    # The cache is used while the spec files do not change
+    safe_load = spec_cache.safe_load
+    monkeypatch.setattr(spec_cache, "safe_load", None)
+    assert load_spec_data(spec_directory, cache) == data
+    api_spec = parse_files(
+        spec_entities=TestSpec,
+        spec_directory=spec_directory,
+        spec_file="test_entity.yaml",
+        spec_cache=cache,
+    )
+    assert set(TestSpec.values()) <= set(api_spec.entities)
+    # The parser modifies the parsed files, not the cached ones
+    assert load_spec_data(spec_directory, cache) == data
+
+    # Changes in the spec files invalidate the cache
+    monkeypatch.setattr(spec_cache, "safe_load", safe_load)
+    with (spec_directory / "test_entity.yaml").open("a") as f:
+        f.write("x-changed: true\n")
+    assert spec_checksum(spec_directory) != checksum
+    assert load_spec_data(spec_directory, cache)["test_entity.yaml"]["x-changed"]
+
+    cache.write_bytes(b"not a pickle")
+    assert load_spec_data(spec_directory, cache) == {
+        "test_entity.yaml": {**data["test_entity.yaml"], "x-changed": True}
+    }
+
+
+def test_spec_cache_unwritable(tmp_path, caplog):
+    spec_directory = tmp_path / "spec"
+    spec_directory.mkdir()
+    shutil.copy("tests/resources/test_entity.yaml", spec_directory)
+    cache = tmp_path / "missing" / "spec-cache.pickle"
+    # The spec files are parsed as usual, only a warning is logged
+    data = load_spec_data(spec_directory, cache)
+    assert list(data) == ["test_entity.yaml"]
+    assert not cache.parent.exists()
+    assert "Unable to save spec cache" in caplog.text
+
+
+def test_get_spec_cache(monkeypatch):
+    monkeypatch.delenv(SPEC_CACHE_ENV, raising=False)
+    # Only the operator uses a cache by default
+    assert get_spec_cache("spec") is None
+    assert get_spec_cache("spec", default=True) == Path("spec/.spec-cache.pickle")
+    monkeypatch.setenv(SPEC_CACHE_ENV, "/tmp/spec.pickle")
+    assert get_spec_cache("spec") == Path("/tmp/spec.pickle")
+    assert get_spec_cache("spec", default=True) == Path("/tmp/spec.pickle")
+    monkeypatch.setenv(SPEC_CACHE_ENV, "")
+    assert get_spec_cache("spec", default=True) is None
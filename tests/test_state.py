@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import pytest
 
 from appgate.attrs import K8S_LOADER, APPGATE_LOADER
@@ -9,6 +12,11 @@ from appgate.state import (
     resolve_appgate_state,
     compute_diff,
     exclude_appgate_entities,
+    AppgatePlan,
+    Plan,
+    appgate_plan_apply,
+    plan_apply,
+    create_appgate_plan,
 )
 from appgate.types import (
     EntityWrapper,
@@ -1590,6 +1598,10 @@ def test_compare_plan_entity_bytes():
             " }",
         ]
     }
+    assert [str(c) for c in plan.modifications_changes["entity1"]] == [
+        "fieldTwo",
+        "fieldThree",
+    ]
 
 
 PEM2 = """
@@ -1806,3 +1818,366 @@ def test_discriminator_entities_updated():
         '+    "discriminatorOneFieldTwo": "bye"\n',
         " }",
     ]
+
+
+def test_entities_sorted_waves():
+    api = load_test_open_api_spec()
+    waves = api.entities_sorted_waves
+    assert waves[1:] == [
+        ["EntityDep3", "EntityDep4", "EntityDep5", "EntityDepNested7"],
+        ["EntityDep6"],
+    ]
+    assert {"EntityDep1", "EntityDep2", "EntityTest1"}.issubset(waves[0])
+    assert sorted(e for w in waves for e in w) == sorted(api.entities_sorted)
+
+
+def test_entity_wrapper_fingerprint():
+    api = load_test_open_api_spec()
+    EntityDep1 = api.entities["EntityDep1"].cls
+    e1 = EntityWrapper(EntityDep1(id="d11", name="dep11"))
+    e2 = EntityWrapper(EntityDep1(id="d11", name="dep11"))
+    e3 = EntityWrapper(EntityDep1(id="d11", name="dep12"))
+    assert e1.fingerprint == e2.fingerprint == hash(e1)
+    assert e1.fingerprint != e3.fingerprint
+    assert e1 == e2
+    assert e1 != e3
+    assert e1 == EntityWrapper(e1.value)
+
+    current = EntitiesSet({e1, EntityWrapper(EntityDep1(id="d13", name="dep13"))})
+    expected = EntitiesSet({e2, e3})
+    # EntityDep1 has no tags
+    plan = compare_entities(current, expected, frozenset(), None)
+    assert plan.share.entities == {e2}
+    assert plan.create.entities == {e3}
+    assert plan.not_to_modify.entities == {e2, e3}
+    assert plan.modify.entities == set()
+    assert {e.name for e in plan.delete.entities} == {"dep13"}
+    assert {e.name for e in plan.not_to_delete.entities} == {"dep11"}
+
+
+def test_entities_set_indexes():
+    api = load_test_open_api_spec()
+    EntityDep1 = api.entities["EntityDep1"].cls
+
+    def assert_consistent(entities: EntitiesSet) -> None:
+        assert set(entities.entities_by_name.values()) == entities.entities
+        assert set(entities.entities_by_id.values()) == entities.entities
+        assert all(entities.entities_by_id[e.id] is e for e in entities.entities)
+
+    entities = EntitiesSet(
+        {
+            EntityWrapper(EntityDep1(id="d11", name="dep11")),
+            EntityWrapper(EntityDep1(id="d12", name="dep12")),
+        }
+    )
+    assert len(entities) == 2
+    assert_consistent(entities)
+    # modify keeps the registered id
+    entities.modify(EntityWrapper(EntityDep1(id="other", name="dep11")))
+    assert entities.entities_by_name["dep11"].id == "d11"
+    assert "other" not in entities.entities_by_id
+    assert len(entities) == 2
+    assert_consistent(entities)
+    # add of a registered name is a modification
+    entities.add(EntityWrapper(EntityDep1(id="other", name="dep12")))
+    assert entities.entities_by_name["dep12"].id == "d12"
+    assert_consistent(entities)
+    entities.add(EntityWrapper(EntityDep1(id="d13", name="dep13")))
+    assert len(entities) == 3
+    entities.delete(EntityWrapper(EntityDep1(id="d11", name="dep11")))
+    # delete by id when the name is not registered
+    entities.delete(EntityWrapper(EntityDep1(id="d13", name="renamed")))
+    assert entities.entities_by_name.keys() == {"dep12"}
+    assert_consistent(entities)
+    entities.extend(
+        EntitiesSet(
+            {
+                EntityWrapper(EntityDep1(id="x", name="dep12")),
+                EntityWrapper(EntityDep1(id="d14", name="dep14")),
+            }
+        )
+    )
+    assert {e.id for e in entities.entities} == {"d12", "d14"}
+    assert_consistent(entities)
+
+
+def test_entities_set_snapshot():
+    api = load_test_open_api_spec()
+    EntityDep3 = api.entities["EntityDep3"].cls
+    entities = EntitiesSet(
+        {
+            EntityWrapper(EntityDep3(id="d31", name="dep31")),
+            EntityWrapper(EntityDep3(id="d32", name="dep32")),
+        }
+    )
+    snapshot = entities.snapshot()
+    # Entities are shared
+    assert snapshot.entities_by_name["dep31"] is entities.entities_by_name["dep31"]
+
+    entities.add(EntityWrapper(EntityDep3(id="d33", name="dep33")))
+    entities.delete(EntityWrapper(EntityDep3(id="d31", name="dep31")))
+    assert entities.entities_by_name.keys() == {"dep32", "dep33"}
+    assert snapshot.entities_by_name.keys() == {"dep31", "dep32"}
+    assert snapshot.entities_by_id.keys() == {"d31", "d32"}
+    assert {e.name for e in snapshot.entities} == {"dep31", "dep32"}
+
+    snapshot.modify(
+        EntityWrapper(EntityDep3(id="d32", name="dep32", deps1=frozenset({"x"})))
+    )
+    assert entities.entities_by_name["dep32"].value.deps1 != frozenset({"x"})
+    assert snapshot.entities_by_name["dep32"].value.deps1 == frozenset({"x"})
+
+    # Snapshots of snapshots
+    snapshot2 = snapshot.snapshot()
+    snapshot.delete(EntityWrapper(EntityDep3(id="d32", name="dep32")))
+    assert snapshot2.entities_by_name.keys() == {"dep31", "dep32"}
+    assert snapshot.entities_by_name.keys() == {"dep31"}
+    assert entities.entities_by_name.keys() == {"dep32", "dep33"}
+
+
+def test_appgate_state_snapshot():
+    api = load_test_open_api_spec()
+    EntityDep1 = api.entities["EntityDep1"].cls
+    current_state = AppgateState(
+        entities_set={
+            "EntityDep1": EntitiesSet(
+                {EntityWrapper(EntityDep1(id="d11", name="dep11"))}
+            ),
+        }
+    )
+    expected_state = current_state.snapshot()
+    expected_state.with_entity(
+        EntityWrapper(EntityDep1(name="dep12")), "ADDED", current_state
+    )
+    expected_state.with_entity(
+        EntityWrapper(EntityDep1(name="dep11")), "DELETED", current_state
+    )
+    assert expected_state.entities_set["EntityDep1"].entities_by_name.keys() == {
+        "dep12"
+    }
+    assert current_state.entities_set["EntityDep1"].entities_by_name.keys() == {"dep11"}
+    assert current_state.dirty == set()
+
+
+def test_resolve_appgate_state_known_entities_cache(monkeypatch):
+    api = load_test_open_api_spec()
+    extended = []
+    extend = EntitiesSet.extend
+
+    def counting_extend(self, other):
+        extended.append(other)
+        extend(self, other)
+
+    monkeypatch.setattr(EntitiesSet, "extend", counting_extend)
+    entity_names = [f"EntityDep{i}" for i in range(1, 7)]
+    state = AppgateState({k: EntitiesSet() for k in entity_names})
+    assert resolve_appgate_state(state, state.snapshot(), api) == {}
+    # Known entities are built once per referenced entity type:
+    # EntityDep1, EntityDep2, EntityDep3 and EntityDep4
+    assert len(extended) == 8
+
+
+def test_entities_dependents():
+    api = load_test_open_api_spec()
+    assert api.entities_dependents({"EntityDep3"}) == {"EntityDep3", "EntityDep6"}
+    assert api.entities_dependents({"EntityDep2", "EntityTest1"}) == {
+        "EntityDep2",
+        "EntityDep4",
+        "EntityDep6",
+        "EntityDepNested7",
+        "EntityTest1",
+    }
+    assert api.entities_dependents(set()) == set()
+
+
+def test_incremental_reconcile():
+    api = load_test_open_api_spec()
+    EntityDep1 = api.entities["EntityDep1"].cls
+    EntityDep2 = api.entities["EntityDep2"].cls
+    EntityDep3 = api.entities["EntityDep3"].cls
+
+    def state() -> AppgateState:
+        return AppgateState(
+            entities_set={
+                "EntityDep1": EntitiesSet(
+                    {
+                        EntityWrapper(EntityDep1(id="d11", name="dep11")),
+                        EntityWrapper(EntityDep1(id="d12", name="dep12")),
+                    }
+                ),
+                "EntityDep2": EntitiesSet(
+                    {EntityWrapper(EntityDep2(id="d21", name="dep21"))}
+                ),
+                "EntityDep3": EntitiesSet(
+                    {
+                        EntityWrapper(
+                            EntityDep3(
+                                id="d31", name="dep31", deps1=frozenset({"dep11"})
+                            )
+                        )
+                    }
+                ),
+            }
+        )
+
+    current_state = state()
+    assert resolve_appgate_state(current_state, current_state, api) == {}
+    expected_state = state()
+    assert resolve_appgate_state(expected_state, current_state, api) == {}
+    plan = create_appgate_plan(current_state, expected_state, frozenset(), None, None)
+    assert not plan.needs_apply
+
+    expected_state.with_entity(
+        EntityWrapper(EntityDep1(name="dep11")), "DELETED", current_state
+    )
+    assert expected_state.dirty == {"EntityDep1"}
+    entity_names = api.entities_dependents(expected_state.dirty)
+    deps2 = expected_state.entities_set["EntityDep2"]
+    conflicts = resolve_appgate_state(
+        expected_state, current_state, api, entity_names=entity_names
+    )
+    assert conflicts == {}
+    # Not changed entity types are not resolved
+    assert expected_state.entities_set["EntityDep2"] is deps2
+
+    expected_state.with_entity(
+        EntityWrapper(EntityDep3(name="dep31", deps1=frozenset({"dep12"}))),
+        "MODIFIED",
+        current_state,
+    )
+    assert expected_state.dirty == {"EntityDep1", "EntityDep3"}
+    entity_names = api.entities_dependents(expected_state.dirty)
+    conflicts = resolve_appgate_state(
+        expected_state, current_state, api, entity_names=entity_names
+    )
+    assert conflicts == {}
+    new_plan = create_appgate_plan(
+        current_state,
+        expected_state,
+        frozenset(),
+        None,
+        None,
+        previous_plan=plan,
+        entity_names=entity_names,
+    )
+    # Plans for not changed entity types are reused
+    assert new_plan.entities_plan["EntityDep2"] is plan.entities_plan["EntityDep2"]
+    assert new_plan.entities_plan["EntityDep1"].delete.entities_by_name.keys() == {
+        "dep11"
+    }
+    assert new_plan.entities_plan["EntityDep3"].modify.entities_by_name.keys() == {
+        "dep31"
+    }
+
+
+class RecordingEntityClient:
+    def __init__(self, calls, fail_on=None):
+        self.calls = calls
+        self.fail_on = fail_on
+
+    async def _call(self, op, name):
+        await asyncio.sleep(0)
+        if name == self.fail_on:
+            raise AppgateException(f"Error {op} {name}")
+        self.calls.append((op, name))
+
+    async def post(self, entity):
+        await self._call("post", entity.name)
+
+    async def put(self, entity):
+        await self._call("put", entity.name)
+
+    async def delete(self, id):
+        await self._call("delete", id)
+
+
+class FakeConfigMapClient:
+    async def update_entity_generation(self, key, generation):
+        return None
+
+    async def delete_entity_generation(self, key):
+        return None
+
+    @asynccontextmanager
+    async def batch(self):
+        yield self
+
+
+def test_appgate_plan_apply_waves():
+    api = load_test_open_api_spec()
+    EntityDep1 = api.entities["EntityDep1"].cls
+    EntityDep3 = api.entities["EntityDep3"].cls
+    EntityDep6 = api.entities["EntityDep6"].cls
+    appgate_plan = AppgatePlan(
+        entities_plan={
+            "EntityDep1": Plan(
+                create=EntitiesSet(
+                    {
+                        EntityWrapper(EntityDep1(id="d11", name="dep11")),
+                        EntityWrapper(EntityDep1(id="d12", name="dep12")),
+                    }
+                ),
+                delete=EntitiesSet({EntityWrapper(EntityDep1(id="d13", name="dep13"))}),
+            ),
+            "EntityDep3": Plan(
+                modify=EntitiesSet(
+                    {
+                        EntityWrapper(
+                            EntityDep3(id="d31", name="dep31", deps1=frozenset({"d11"}))
+                        )
+                    }
+                ),
+                delete=EntitiesSet({EntityWrapper(EntityDep3(id="d32", name="dep32"))}),
+            ),
+            "EntityDep6": Plan(
+                delete=EntitiesSet({EntityWrapper(EntityDep6(id="d61", name="dep61"))}),
+            ),
+        }
+    )
+    calls = []
+    new_plan = asyncio.run(
+        appgate_plan_apply(
+            appgate_plan=appgate_plan,
+            namespace="test",
+            entity_clients={
+                k: RecordingEntityClient(calls, fail_on="dep12")
+                for k in appgate_plan.entities_plan
+            },
+            k8s_configmap_client=FakeConfigMapClient(),
+            api_spec=api,
+            parallelism=4,
+        )
+    )
+    # Creations and modifications in dependency order
+    assert calls.index(("post", "dep11")) < calls.index(("put", "dep31"))
+    # Deletions after that in reverse dependency order
+    assert calls[-3:] == [("delete", "d61"), ("delete", "d32"), ("delete", "d13")]
+    assert new_plan.errors == ["dep12 [d12]: Error post dep12"]
+    assert new_plan.entities_plan["EntityDep3"].errors is None
+
+
+def test_plan_lazy_diffs(caplog):
+    api = load_test_open_api_spec()
+    EntityDep3 = api.entities["EntityDep3"].cls
+    current = EntitiesSet({EntityWrapper(EntityDep3(id="d31", name="dep31"))})
+    expected = EntitiesSet(
+        {EntityWrapper(EntityDep3(id="d31", name="dep31", deps1=frozenset({"d11"})))}
+    )
+    # EntityDep3 has no tags
+    plan = compare_entities(current, expected, frozenset(), None)
+    assert {e.name for e in plan.modify.entities} == {"dep31"}
+    assert set(plan.modifications) == {"dep31"}
+    # diffs are not computed until they are requested
+    asyncio.run(plan_apply(plan, "test", FakeConfigMapClient(), diff_mode="off"))
+    assert "dep31" not in plan._modifications_dumps
+    assert "DIFF for dep31" not in caplog.text
+
+    asyncio.run(plan_apply(plan, "test", FakeConfigMapClient(), diff_mode="summary"))
+    assert "CHANGED for dep31: deps1" in caplog.text
+    assert "DIFF for dep31" not in caplog.text
+
+    asyncio.run(plan_apply(plan, "test", FakeConfigMapClient()))
+    assert "DIFF for dep31" in caplog.text
+    assert plan.modification_diff("dep31") == plan.modifications_diff["dep31"]
+    assert [str(c) for c in plan.modification_changes("dep31")] == ["deps1"]
+    assert plan.modification_diff("unknown") == []
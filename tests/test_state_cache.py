@@ -0,0 +1,132 @@
+import datetime
+import gzip
+from typing import Optional
+
+from attr import attrib, attrs
+
+from appgate.attrs import CACHE_DUMPER, K8S_LOADER
+from appgate.state import AppgateState, EntitiesSet
+from appgate.state_cache import (
+    cached_entities_current,
+    load_state_cache,
+    save_state_cache,
+    stale_entity_types,
+)
+from appgate.types import EntitiesVersion, EntityWrapper
+from tests.utils import _k8s_get_secret, load_test_open_api_spec
+
+
+def _state(api_spec, entities):
+    return AppgateState(
+        entities_set={
+            k: EntitiesSet(set(entities.get(k, [])))
+            for k, v in api_spec.entities.items()
+            if v.api_path
+        }
+    )
+
+
+def test_cache_dumper():
+    api_spec = load_test_open_api_spec(reload=True, k8s_get_secret=_k8s_get_secret)
+    EntityTest2 = api_spec.entities["EntityTest2"].cls
+    e = K8S_LOADER.load(
+        {
+            "fieldOne": {
+                "type": "k8s/secret",
+                "name": "secret-storage-1",
+                "key": "field-one",
+            },
+            "fieldTwo": "this is write only",
+            "fieldThree": "this is a field",
+        },
+        None,
+        EntityTest2,
+    )
+    # Secrets and write only fields are never stored in the cache
+    assert CACHE_DUMPER.dump(e) == {"fieldThree": "this is a field"}
+    EntityTest1 = api_spec.entities["EntityTest1"].cls
+    assert CACHE_DUMPER.dump(
+        EntityTest1(
+            fieldOne="this is read only",
+            fieldTwo="this is write only",
+            fieldFour="this is a field",
+        )
+    ) == {"fieldOne": "this is read only", "fieldFour": "this is a field"}
+
+
+def test_state_cache(tmp_path):
+    api_spec = load_test_open_api_spec(reload=True)
+    EntityDep1 = api_spec.entities["EntityDep1"].cls
+    state = _state(
+        api_spec,
+        {
+            "EntityDep1": [
+                EntityWrapper(EntityDep1(id="id-1", name="dep1")),
+                EntityWrapper(EntityDep1(id="id-2", name="dep2")),
+            ]
+        },
+    )
+    state.versions["EntityDep1"] = EntitiesVersion(etag='"v1"', checksum="abc")
+    path = tmp_path / "state.json.gz"
+    assert load_state_cache(path, api_spec, "controller") is None
+    save_state_cache(path, state, api_spec, "controller")
+    cached = load_state_cache(path, api_spec, "controller")
+    assert cached is not None
+    assert cached.entities_set.keys() == state.entities_set.keys()
+    for k, v in state.entities_set.items():
+        assert cached.entities_set[k].entities == v.entities
+    assert cached.versions == state.versions
+    assert stale_entity_types(cached, state) == set()
+    assert load_state_cache(path, api_spec, "other-controller") is None
+
+    # Entities changed in the controller since the cache was saved
+    current_state = _state(
+        api_spec,
+        {
+            "EntityDep1": [
+                EntityWrapper(EntityDep1(id="id-1", name="dep1-changed")),
+                EntityWrapper(EntityDep1(id="id-2", name="dep2")),
+            ]
+        },
+    )
+    assert stale_entity_types(cached, current_state) == {"EntityDep1"}
+
+    path.write_bytes(gzip.compress(b"not json"))
+    assert load_state_cache(path, api_spec, "controller") is None
+
+
+@attrs(frozen=True)
+class Entity:
+    id: str = attrib()
+    name: str = attrib()
+    updated: Optional[datetime.datetime] = attrib(default=None)
+
+
+def test_cached_entities_current():
+    t0 = datetime.datetime(2022, 1, 1)
+    t1 = t0 + datetime.timedelta(seconds=1)
+    cached = [
+        EntityWrapper(Entity(id="id-1", name="e1", updated=t0)),
+        EntityWrapper(Entity(id="id-2", name="e2", updated=t1)),
+    ]
+    latest = EntityWrapper(Entity(id="id-2", name="e2", updated=t1))
+    assert cached_entities_current(cached, 2, latest)
+    assert cached_entities_current([], 0, None)
+    # Created or deleted
+    assert not cached_entities_current(cached, 3, latest)
+    assert not cached_entities_current(cached, 1, latest)
+    # Updated
+    t2 = t1 + datetime.timedelta(seconds=1)
+    assert not cached_entities_current(
+        cached, 2, EntityWrapper(Entity(id="id-1", name="e1", updated=t2))
+    )
+    # Deleted and created
+    assert not cached_entities_current(
+        cached, 2, EntityWrapper(Entity(id="id-3", name="e3", updated=t2))
+    )
+    # Without updated timestamps
+    assert not cached_entities_current(
+        [EntityWrapper(Entity(id="id-1", name="e1"))],
+        1,
+        EntityWrapper(Entity(id="id-1", name="e1")),
+    )
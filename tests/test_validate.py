@@ -0,0 +1,94 @@
+import json
+import multiprocessing
+import xml.etree.ElementTree as ET
+
+from appgate.validate import (
+    DocumentValidation,
+    json_summary,
+    junit_summary,
+    validate_files,
+)
+from tests.utils import load_test_open_api_spec
+
+ENTITIES = """apiVersion: beta.appgate.com/v1
+kind: EntityDep1
+metadata:
+  name: dep1
+spec:
+  name: dep1
+---
+apiVersion: beta.appgate.com/v1
+kind: EntityUnknown
+metadata:
+  name: unknown
+spec:
+  name: unknown
+"""
+
+
+def test_validate_files(tmp_path):
+    api_spec = load_test_open_api_spec(reload=True)
+    entities = tmp_path / "entities"
+    entities.mkdir()
+    (entities / "entities.yaml").write_text(ENTITIES)
+    (entities / "invalid.yml").write_text("kind: [")
+    for i in range(10):
+        (tmp_path / f"dep-{i}.yaml").write_text(ENTITIES.replace("dep1", f"dep{i}"))
+    files = [str(entities), str(tmp_path / "missing.yaml")] + [
+        str(tmp_path / f"dep-{i}.yaml") for i in range(10)
+    ]
+
+    results = list(validate_files(api_spec, files))
+    assert [r.file for r in results][:3] == [
+        str(tmp_path / "dep-9.yaml"),
+        str(tmp_path / "dep-8.yaml"),
+        str(tmp_path / "dep-7.yaml"),
+    ]
+    assert results[0].documents[0] == DocumentValidation(kind="EntityDep1", name="dep9")
+    assert str(results[0].documents[0]) == " - EntityDep1::dep9: OK."
+    assert list(results[0].lines()) == [
+        " - EntityDep1::dep9: OK.",
+        " - EntityUnknown::unknown: ERROR: loading entity: "
+        "[api-spec] Not type defined for entity kind EntityUnknown.",
+    ]
+    missing = results[10]
+    assert list(missing.lines()) == [
+        f" - {tmp_path / 'missing.yaml'}: ERROR: file does not exist."
+    ]
+    assert {r.file: r.errors for r in results[11:]} == {
+        str(entities / "entities.yaml"): 1,
+        str(entities / "invalid.yml"): 1,
+    }
+    assert sum(r.errors for r in results) == 13
+
+    # Same results, in the same order, with a pool of processes
+    parallel_results = list(validate_files(api_spec, files, jobs=3))
+    assert [(r.file, r.documents, r.error) for r in parallel_results] == [
+        (r.file, r.documents, r.error) for r in results
+    ]
+
+    summary = json.loads(json_summary(results, 1.5))
+    assert summary["errors"] == 13
+    assert summary["seconds"] == 1.5
+    assert summary["files"][0]["documents"][1]["kind"] == "EntityUnknown"
+    assert all(f["seconds"] >= 0 for f in summary["files"])
+
+    testsuites = ET.fromstring(junit_summary(results, 1.5))
+    assert testsuites.get("failures") == "13"
+    assert testsuites.get("tests") == "24"
+    assert len(testsuites.findall("testsuite")) == 13
+    assert len(testsuites.findall("testsuite/testcase/failure")) == 13
+
+
+def test_validate_files_without_fork(tmp_path, monkeypatch):
+    api_spec = load_test_open_api_spec(reload=True)
+    (tmp_path / "entities.yaml").write_text(ENTITIES)
+
+    def get_context(method):
+        raise ValueError(f"cannot find context for {method!r}")
+
+    monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    monkeypatch.setattr(multiprocessing, "get_context", get_context)
+    # Validated sequentially in this process
+    results = list(validate_files(api_spec, [str(tmp_path)], jobs=4))
+    assert [r.errors for r in results] == [1]
@@ -0,0 +1,43 @@
+import yaml
+
+import appgate.yaml
+from appgate.openapi.openapi import generate_crd
+from appgate.yaml import safe_dump, safe_load, safe_load_all
+from tests.utils import load_test_open_api_spec
+
+VALUES = [
+    {"kind": "Policy", "spec": {"name": "policy", "tags": ["a", "b"]}},
+    {"spec": {"notes": "x" * 100 + " " + "y" * 100}},
+    {"spec": {"script": "line one\n  line two\n\nline 'three'\n"}},
+    {"spec": {"certificate": "-----BEGIN CERTIFICATE-----\nMIIB\n" * 20}},
+    # Long double quoted scalars are folded differently by libyaml
+    {"spec": {"value": '"quoted"\n\ttab\x07' * 20, "other": "caf\xe9 " * 40}},
+    {"spec": {"keys": {"yes": "no", "null": None, "1e3": 1.5, "~": True}}},
+    [],
+    '"top level"',
+]
+
+
+def test_safe_dump():
+    for value in VALUES:
+        for kwargs in ({}, {"default_flow_style": False}):
+            dumped = safe_dump(value, **kwargs)
+            assert dumped == yaml.safe_dump(value, **kwargs)
+            assert safe_load(dumped) == value
+    assert list(safe_load_all("a: 1\n---\nb: 2\n")) == [{"a": 1}, {"b": 2}]
+
+
+def test_safe_dump_crd(monkeypatch):
+    api_spec = load_test_open_api_spec(reload=True)
+
+    def crds():
+        return [
+            generate_crd(e.cls, {}, "v18")
+            for e in api_spec.entities.values()
+            if e.api_path is not None
+        ]
+
+    libyaml_crds = crds()
+    # Same output with the python emitter
+    monkeypatch.setattr(appgate.yaml, "_CSafeDumper", None)
+    assert crds() == libyaml_crds